@@ -1,17 +1,42 @@
+import builtins
 import importlib
+import importlib.util
 import io
+import os
 import sys
 import json
 import datetime
+import gc
 import inspect
+import time
+import uuid
 from util import call_function, compare_outputs, compare_functions
-from util import argument_signature
-from result import ProgramCrash
-from sanity import compare
+from util import capture_call, OutputCapture, OutputLimitError
+from util import argument_signature, TimeLimit, TimeLimitError
+from util import growth_exponent, copy_inputs, InputSnapshot
+from result import ProgramCrash, OutputLimitExceeded, TimeLimitExceeded
+from result import MemoryLimitExceeded
+from result import CorrectResult, ReturnValueDiscrepancy
+from result import PerformanceDiscrepancy, Counterexample
+from generate import Tuples, generate, shrink
+from sanity import fingerprint, compare_summaries
+from pool import WorkerPool, WorkerTimeout
+from metrics import Measurement, new_totals
+from state import JSONState
+import forkserver
 
         
 DATA_FILE = 'data.json'
 
+# A PerformanceTest times calls in samples of at least MIN_SAMPLE_TIME 
+# seconds (judged by the TA's function), but of at most MAX_SAMPLE_CALLS calls.
+MIN_SAMPLE_TIME = 0.005
+MAX_SAMPLE_CALLS = 1000
+
+# How much longer than its time limit the watchdog lets a test run on a 
+# worker process before killing the worker.
+WATCHDOG_GRACE = 1.0
+
 class Autograder:
     """
     An Autograder (formerly called a "session") runs a series of
@@ -19,12 +44,86 @@ class Autograder:
     
     It initializes itself from a persistent JSON file (the DATA_FILE constant) 
     that stores the number of previous attempts and best previous attempt 
-    (among other things).
+    (among other things). Alternatively, pass a state.StateStore as state 
+    (e.g. a state.SQLiteState), along with the student and assignment that 
+    are being graded: the attempt is then counted in the store when the 
+    submission is finalized.
+    
+    By default the TestCases of a submission are run one after another.
+    Passing workers > 1 runs them on a pool of that many processes instead;
+    the log and the score are the same as for the sequential run.
+    
+    Each TestCase can have its own time limits (see create_batch). Passing 
+    a time_limit (in seconds) also limits the wall-clock time that the
+    whole submission may take; once it has run out, the test that was 
+    running fails with a TimeLimitExceeded result.
+    
+    Passing fork = True runs each TestCase in its own forked child process
+    instead (see forkserver.py). The modules under test are imported once,
+    before the first fork, so every test starts from the same freshly
+    imported state, and nothing a test changes (such as the globals of the
+    student's module) carries over to the next. This takes precedence over
+    workers.
+    
+    Given a sandbox.SandboxPool as sandbox, the TestCases run on its 
+    workers instead, under resource limits, so that student code that 
+    exits, crashes or runs out of memory fails its test rather than taking
+    the grader down. The pool can be shared by many Autograders. (fork 
+    takes precedence over sandbox, and sandbox over workers.)
+    
+    Given a transport.Transport as transport, the large inputs of tests
+    that run on a pool (of workers, or a sandbox) reach the workers through
+    memory-mapped files, which each worker reads once, instead of being 
+    sent with every test.
+    
+    Unless echo is False, the final log is also printed to stdout.
+    
+    Passing a file as stream switches to streaming output: instead of being
+    collected into the log, every test and every log message is written to
+    the stream as it happens, one JSON event per line, e.g.
+    
+        {"event": "start", "start_time": "...", "attempts": 1}
+        {"event": "test", "test": "digital_root(1729)", "passed": true}
+        {"event": "external", "message": "Running test: digital_root(1729)"}
+        {"event": "internal", "message": "Checked the interface of ..."}
+    
+    and finalize() writes a closing {"event": "summary", ...} record with the
+    info and the scores (but not the messages, which were already written).
+    
+    With profile = True, the resources used by each test (time, memory and 
+    output, separately for the TA's code and the student's; see metrics.py)
+    are recorded in a "metrics" block of the log, or as "metrics" events when
+    streaming. If a metrics_file is given, they are also appended to it, one
+    JSON record per line.
+    
+    Given a replay.ReplayCache as replay, a submission that has been graded
+    before (with the same tests and settings, and ignoring changes to its 
+    comments and layout) is not run again: the log of its earlier run is 
+    replayed, and scored as usual.
     
     """
     
-    def __init__(self, max_score = 20):
+    def __init__(self, max_score = 20, workers = 1, echo = True,
+                 data_file = DATA_FILE, time_limit = None, fork = False,
+                 stream = None, profile = False, metrics_file = None,
+                 replay = None, state = None, student = None, 
+                 assignment = None, sandbox = None, transport = None):
+        if fork and not forkserver.available():
+            raise ValueError("fork = True needs a platform with os.fork().")
         self.max_score = max_score
+        self.workers = workers
+        self.fork = fork
+        self.sandbox = sandbox
+        self.transport = transport
+        # Tells the sandbox's workers when a new submission starts.
+        self._submission = uuid.uuid4().hex
+        self.stream = stream
+        self.profile = profile or metrics_file is not None
+        self.metrics_file = metrics_file
+        self.echo = echo
+        self.time_limit = time_limit
+        self.replay = replay
+        self._transcript = None
         self.start_time = datetime.datetime.now().strftime(
                 "%A, %d. %B %Y %I:%M:%S%p")
         self.log = {"info":{}, 
@@ -32,28 +131,178 @@ class Autograder:
                     "external_log":[], 
                     "score_sum": None, 
                     "max_score": None}
-        submission_data = DATA_FILE
-        try:
-            with open(submission_data) as data_file: 
-                self.data = json.load(data_file)
-        except FileNotFoundError:
-            self.data = { "attempts": 1, "prevscore": 0, "timedelta": 0 } 
+        if self.profile:
+            self.log["metrics"] = []
+        if state is None:
+            state = JSONState(data_file)
+        self.state = state
+        self.student = student
+        self.assignment = assignment
+        self.data = state.load(student, assignment)
         self.set_max_score(max_score)
+        if self.stream is not None:
+            self._emit({"event": "start", "start_time": self.start_time,
+                        "attempts": self.get_attempts()})
     
     def run(self, tests):  
         """Runs a sequence of TestCases until one fails."""             
+        key = None
+        if self.replay is not None:
+            key = self.replay.submission_key(
+                    tests, {"max_score": self.max_score, 
+                            "time_limit": self.time_limit})
+            record = None if key is None else self.replay.lookup(key)
+            if record is not None:
+                self._replay_record(record)
+                return
+            self._transcript = []
         success = True
-        i = 0
-        while success and i < len(tests):
-            next_test = tests[i]
-            result = next_test.run()
-            self.notify(result, next_test)
-            success = result.passedTest()
-            i += 1
+        replayable = key is not None
+        results = self._results(tests)
+        try:
+            for (next_test, result) in results:
+                self.notify(result, next_test)
+                if not result.replayable:
+                    replayable = False
+                success = result.passedTest()
+                if not success:
+                    break
+        finally:
+            results.close()
+        if replayable:
+            self.replay.store(key, {"transcript": self._transcript, 
+                                    "passed": success})
+        self._transcript = None
         if success:
             self._give_max_credit()
         else:
             self._give_no_credit()
+
+    def _results(self, tests):
+        """
+        Generates (TestCase, TestResult) pairs in the order of the tests.
+        
+        """
+        deadline = None
+        if self.time_limit is not None:
+            deadline = time.time() + self.time_limit
+        for test in tests:
+            test.profile = self.profile
+        if self.fork:
+            for pair in self._forked_results(tests, deadline):
+                yield pair
+        elif self.sandbox is not None:
+            tasks = [(test, deadline, list(sys.path), self._submission) 
+                     for test in self._shared(tests)]
+            for pair in self._pooled_results(self.sandbox, tasks, tests, 
+                                             deadline):
+                yield pair
+        elif self.workers is None or self.workers <= 1 or len(tests) <= 1:
+            for test in tests:
+                (result, test.notes, test.metrics) = _run_test(test, deadline)
+                yield (test, result)
+        else:
+            for pair in self._parallel_results(tests, deadline):
+                yield pair
+
+    def _replay_record(self, record):
+        """Logs and scores a record of an earlier run (see run)."""
+        self.i_log("Replayed the results of an identical earlier submission.")
+        for (kind, message) in record["transcript"]:
+            if kind == "external":
+                self.x_log(message)
+            else:
+                self.i_log(message)
+        if record["passed"]:
+            self._give_max_credit()
+        else:
+            self._give_no_credit()
+
+    def _parallel_results(self, tests, deadline):
+        """
+        Runs the tests on a pool of worker processes, and generates their 
+        results in the order of the tests. Once the consumer stops asking 
+        for results (e.g. because a test failed), the pool is terminated, 
+        which cancels any outstanding work.
+        
+        The tests enforce their own time limits; in case that fails (e.g. 
+        because the student's code caught the TimeLimitError), the pool 
+        kills workers that overrun their limits by more than WATCHDOG_GRACE.
+        
+        """
+        pool = WorkerPool(_run_pooled_test, self.workers)
+        tasks = [(test, deadline) for test in self._shared(tests)]
+        try:
+            for pair in self._pooled_results(pool, tasks, tests, deadline):
+                yield pair
+        finally:
+            pool.terminate()
+
+    def _pooled_results(self, pool, tasks, tests, deadline):
+        """
+        Runs the tasks of the tests on a pool (with a watchdog, as above),
+        and generates the tests' results in order.
+        
+        """
+        timeouts = [None if test.time_limit is None 
+                    else test.time_limit + WATCHDOG_GRACE for test in tests]
+        watchdog_deadline = None
+        if deadline is not None:
+            watchdog_deadline = deadline + WATCHDOG_GRACE
+        replies = pool.imap(tasks, timeouts, watchdog_deadline)
+        try:
+            for (test, reply) in zip(tests, replies):
+                if isinstance(reply, WorkerTimeout):
+                    reply = (_time_limit_exceeded(test, deadline), [], {})
+                elif isinstance(reply, Exception):
+                    # E.g. a WorkerDied.
+                    reply = (ProgramCrash(reply, replayable = False), [], {})
+                (result, test.notes, test.metrics) = reply
+                yield (test, result)
+        finally:
+            replies.close()
+
+    def _shared(self, tests):
+        '''used internally: the tests to send to a pool, via the transport'''
+        if self.transport is None:
+            return tests
+        return [self.transport.share(test) for test in tests]
+
+    def _forked_results(self, tests, deadline):
+        """
+        Runs each test in a forked child of this process, after preparing 
+        all of them here (so that the children share the imported modules),
+        and generates their results in the order of the tests.
+        
+        As on a pool, a child that overruns its limits by more than 
+        WATCHDOG_GRACE is killed.
+        
+        """
+        for test in tests:
+            try:
+                test.prepare()
+            except Exception:
+                # The test reports the problem itself when it runs.
+                pass
+        for test in tests:
+            timeout = None
+            if test.time_limit is not None:
+                timeout = test.time_limit + WATCHDOG_GRACE
+            if deadline is not None:
+                time_left = deadline + WATCHDOG_GRACE - time.time()
+                if timeout is None or time_left < timeout:
+                    timeout = max(time_left, 0)
+            try:
+                reply = forkserver.run_forked(
+                        lambda: _run_test(test, deadline), timeout)
+            except forkserver.ChildTimeout:
+                reply = (_time_limit_exceeded(test, deadline), [], {})
+            except forkserver.ChildDied as e:
+                reply = (ProgramCrash(e, replayable = False), [], {})
+            if isinstance(reply, Exception):
+                reply = (ProgramCrash(reply, replayable = False), [], {})
+            (result, test.notes, test.metrics) = reply
+            yield (test, result)
     
     def _give_max_credit(self):
         self.x_log("CONGRATULATIONS! All the tests passed.")
@@ -68,12 +317,37 @@ class Autograder:
 
     def notify(self, test_result, test):
         """Records a TestResult in the log."""
+        if self.stream is not None:
+            self._emit({"event": "test", 
+                        "test": None if test.is_private() else str(test),
+                        "passed": test_result.passedTest()})
         if test.is_private():
             self.x_log("Running on a hidden test.")
         else:
             self.x_log("Running test: {}".format(str(test)))
         for line in str(test_result).split('\n'):
             self.x_log(line)
+        for warning in test_result.warnings:
+            self.x_log(warning)
+        for note in test.notes:
+            self.i_log(note)
+        if self.profile:
+            self._record_metrics(test)
+
+    def _record_metrics(self, test):
+        '''used internally: records the metrics of a test that has run'''
+        record = {"test": None if test.is_private() else str(test),
+                  "private": test.is_private()}
+        record.update(test.metrics)
+        if self.stream is not None:
+            event = {"event": "metrics"}
+            event.update(record)
+            self._emit(event)
+        else:
+            self.log["metrics"].append(record)
+        if self.metrics_file is not None:
+            with open(self.metrics_file, 'a') as metrics_file:
+                metrics_file.write(json.dumps(record) + "\n")
 
 
     def get_attempts(self):
@@ -107,7 +381,12 @@ class Autograder:
         for external use: logs to the internal portion of the session log, 
         anything logged here is saved to the database for the TA's reference
         '''
-        self.log["internal_log"].append(message)
+        if self._transcript is not None:
+            self._transcript.append(("internal", message))
+        if self.stream is not None:
+            self._emit({"event": "internal", "message": message})
+        else:
+            self.log["internal_log"].append(message)
 
 
     def x_log(self, message):
@@ -115,7 +394,17 @@ class Autograder:
         for external use: logs to the external portion of the session log,
         anything logged here is passed back to the student
         '''
-        self.log["external_log"].append(message)
+        if self._transcript is not None:
+            self._transcript.append(("external", message))
+        if self.stream is not None:
+            self._emit({"event": "external", "message": message})
+        else:
+            self.log["external_log"].append(message)
+
+    def _emit(self, event):
+        '''used internally: writes one event to the stream (see Autograder)'''
+        self.stream.write(json.dumps(event) + "\n")
+        self.stream.flush()
 
     def set_max_score(self, max_score):
         '''sets the max score for the problem'''
@@ -140,6 +429,9 @@ class Autograder:
         self.log["score_sum"] = self._score
         self.log["max_score"] = self._maxscore
         self.end_time = datetime.datetime.now().strftime("%A, %d. %B %Y %I:%M:%S%p")
+        counted = self.state.record(self.student, self.assignment, self._score)
+        if counted is not None:
+            self.data["attempts"] = counted["attempts"]
         self._info("start_time", self.start_time)
         self._info("end_time", self.end_time)
         self._info("timedelta", self.get_timedelta())
@@ -147,8 +439,15 @@ class Autograder:
         self._info("final score", self._score)
         self._info("max score", self._maxscore)
     
-        print(json.dumps(self.log))
-        return json.dumps(self.log)
+        if self.stream is not None:
+            summary = {"event": "summary", "info": self.log["info"],
+                       "score_sum": self._score, "max_score": self._maxscore}
+            self._emit(summary)
+            return json.dumps(summary)
+        result = json.dumps(self.log)
+        if self.echo:
+            print(result)
+        return result
     
         def find_tabs(module):
           #function to check if a module contains tab characters
@@ -162,6 +461,91 @@ class Autograder:
 
 
 
+def _run_test(test, deadline = None):
+    """
+    Runs a single TestCase, and returns its TestResult along with the notes
+    that the test made for the internal log and its metrics (empty unless
+    the test is being profiled).
+    
+    The test is interrupted once it exceeds its own time limits, or once
+    the deadline (a time.time() value for the whole submission, if any) 
+    has passed. A test that runs out of memory gets a MemoryLimitExceeded
+    result.
+    
+    """
+    test.notes = []
+    test.metrics = {}
+    seconds = test.time_limit
+    if deadline is not None:
+        time_left = deadline - time.time()
+        if time_left <= 0:
+            return (_time_limit_exceeded(test, deadline), test.notes, 
+                    test.metrics)
+        if seconds is None or time_left < seconds:
+            seconds = time_left
+    limit = TimeLimit(seconds, test.cpu_limit)
+    result = None
+    start = (time.perf_counter(), time.process_time())
+    try:
+        with limit:
+            result = test.run()
+    except TimeLimitError:
+        pass
+    except MemoryError:
+        result = MemoryLimitExceeded()
+    if (isinstance(result, ProgramCrash) 
+            and isinstance(result.exception, MemoryError)):
+        result = MemoryLimitExceeded()
+    if test.profile:
+        test.metrics["total"] = {"wall": time.perf_counter() - start[0],
+                                 "cpu": time.process_time() - start[1]}
+    if limit.expired is not None:
+        (kind, _) = limit.expired
+        if kind == "CPU":
+            result = TimeLimitExceeded(test.cpu_limit, kind)
+        else:
+            result = _time_limit_exceeded(test, deadline)
+    return (result, test.notes, test.metrics)
+
+
+def _run_pooled_test(task):
+    """
+    Runs a (TestCase, deadline) task for _run_test. This is a module-level 
+    function so that it can be handed to a process pool.
+    
+    """
+    return _run_test(*task)
+
+
+def _time_limit_exceeded(test, deadline):
+    """
+    Returns the TimeLimitExceeded result of a test that ran out of 
+    wall-clock time, either its own or the submission's.
+    
+    """
+    if deadline is not None and time.time() >= deadline:
+        return TimeLimitExceeded(None, "total")
+    return TimeLimitExceeded(test.time_limit)
+
+
+def _limit_time(tests, time_limit, cpu_limit):
+    """Sets the time limits of a batch of tests, and returns the batch."""
+    for test in tests:
+        test.time_limit = time_limit
+        test.cpu_limit = cpu_limit
+    return tests
+
+
+# The compiled code of the scripts of InteractiveTests, keyed by module name,
+# along with the (path, mtime, size) of the source they were compiled from.
+_scripts = {}
+
+
+# The interface checks of FunctionTests, keyed by (TA module name, student
+# module name), so that a batch checks each pair of modules only once.
+_interface_checks = {}
+
+
 class TestCase:    
     """
     A TestCase is an abstract class that represents a single test applied
@@ -174,6 +558,11 @@ class TestCase:
     
     def __init__(self, private):
         self.priv = private
+        self.notes = []
+        self.time_limit = None
+        self.cpu_limit = None
+        self.profile = False
+        self.metrics = {}
         
     def is_private(self):
         return self.priv
@@ -182,10 +571,47 @@ class TestCase:
         """Abstract method. Runs the test case."""        
         raise NotImplementedError("Cannot call .run() on abstract class.")
 
+    def prepare(self):
+        """
+        Does the work that run() would otherwise repeat for every test of a
+        batch (such as importing modules), so that it can be done once, 
+        before the tests are forked (see Autograder). Does nothing by default.
+        
+        """
+        pass
+
     def _import_module(self, name):
         """Imports the specified module by its name."""
         return importlib.import_module(name)
 
+    def _measure(self, side, func, *args):
+        """
+        Calls func(*args), and adds what the call used to the metrics of the
+        side ("ta" or "student") if the test is being profiled.
+        
+        """
+        if not self.profile:
+            return func(*args)
+        with Measurement(self._side_metrics(side)):
+            return func(*args)
+
+    def _count_output(self, side, size):
+        """Adds size characters of output to the metrics of the side."""
+        if self.profile:
+            self._side_metrics(side)["output"] += size
+
+    def _side_metrics(self, side):
+        if side not in self.metrics:
+            self.metrics[side] = new_totals()
+        return self.metrics[side]
+
+    def _note_capture(self, capture):
+        """Notes how much output was captured from the student's code."""
+        self._count_output("student", capture.size)
+        self.notes.append("Captured {} characters of output from {}{}.".format(
+                capture.size, str(self), 
+                " (spilled to disk)" if capture.spilled else ""))
+
 
 class TestCaseWithInput(TestCase):
     """
@@ -196,6 +622,51 @@ class TestCaseWithInput(TestCase):
     def __init__(self, test_input, private):
         TestCase.__init__(self, private)
         self.test_input = test_input
+        self.cache = None
+        self.golden = None
+        self._snapshot = None
+
+    def reference(self):
+        """
+        Abstract method. Returns the result of the TA's code on the test 
+        input (i.e. what the student's code is expected to match).
+        
+        """
+        raise NotImplementedError("Cannot call .reference() on abstract class.")
+
+    def snapshot(self):
+        """
+        Returns the InputSnapshot of the test input, taking it only once.
+        
+        """
+        if self._snapshot is None:
+            self._snapshot = InputSnapshot(self.test_input)
+        return self._snapshot
+
+    def compile(self):
+        """
+        Runs the TA's side of the test, and stores its results in the test
+        itself, so that the test no longer needs the TA's code (see bundle.py).
+        
+        """
+        self.golden = {"result": self.reference()}
+
+    def _ta_result(self, name, compute):
+        """
+        Returns the result of running the TA's code on the test input,
+        which compute() computes. If the test has been compiled, the stored
+        result is used instead; otherwise, if the test has a 
+        cache.ResultCache, the result is looked up there first.
+        
+        """
+        if self.golden is not None:
+            return self.golden["result"]
+        measured = lambda: self._measure("ta", compute)
+        if self.cache is None:
+            return measured()
+        return self.cache.get(self.ta_module_name, 
+                              '{}:{}'.format(type(self).__name__, name),
+                              self.test_input, measured)
    
 
 
@@ -211,30 +682,111 @@ class FunctionTest(TestCaseWithInput):
     >>> digital_root(13)
     4
     
+    By default, return values match if they are equal. A comparator (see
+    comparators.py) can be given instead, e.g. to allow for rounding in 
+    floats, and to report where a large return value went wrong.
+    
     """        
     def __init__(self, ta_module_name, student_module_name, 
-                 function_name, test_input, private):
+                 function_name, test_input, private, cache = None,
+                 comparator = None):
         TestCaseWithInput.__init__(self, test_input, private)
         self.ta_module_name = ta_module_name
         self.student_module_name = student_module_name
         self.function_name = function_name
+        self.cache = cache
+        self.comparator = comparator
            
     def run(self):
         try:
-            ta_module = self._import_module(self.ta_module_name)
-            student_module = self._import_module(self.student_module_name)
+            interface_check = self._check_interface()
         except Exception as e:
             return ProgramCrash(e)
-        sanity_check = compare(ta_module, student_module)
+        sanity_check = interface_check["result"]
         if not sanity_check.passedTest():
             return sanity_check
         try:
-            ta_func = getattr(ta_module, self.function_name)            
-            student_func = getattr(student_module, self.function_name)
+            student_func = self._student_function(interface_check)
         except Exception as e:
             return ProgramCrash(e)
-        return compare_functions(self, ta_func, 
-                                 student_func, self.test_input)
+        the_same = self.comparator or (lambda x, y: x == y)
+        return compare_functions(
+                self, lambda *args: self.reference(), 
+                lambda *args: self._measure("student", student_func, *args),
+                self.test_input, the_same, snapshot = self.snapshot(), 
+                copy_ta_inputs = False)
+
+    def prepare(self):
+        self._check_interface()
+
+    def _check_interface(self):
+        """
+        Imports the student's module and compares its interface with the 
+        TA's. The outcome is computed once for each pair of modules and
+        shared by all the tests of a batch; it is recomputed whenever either
+        module has been reimported (or the TA's interface has changed).
+        
+        """
+        start = time.perf_counter()
+        if self.golden is not None:
+            (ta_module, ta_interface) = (None, self.golden["interface"])
+        else:
+            (ta_module, ta_interface) = (
+                    self._import_module(self.ta_module_name), None)
+        student_module = self._import_module(self.student_module_name)
+        key = (self.ta_module_name, self.student_module_name)
+        check = _interface_checks.get(key)
+        if (check is None 
+                or check["student_module"] is not student_module
+                or check["ta_module"] is not ta_module
+                or (ta_interface is not None 
+                    and check["ta_interface"] != ta_interface)):
+            if ta_interface is None:
+                ta_interface = fingerprint(ta_module)
+            check = {"ta_module": ta_module,
+                     "ta_interface": ta_interface,
+                     "student_module": student_module,
+                     "result": compare_summaries(ta_interface, 
+                                                 fingerprint(student_module)),
+                     "functions": {}}
+            _interface_checks[key] = check
+            temperature = "cold"
+        else:
+            temperature = "warm"
+        self.notes.append("Checked the interface of {} against {} in "
+                          "{:.3f}ms ({}).".format(
+                                  self.student_module_name, 
+                                  self.ta_module_name,
+                                  1000 * (time.perf_counter() - start), 
+                                  temperature))
+        return check
+
+    def _student_function(self, interface_check):
+        """Returns the student's function, resolving it only once per batch."""
+        functions = interface_check["functions"]
+        if self.function_name not in functions:
+            functions[self.function_name] = getattr(
+                    interface_check["student_module"], self.function_name)
+        return functions[self.function_name]
+
+    def reference(self):
+        """Returns the return value of the TA's function on the test input."""
+        def compute():
+            ta_module = self._import_module(self.ta_module_name)
+            ta_func = getattr(ta_module, self.function_name)
+            return ta_func(*self.snapshot().copy())
+        return self._ta_result(self.function_name, compute)
+
+    def compile(self):
+        ta_interface = self._ta_interface()
+        TestCaseWithInput.compile(self)
+        self.golden["interface"] = ta_interface
+
+    def _ta_interface(self):
+        """Returns the summary (see sanity.summarize) of the TA's module."""
+        if self.golden is not None:
+            return self.golden["interface"]
+        return fingerprint(self._import_module(self.ta_module_name))
                 
     def __str__(self):
         return '{}{}'.format(
@@ -244,12 +796,272 @@ class FunctionTest(TestCaseWithInput):
 
     @staticmethod
     def create_batch(ta_module_name, student_module_name, 
-                     function_name, pub_inputs, priv_inputs):
+                     function_name, pub_inputs, priv_inputs, cache = None,
+                     time_limit = None, cpu_limit = None, comparator = None):
         public = [FunctionTest(ta_module_name, student_module_name, 
-                             function_name, inp, private=False) for inp in pub_inputs]
+                             function_name, inp, private=False, cache=cache,
+                             comparator=comparator) 
+                for inp in pub_inputs]
         private = [FunctionTest(ta_module_name, student_module_name, 
-                             function_name, inp, private=True) for inp in priv_inputs]
-        return public + private
+                             function_name, inp, private=True, cache=cache,
+                             comparator=comparator) 
+                for inp in priv_inputs]
+        return _limit_time(public + private, time_limit, cpu_limit)
+            
+
+class PerformanceTest(TestCase):
+    """
+    A PerformanceTest checks that a function is not far slower than the 
+    TA's, e.g. that a two_largest function does not take quadratic time
+    when linear time will do. An example is provided in 
+    examples/performancetest.
+    
+    The inputs are made by a generator function in the TA's module, which 
+    takes a size n and returns a tuple of arguments. Both functions are run
+    on inputs of each size in a ladder of sizes (see ladder), and their 
+    results compared. Then each function is called warmup times, and timed
+    repeats times; the fastest sample is kept, since load from elsewhere 
+    on the machine can only slow a sample down.
+    
+    The test fails with a PerformanceDiscrepancy as soon as the student's 
+    function takes more than max_ratio times as long as the TA's on some
+    size, or if, by the end, the exponent of its growth curve (fitted as
+    time = c * n^k) exceeds the TA's by more than max_exponent_slack.
+    
+    """        
+    def __init__(self, ta_module_name, student_module_name, function_name, 
+                 generator_name, sizes, private, max_ratio = 10.0, 
+                 max_exponent_slack = 0.5, warmup = 1, repeats = 5):
+        TestCase.__init__(self, private)
+        self.ta_module_name = ta_module_name
+        self.student_module_name = student_module_name
+        self.function_name = function_name
+        self.generator_name = generator_name
+        # Timings vary from run to run (see replay.py).
+        self.replayable = False
+        self.sizes = sizes
+        self.max_ratio = max_ratio
+        self.max_exponent_slack = max_exponent_slack
+        self.warmup = warmup
+        self.repeats = repeats
+
+    def run(self):
+        try:
+            ta_module = self._import_module(self.ta_module_name)
+            ta_func = getattr(ta_module, self.function_name)
+            generator = getattr(ta_module, self.generator_name)
+            student_module = self._import_module(self.student_module_name)
+            student_func = getattr(student_module, self.function_name)
+        except Exception as e:
+            return ProgramCrash(e)
+        sizes = []
+        ta_times = []
+        student_times = []
+        for size in self.sizes:
+            try:
+                test_input = generator(size)
+                start = time.perf_counter()
+                ta_result = ta_func(*copy_inputs(test_input))
+                number = PerformanceTest._calls_per_sample(
+                        time.perf_counter() - start)
+                student_result = student_func(*copy_inputs(test_input))
+                if student_result != ta_result:
+                    return ReturnValueDiscrepancy(ta_result, student_result)
+                ta_time = self._sample(ta_func, test_input, number)
+                student_time = self._sample(student_func, test_input, number)
+            except Exception as e:
+                return ProgramCrash(e)
+            sizes.append(size)
+            ta_times.append(ta_time)
+            student_times.append(student_time)
+            ratio = student_time / max(ta_time, 1e-12)
+            self.notes.append("Timed {} on size {}: {:.3g}s (TA: {:.3g}s).".format(
+                    self.function_name, size, student_time, ta_time))
+            if ratio > self.max_ratio:
+                return self._discrepancy(sizes, ta_times, student_times, 
+                                         "constant")
+        return self._discrepancy(sizes, ta_times, student_times, None)
+
+    def _discrepancy(self, sizes, ta_times, student_times, kind):
+        """
+        Returns the verdict on the measurements: a "scaling" discrepancy if 
+        the fitted exponents differ by too much, or else a discrepancy of the
+        given kind (or a CorrectResult, if kind is None).
+        
+        """
+        ratio = student_times[-1] / max(ta_times[-1], 1e-12)
+        if len(sizes) > 1:
+            ta_exponent = growth_exponent(sizes, ta_times)
+            student_exponent = growth_exponent(sizes, student_times)
+            self.notes.append("Fitted growth: n^{:.2f} (TA: n^{:.2f}).".format(
+                    student_exponent, ta_exponent))
+            if student_exponent - ta_exponent > self.max_exponent_slack:
+                return PerformanceDiscrepancy("scaling", sizes[-1], ratio, 
+                                              ta_exponent, student_exponent)
+        if kind is None:
+            return CorrectResult()
+        return PerformanceDiscrepancy(kind, sizes[-1], ratio)
+
+    def _sample(self, func, test_input, number):
+        """
+        Returns the fastest time per call of func on (copies of) the test 
+        input, over repeats samples of number calls each.
+        
+        """
+        for _ in range(self.warmup):
+            func(*copy_inputs(test_input))
+        best = None
+        for _ in range(self.repeats):
+            copies = [copy_inputs(test_input) for _ in range(number)]
+            gc_enabled = gc.isenabled()
+            gc.disable()
+            try:
+                start = time.perf_counter()
+                for args in copies:
+                    func(*args)
+                elapsed = time.perf_counter() - start
+            finally:
+                if gc_enabled:
+                    gc.enable()
+            if best is None or elapsed < best:
+                best = elapsed
+        return best / number
+
+    @staticmethod
+    def _calls_per_sample(call_time):
+        """Returns how many calls taking call_time seconds make a sample."""
+        if call_time <= 0:
+            return MAX_SAMPLE_CALLS
+        return max(1, min(MAX_SAMPLE_CALLS, int(MIN_SAMPLE_TIME / call_time)))
+
+    @staticmethod
+    def ladder(smallest, largest, steps):
+        """
+        Returns steps sizes from smallest to largest, spaced evenly on a 
+        log scale.
+        
+        """
+        if steps <= 1:
+            return [largest]
+        factor = (largest / smallest) ** (1 / (steps - 1))
+        sizes = [int(round(smallest * factor ** i)) for i in range(steps)]
+        return sorted(set(sizes))
+
+    def __str__(self):
+        return '{} on inputs of size {} to {}'.format(
+                self.function_name, self.sizes[0], self.sizes[-1])
+
+    @staticmethod
+    def create_batch(ta_module_name, student_module_name, function_name,
+                     generator_name, sizes, private = False, 
+                     max_ratio = 10.0, max_exponent_slack = 0.5, 
+                     warmup = 1, repeats = 5, time_limit = None, 
+                     cpu_limit = None):
+        test = PerformanceTest(ta_module_name, student_module_name, 
+                               function_name, generator_name, sizes, private,
+                               max_ratio, max_exponent_slack, warmup, repeats)
+        return _limit_time([test], time_limit, cpu_limit)
+            
+
+class PropertyTest(TestCase):
+    """
+    A PropertyTest compares a function with the TA's on many generated 
+    inputs, rather than on a few hand-written ones. The arguments are made
+    by strategies (see generate.py), one for each argument, e.g.
+    
+        PropertyTest.create_batch("ta_digital_root", "digital_root",
+                                  "digital_root", [Integers(0, 10**9)])
+    
+    Inputs are generated (reproducibly, from the seed) and run through the
+    TA's function and then the student's in batches of batch_size, up to 
+    count inputs in all. At the first input on which the results differ 
+    (or the student's function raises an exception), the input is shrunk 
+    to a minimal one that still fails, and the test fails with a 
+    Counterexample. The TA's results are remembered, so shrinking never 
+    runs the TA's function twice on the same input.
+    
+    """        
+    def __init__(self, ta_module_name, student_module_name, function_name, 
+                 strategies, private, count = 1000, seed = 0, 
+                 batch_size = 100):
+        TestCase.__init__(self, private)
+        self.ta_module_name = ta_module_name
+        self.student_module_name = student_module_name
+        self.function_name = function_name
+        self.strategy = Tuples(*strategies)
+        self.count = count
+        self.seed = seed
+        self.batch_size = batch_size
+
+    def run(self):
+        try:
+            ta_module = self._import_module(self.ta_module_name)
+            ta_func = getattr(ta_module, self.function_name)
+            student_module = self._import_module(self.student_module_name)
+            student_func = getattr(student_module, self.function_name)
+        except Exception as e:
+            return ProgramCrash(e)
+        ta_results = {}
+        def expected(args):
+            key = repr(args)
+            if key not in ta_results:
+                ta_results[key] = ta_func(*copy_inputs(args))
+            return ta_results[key]
+        def outcome(args):
+            """Returns (expected, received, failed) for the arguments."""
+            try:
+                ta_result = expected(args)
+            except Exception:
+                # Not a valid input, as far as the TA's code is concerned.
+                return (None, None, False)
+            try:
+                student_result = student_func(*copy_inputs(args))
+            except Exception as e:
+                return (ta_result, "exception: {}".format(e), True)
+            return (ta_result, student_result, student_result != ta_result)
+        inputs = generate(self.strategy, self.count, self.seed)
+        tried = 0
+        while tried < self.count:
+            batch = [args for (_, args) in zip(range(self.batch_size), inputs)]
+            if not batch:
+                break
+            for args in batch:
+                try:
+                    expected(args)
+                except Exception:
+                    pass
+            for args in batch:
+                tried += 1
+                if outcome(args)[2]:
+                    return self._counterexample(args, outcome, tried)
+        self.notes.append("Tried {} on {} generated inputs.".format(
+                self.function_name, tried))
+        return CorrectResult()
+
+    def _counterexample(self, args, outcome, tried):
+        """Shrinks a failing input, and returns its Counterexample."""
+        (smallest, steps) = shrink(self.strategy, args, 
+                                   lambda candidate: outcome(candidate)[2])
+        (ta_result, student_result, _) = outcome(smallest)
+        self.notes.append("Shrank the counterexample {}{} to {}{} in {} steps.".format(
+                self.function_name, argument_signature(args),
+                self.function_name, argument_signature(smallest), steps))
+        return Counterexample('{}{}'.format(self.function_name, 
+                                            argument_signature(smallest)),
+                              ta_result, student_result, tried)
+
+    def __str__(self):
+        return '{} on {} generated inputs'.format(self.function_name, 
+                                                 self.count)
+
+    @staticmethod
+    def create_batch(ta_module_name, student_module_name, function_name,
+                     strategies, count = 1000, seed = 0, private = True,
+                     batch_size = 100, time_limit = None, cpu_limit = None):
+        test = PropertyTest(ta_module_name, student_module_name, 
+                            function_name, strategies, private, count, seed,
+                            batch_size)
+        return _limit_time([test], time_limit, cpu_limit)
             
 
 class FunctionStdoutTest(TestCaseWithInput):
@@ -267,42 +1079,79 @@ class FunctionStdoutTest(TestCaseWithInput):
     2.0 is even, so I take half: 1.0
     The process took 5 steps to reach 1.
     
+    With full_diff, every place where the output differs from the TA's is
+    reported, rather than only the first (see util.compare_outputs).
+    
     """    
     def __init__(self, ta_module_name, student_module_name, 
-                 function_name, test_input, private):        
+                 function_name, test_input, private, cache = None,
+                 full_diff = False):        
         TestCaseWithInput.__init__(self, test_input, private)
         self.ta_module_name = ta_module_name
         self.student_module_name = student_module_name
         self.function_name = function_name
+        self.cache = cache
+        self.full_diff = full_diff
      
     def run(self):
         try:
-            ta_module = self._import_module(self.ta_module_name)
+            ta_output = self.reference()
             student_module = self._import_module(self.student_module_name)
-            ta_func = getattr(ta_module, self.function_name)            
             student_func = getattr(student_module, self.function_name)
         except Exception as e:
             return ProgramCrash(e)
-        (_, student_output) = call_function(student_func, self.test_input)  
-        (_, ta_output) = call_function(ta_func, self.test_input)
-        if student_output == None:
-            return ProgramCrash("An error occurred running {}".format(str(self)))
-        else:            
-            ignore_whitespace_cmp = lambda x, y: ' '.join(x.split()) == ' '.join(y.split())
-            return compare_outputs(student_output, ta_output, 
-                                   ignore_whitespace_cmp)
+        capture = OutputCapture()
+        try:
+            (_, finished) = self._measure("student", capture_call, 
+                                          student_func, self.test_input, 
+                                          capture)
+            self._note_capture(capture)
+            if not finished:
+                return ProgramCrash("An error occurred running {}".format(str(self)))
+            else:            
+                ignore_whitespace_cmp = lambda x, y: ' '.join(x.split()) == ' '.join(y.split())
+                return compare_outputs(capture.reader(), ta_output, 
+                                       ignore_whitespace_cmp,
+                                       self.full_diff,
+                                       lambda x: ' '.join(x.split()))
+        except OutputLimitError as e:
+            self._note_capture(capture)
+            return OutputLimitExceeded(e.limit)
+        finally:
+            capture.close()
+    
+    def reference(self):
+        """Returns what the TA's function prints on the test input."""
+        def compute():
+            ta_module = self._import_module(self.ta_module_name)
+            ta_func = getattr(ta_module, self.function_name)            
+            (_, ta_output) = call_function(ta_func, self.test_input)
+            if ta_output is not None:
+                self._count_output("ta", len(ta_output))
+            return ta_output
+        return self._ta_result(self.function_name, compute)
+
+    def prepare(self):
+        if self.golden is None:
+            self._import_module(self.ta_module_name)
+        self._import_module(self.student_module_name)
     
     def __str__(self):
         return '{}{}'.format(self.function_name, argument_signature(self.test_input))
    
     @staticmethod
     def create_batch(ta_module_name, student_module_name, 
-                     function_name, pub_inputs, priv_inputs):
+                     function_name, pub_inputs, priv_inputs, cache = None,
+                     time_limit = None, cpu_limit = None, full_diff = False):
         public = [FunctionStdoutTest(ta_module_name, student_module_name, 
-                                   function_name, inp, private=False) for inp in pub_inputs]
+                                   function_name, inp, private=False, 
+                                   cache=cache, full_diff=full_diff) 
+                  for inp in pub_inputs]
         private = [FunctionStdoutTest(ta_module_name, student_module_name, 
-                                   function_name, inp, private=True) for inp in priv_inputs]        
-        return public + private
+                                   function_name, inp, private=True, 
+                                   cache=cache, full_diff=full_diff) 
+                   for inp in priv_inputs]        
+        return _limit_time(public + private, time_limit, cpu_limit)
          
 class InteractiveTest(TestCaseWithInput):
     """
@@ -322,12 +1171,18 @@ class InteractiveTest(TestCaseWithInput):
     The largest value is 5.
     The second-largest value is 4.
     
+    With full_diff, every place where the output differs from the TA's is
+    reported, rather than only the first (see util.compare_outputs).
+    
     """    
     
-    def __init__(self, ta_module_name, student_module_name, test_input, private):
+    def __init__(self, ta_module_name, student_module_name, test_input, private,
+                 cache = None, full_diff = False):
         TestCaseWithInput.__init__(self, test_input, private)
         self.ta_module_name = ta_module_name
         self.student_module_name = student_module_name
+        self.cache = cache
+        self.full_diff = full_diff
         
     def __str__(self):
         return '{}.py with input {}'.format(
@@ -335,45 +1190,128 @@ class InteractiveTest(TestCaseWithInput):
                 argument_signature(self.test_input))
 
     def run(self):
-        student_output = InteractiveTest.run_script(self.student_module_name, 
-                                                    self.test_input) 
-        ta_output = InteractiveTest.run_script(self.ta_module_name, 
-                                               self.test_input)
-        return compare_outputs(student_output, ta_output)
+        capture = OutputCapture()
+        try:
+            finished = self._measure("student", InteractiveTest._run_captured,
+                                     self.student_module_name, 
+                                     self.test_input, capture)
+            self._note_capture(capture)
+            ta_output = self.reference()
+            if not finished:
+                return ProgramCrash("An error occurred running {}".format(str(self)))
+            return compare_outputs(capture.reader(), ta_output, 
+                                   full_diff = self.full_diff)
+        except OutputLimitError as e:
+            self._note_capture(capture)
+            return OutputLimitExceeded(e.limit)
+        finally:
+            capture.close()
+
+    def reference(self):
+        """Returns what the TA's script prints on the test input."""
+        def compute():
+            ta_output = InteractiveTest.run_script(self.ta_module_name, 
+                                                   self.test_input)
+            if ta_output is not None:
+                self._count_output("ta", len(ta_output))
+            return ta_output
+        return self._ta_result('__main__', compute)
     
     @staticmethod
     def run_script(name, inputs):
+        """
+        Runs a script on a list of input lines, and returns its output (or 
+        None, if it raised an exception). Raises an OutputLimitError if 
+        the script printed too much.
+        
+        """
+        capture = OutputCapture()
+        try:
+            if InteractiveTest._run_captured(name, inputs, capture):
+                return capture.getvalue()
+            else:
+                return None
+        finally:
+            capture.close()
+
+    @staticmethod
+    def _run_captured(name, inputs, capture):
+        """
+        Runs a script on a list of input lines, with its output going to an
+        OutputCapture. Returns whether the script finished without raising
+        an exception.
+        
+        Each run executes the script's compiled code (see _script_code) in 
+        a fresh namespace, so runs are independent of each other and leave 
+        sys.modules alone. As when the script was imported, its __name__ is
+        its module name, not "__main__".
+        
+        """
         input_string = ""
         for i in inputs:
             input_string += i + "\n"    
-        # Set up the input string, and the output buffer.    
+        # Set up the input string.    
         new_stdin = io.StringIO(input_string)
-        new_stdout = io.StringIO()    
         try:
+            (path, code) = InteractiveTest._script_code(name)
+            namespace = {"__name__": name, "__file__": path,
+                         "__builtins__": builtins}
             # Redirect stdin and stdout.
             sys.stdin = new_stdin
-            sys.stdout = new_stdout
-            if name in sys.modules:
-                importlib.reload(sys.modules[name])
-            else:
-                importlib.__import__(name)
-            output = new_stdout.getvalue()
+            sys.stdout = capture
+            exec(code, namespace)
+            finished = True
+        except MemoryError:
+            # Reported as a MemoryLimitExceeded (see _run_test).
+            raise
         except:
-            output = None
+            finished = False
         finally:
             # Restore stdin and stdout.
             sys.stdin = sys.__stdin__
             sys.stdout = sys.__stdout__    
-        return output
+        if capture.exceeded:
+            raise OutputLimitError(capture.limit)
+        return finished
+
+    @staticmethod
+    def _script_code(name):
+        """
+        Returns (path, code) for the named script, compiling its source 
+        only the first time (or when the source has changed).
+        
+        """
+        spec = importlib.util.find_spec(name)
+        if spec is None or not spec.origin or not os.path.isfile(spec.origin):
+            raise ImportError("No script named {}".format(name))
+        stat = os.stat(spec.origin)
+        stamp = (spec.origin, stat.st_mtime_ns, stat.st_size)
+        entry = _scripts.get(name)
+        if entry is None or entry[0] != stamp:
+            with open(spec.origin, 'rb') as source:
+                code = compile(source.read(), spec.origin, 'exec')
+            entry = (stamp, code)
+            _scripts[name] = entry
+        return (spec.origin, entry[1])
+
+    def prepare(self):
+        if self.golden is None:
+            InteractiveTest._script_code(self.ta_module_name)
+        InteractiveTest._script_code(self.student_module_name)
     
     @staticmethod
     def create_batch(ta_module_name, student_module_name, 
-                     pub_inputs, priv_inputs):
-        public = [InteractiveTest(ta_module_name, student_module_name, inp, private=False) 
+                     pub_inputs, priv_inputs, cache = None,
+                     time_limit = None, cpu_limit = None, full_diff = False):
+        public = [InteractiveTest(ta_module_name, student_module_name, inp, 
+                                  private=False, cache=cache, 
+                                  full_diff=full_diff) 
                 for inp in pub_inputs]
-        private = [InteractiveTest(ta_module_name, student_module_name, inp, private=True) 
+        private = [InteractiveTest(ta_module_name, student_module_name, inp, 
+                                   private=True, cache=cache,
+                                   full_diff=full_diff) 
                 for inp in priv_inputs]        
-        return public + private
+        return _limit_time(public + private, time_limit, cpu_limit)
 
 
 class InterfaceTest(TestCaseWithInput):
@@ -393,6 +1331,13 @@ class InterfaceTest(TestCaseWithInput):
         
     def __str__(self):
         return '{}'.format(self.test_input[0])
+
+    def prepare(self):
+        self._import_module(self.client_module_name)
+
+    def reference(self):
+        """Returns the stored output of the TA's client."""
+        return self.ta_output
             
     def run(self):
         try:
@@ -400,8 +1345,13 @@ class InterfaceTest(TestCaseWithInput):
             func = getattr(client_module, self.function_name)
         except Exception as e:
             return ProgramCrash(e)
-        (_, student_output) = call_function(func, self.test_input)          
+        try:
+            (_, student_output) = self._measure("student", call_function, 
+                                                func, self.test_input)
+        except OutputLimitError as e:
+            return OutputLimitExceeded(e.limit)
         if student_output is not None:
+            self._count_output("student", len(student_output))
             student_output = ' '.join(student_output.strip().split())
             ta_output = ' '.join(self.ta_output.strip().split())
             return compare_outputs(student_output, ta_output)
@@ -410,12 +1360,13 @@ class InterfaceTest(TestCaseWithInput):
     
     @staticmethod
     def create_batch(client_module_name, function_name, pub_inputs, 
-                     pub_outputs, priv_inputs, priv_outputs):
+                     pub_outputs, priv_inputs, priv_outputs, 
+                     time_limit = None, cpu_limit = None):
         public = [InterfaceTest(client_module_name, function_name, inp, False, output) 
                 for (inp, output) in zip(pub_inputs, pub_outputs)]
         private = [InterfaceTest(client_module_name, function_name, inp, True, output) 
                 for (inp, output) in zip(priv_inputs, priv_outputs)]
-        return public + private
+        return _limit_time(public + private, time_limit, cpu_limit)
 
 
         
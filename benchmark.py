@@ -0,0 +1,295 @@
+"""
+Benchmarks the hot paths of the autograder, so that changes that make
+grading slower get noticed:
+
+    python benchmark.py                        # just report
+    python benchmark.py --save                 # store the results
+    python benchmark.py --baseline             # compare with them
+
+Each benchmark reports a rate (e.g. tests per second), and that rate
+relative to the rate of a calibration loop (plain Python arithmetic, see
+calibrate) run in the same process, which mostly cancels out the speed
+of the machine. Given a baseline (written earlier with --save), any 
+benchmark whose relative rate dropped by more than the tolerance is 
+flagged as a regression, and the exit status is 1. Without a file name,
+both options use BASELINE (benchmark_baseline.json, next to this file).
+
+"""
+import argparse
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+import types
+from autograder import Autograder, FunctionTest, FunctionStdoutTest
+from autograder import InteractiveTest, InterfaceTest
+from roster import grade_roster
+from sanity import compare
+from util import call_function, compare_outputs
+
+
+EXAMPLES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'examples')
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 
+                        'benchmark_baseline.json')
+
+# How many seconds each round of a benchmark runs for, how many rounds are
+# run (the best one counts), and how much slower than the baseline a
+# benchmark may be before it counts as a regression.
+ROUND_TIME = 0.5
+ROUNDS = 3
+TOLERANCE = 0.2
+
+# A data file that does not exist, so that Autograders start afresh.
+NO_DATA = os.path.join(tempfile.gettempdir(), 'autograder-benchmark-data.json')
+
+
+def measure(func, round_time = ROUND_TIME, rounds = ROUNDS):
+    """
+    Calls func repeatedly for rounds rounds of about round_time seconds,
+    and returns the best rate: units of work per second, where each call
+    of func returns the number of units it did.
+
+    """
+    best = 0.0
+    for _ in range(rounds):
+        units = 0
+        start = time.perf_counter()
+        elapsed = 0.0
+        while elapsed < round_time:
+            units += func()
+            elapsed = time.perf_counter() - start
+        best = max(best, units / elapsed)
+    return best
+
+
+def calibrate(round_time = ROUND_TIME, rounds = ROUNDS):
+    """
+    Returns the rate of a loop of plain Python arithmetic (in loops per
+    second), which the rates of the benchmarks are divided by.
+
+    """
+    def run():
+        total = 0
+        for i in range(10000):
+            total += i * i % 7
+        return 1
+    return measure(run, round_time, rounds)
+
+
+def bench_compare_outputs():
+    """Compares two identical outputs of 100,000 lines."""
+    output = ''.join('line {} of the output\n'.format(i) for i in range(100000))
+    copy = ''.join(list(output))
+    def run():
+        compare_outputs(output, copy)
+        return 100000
+    return (run, "lines/s")
+
+
+def bench_call_function():
+    """Captures the output of a function that prints 100 lines."""
+    def chatty():
+        for i in range(100):
+            print(i)
+    def run():
+        call_function(chatty, ())
+        return 1
+    return (run, "calls/s")
+
+
+def bench_sanity_compare():
+    """Compares the interfaces of two modules with 50 classes each."""
+    def make_module(name):
+        module = types.ModuleType(name)
+        source = []
+        for c in range(50):
+            source.append("class C{}:".format(c))
+            for m in range(20):
+                source.append("    def m{}(self, a, b): pass".format(m))
+        exec('\n'.join(source), module.__dict__)
+        return module
+    (ta, student) = (make_module("ta"), make_module("student"))
+    def run():
+        compare(ta, student)
+        return 1
+    return (run, "compares/s")
+
+
+def bench_run_script():
+    """Runs the interactive two_largest script on one input."""
+    inputs = ["32", "22", "123", "99", "2", ""]
+    def run():
+        InteractiveTest.run_script("ta_two_largest", inputs)
+        return 1
+    return (_in_example("interactivetest", run), "runs/s")
+
+
+def bench_function_tests():
+    """Grades digital_root (FunctionTest) end to end."""
+    def batch():
+        return FunctionTest.create_batch(
+                "ta_digital_root", "digital_root", "digital_root",
+                [(1729,), (356,)], [(5000,), (12345678,), (1,), (0,)])
+    return (_in_example("functiontest", _grade(batch)), "tests/s")
+
+
+def bench_stdout_tests():
+    """Grades hailstone (FunctionStdoutTest) end to end."""
+    def batch():
+        return FunctionStdoutTest.create_batch(
+                "ta_hailstone", "hailstone", "hailstone",
+                [(7,), (13,)], [(5000,), (12345678,), (1,)])
+    return (_in_example("functionstdouttest", _grade(batch)), "tests/s")
+
+
+def bench_interactive_tests():
+    """Grades two_largest (InteractiveTest) end to end."""
+    def batch():
+        return InteractiveTest.create_batch(
+                "ta_two_largest", "two_largest",
+                [["1", "2", "3", "4", "5", ""], ["1", "2", ""]],
+                [["12", "22", ""], ["-10", "-22", "-3", "-48", "-5", ""]])
+    return (_in_example("interactivetest", _grade(batch)), "tests/s")
+
+
+def bench_interface_tests():
+    """Grades the Domino client (InterfaceTest) end to end."""
+    def batch():
+        return InterfaceTest.create_batch(
+                "client", "DominoClient",
+                [('Domino(3,5).getLeftDots()',),
+                 ('Domino(3,5).getRightDots()',)], ["3", "5"], [], [])
+    return (_in_example("interfacetest", _grade(batch)), "tests/s")
+
+
+def bench_roster():
+    """Grades the submissions of examples/rostertest on one process."""
+    with open(os.path.join(EXAMPLES, 'rostertest', 'spec.json')) as spec_file:
+        spec = json.load(spec_file)
+    ta_path = os.path.join(EXAMPLES, 'functiontest', 'ta_digital_root.py')
+    submissions = os.path.join(EXAMPLES, 'rostertest', 'submissions')
+    def run():
+        return grade_roster(ta_path, spec, submissions, io.StringIO())
+    return (run, "submissions/s")
+
+
+BENCHMARKS = [("compare_outputs", bench_compare_outputs),
+              ("call_function", bench_call_function),
+              ("sanity_compare", bench_sanity_compare),
+              ("run_script", bench_run_script),
+              ("function_tests", bench_function_tests),
+              ("stdout_tests", bench_stdout_tests),
+              ("interactive_tests", bench_interactive_tests),
+              ("interface_tests", bench_interface_tests),
+              ("roster", bench_roster)]
+
+
+def _grade(batch):
+    """Returns a benchmark function that grades a fresh batch of tests."""
+    def run():
+        tests = batch()
+        Autograder(echo = False, data_file = NO_DATA).run(tests)
+        return len(tests)
+    return run
+
+
+def _in_example(directory, func):
+    """
+    Returns func, wrapped so that it runs with the modules of an example
+    directory importable (and forgotten again afterwards, since examples
+    reuse module names).
+
+    """
+    path = os.path.join(EXAMPLES, directory)
+    def run():
+        before = set(sys.modules)
+        sys.path.insert(0, path)
+        try:
+            return func()
+        finally:
+            sys.path.remove(path)
+            for name in set(sys.modules) - before:
+                module = sys.modules[name]
+                filename = getattr(module, '__file__', None) or ''
+                if os.path.dirname(os.path.abspath(filename)) == path:
+                    del sys.modules[name]
+    return run
+
+
+def run_benchmarks(names = None, round_time = ROUND_TIME, rounds = ROUNDS):
+    """
+    Runs the benchmarks (all of them, or the named ones), and returns
+    {name: {"rate": units per second, "relative": the rate divided by
+    that of the calibration loop, "unit": ...}}.
+
+    """
+    calibration = calibrate(round_time, rounds)
+    results = {}
+    for (name, setup) in BENCHMARKS:
+        if names and name not in names:
+            continue
+        (func, unit) = setup()
+        rate = measure(func, round_time, rounds)
+        results[name] = {"rate": rate, "relative": rate / calibration,
+                         "unit": unit}
+    return results
+
+
+def compare_to_baseline(results, baseline, tolerance = TOLERANCE):
+    """
+    Returns the names of the benchmarks whose relative rate fell by more
+    than the tolerance (a fraction) below the baseline's.
+
+    """
+    regressions = []
+    for (name, result) in results.items():
+        if name in baseline:
+            if result["relative"] < baseline[name]["relative"] * (1 - tolerance):
+                regressions.append(name)
+    return regressions
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(
+            description = "Benchmarks the hot paths of the autograder.")
+    parser.add_argument("names", nargs = "*",
+                        help = "benchmarks to run (default: all)")
+    parser.add_argument("--baseline", nargs = "?", const = BASELINE,
+                        help = "JSON file of earlier results to compare with "
+                               "(default: benchmark_baseline.json)")
+    parser.add_argument("--save", nargs = "?", const = BASELINE,
+                        help = "JSON file to write the results to "
+                               "(default: benchmark_baseline.json)")
+    parser.add_argument("--tolerance", type = float, default = TOLERANCE,
+                        help = "allowed slowdown, as a fraction of the baseline")
+    parser.add_argument("--round-time", type = float, default = ROUND_TIME,
+                        help = "seconds per round of each benchmark")
+    args = parser.parse_args(argv)
+    results = run_benchmarks(args.names, args.round_time)
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+    regressions = compare_to_baseline(results, baseline, args.tolerance)
+    for (name, result) in results.items():
+        line = "{:<20}{:>14.1f} {:<14}{:>12.4g} relative".format(
+                name, result["rate"], result["unit"], result["relative"])
+        if name in baseline:
+            change = result["relative"] / baseline[name]["relative"] - 1
+            line += "  ({:+.0%} vs. baseline{})".format(
+                    change, ", REGRESSION" if name in regressions else "")
+        print(line)
+    if args.save:
+        # Only the relative rates, since the others depend on the machine.
+        saved = dict((name, {"relative": result["relative"], 
+                             "unit": result["unit"]})
+                     for (name, result) in results.items())
+        with open(args.save, 'w') as save_file:
+            json.dump(saved, save_file, indent = 2, sort_keys = True)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
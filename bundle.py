@@ -0,0 +1,128 @@
+"""
+Compiles a batch of tests into a "golden bundle": the test inputs together
+with the TA's results on them. Grading from a bundle compares submissions
+against the stored results, so the TA's module is neither needed nor run
+at grading time.
+
+    python bundle.py TA_MODULE SPEC OUT.bundle
+
+compiles the batch described by a roster spec (see roster.py). The bundle
+can then take the place of the TA module in roster.py, or be loaded in a
+grading script:
+
+    tests = load_bundle("digital_root.bundle", "digital_root")
+    Autograder().run(tests)
+
+A bundle is a gzipped pickle, so only load bundles that you compiled.
+
+"""
+import argparse
+import copy
+import gzip
+import json
+import os
+import pickle
+import sys
+import autograder
+
+
+BUNDLE_FORMAT = "autograder-bundle"
+# Bumped whenever the attributes of the bundled TestCases change, so that
+# older bundles are rejected rather than loaded without them.
+BUNDLE_VERSION = 2
+BUNDLE_TYPES = ["FunctionTest", "FunctionStdoutTest",
+                "InteractiveTest", "InterfaceTest"]
+
+
+class BundleError(Exception):
+    """Raised for a file that is not a bundle this version can load."""
+    pass
+
+
+def compile_bundle(tests, path):
+    """
+    Runs the TA's side of each test once, and writes the tests (with their
+    results) to a bundle file.
+
+    """
+    entries = []
+    for test in tests:
+        kind = type(test).__name__
+        if kind not in BUNDLE_TYPES:
+            raise BundleError("Cannot bundle a {}.".format(kind))
+        test = copy.copy(test)
+        test.compile()
+        fields = dict(test.__dict__)
+        fields["cache"] = None
+        fields["_snapshot"] = None
+        entries.append((kind, fields))
+    with gzip.open(path, 'wb') as out:
+        pickle.dump({"format": BUNDLE_FORMAT,
+                     "version": BUNDLE_VERSION,
+                     "tests": entries}, out)
+
+
+def load_bundle(path, student_module_name = None):
+    """
+    Loads the tests of a bundle. If a student module name is given, the
+    tests are set up to grade that module.
+
+    """
+    with gzip.open(path, 'rb') as bundle_file:
+        try:
+            bundle = pickle.load(bundle_file)
+        except (OSError, EOFError, pickle.UnpicklingError) as e:
+            raise BundleError("{} is not a bundle: {}".format(path, e))
+    if not isinstance(bundle, dict) or bundle.get("format") != BUNDLE_FORMAT:
+        raise BundleError("{} is not a bundle.".format(path))
+    if bundle["version"] != BUNDLE_VERSION:
+        raise BundleError("{} has version {}, but version {} is expected."
+                          .format(path, bundle["version"], BUNDLE_VERSION))
+    tests = []
+    for (kind, fields) in bundle["tests"]:
+        cls = getattr(autograder, kind)
+        test = cls.__new__(cls)
+        test.__dict__.update(fields)
+        tests.append(test)
+    if student_module_name is not None:
+        tests = for_student(tests, student_module_name)
+    return tests
+
+
+def for_student(tests, student_module_name):
+    """
+    Returns copies of the (loaded) tests that grade the named student
+    module.
+
+    """
+    copies = []
+    for test in tests:
+        test = copy.copy(test)
+        if hasattr(test, "student_module_name"):
+            test.student_module_name = student_module_name
+        copies.append(test)
+    return copies
+
+
+def main(argv = None):
+    # roster.py loads bundles itself, hence the late import.
+    from roster import build_tests
+    parser = argparse.ArgumentParser(
+            description = "Compiles a batch of tests into a golden bundle.")
+    parser.add_argument("ta_module", help = "path of the TA's module")
+    parser.add_argument("spec", help = "JSON file describing the tests")
+    parser.add_argument("output", help = "bundle file to write")
+    args = parser.parse_args(argv)
+    with open(args.spec) as spec_file:
+        spec = json.load(spec_file)
+    ta_path = os.path.abspath(args.ta_module)
+    sys.path.insert(0, os.path.dirname(ta_path))
+    ta_module_name = os.path.splitext(os.path.basename(ta_path))[0]
+    tests = build_tests(spec, ta_module_name, spec.get("student_module"))
+    compile_bundle(tests, args.output)
+    sys.stderr.write("Compiled {} tests into {}.\n".format(len(tests),
+                                                          args.output))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+import hashlib
+import importlib.util
+import os
+import pickle
+import tempfile
+
+
+CACHE_SIZE = 64 * 1024 * 1024
+
+
+class ResultCache:
+    """
+    A ResultCache keeps the results of running the TA's code on disk, so
+    that they are computed once per assignment rather than once per
+    student.
+
+    Each entry is keyed by a hash of the TA module's source, the name of
+    what was run and the repr of the test input, so editing the TA module
+    automatically invalidates its old entries. Those are never read again,
+    and eventually get evicted: once the cache grows beyond max_bytes,
+    the least recently used entries are deleted.
+
+    """
+
+    def __init__(self, directory, max_bytes = CACHE_SIZE):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._sources = {}
+        self._size = None
+        os.makedirs(directory, exist_ok = True)
+
+    def source_hash(self, module_name):
+        """
+        Returns a hash of the source of the named module, or None if its
+        source cannot be found.
+
+        """
+        spec = importlib.util.find_spec(module_name)
+        if spec is None or not spec.origin or not os.path.isfile(spec.origin):
+            return None
+        stat = os.stat(spec.origin)
+        stamp = (spec.origin, stat.st_mtime_ns, stat.st_size)
+        if stamp not in self._sources:
+            with open(spec.origin, 'rb') as source:
+                self._sources[stamp] = hashlib.sha256(source.read()).hexdigest()
+        return self._sources[stamp]
+
+    def key(self, module_name, name, test_input):
+        """
+        Returns the cache key for running name (e.g. a function) of the
+        named module on the test input, or None if there cannot be one.
+
+        """
+        source_hash = self.source_hash(module_name)
+        if source_hash is None:
+            return None
+        description = '\0'.join([source_hash, name, repr(test_input)])
+        return hashlib.sha256(description.encode('utf-8')).hexdigest()
+
+    def get(self, module_name, name, test_input, compute):
+        """
+        Returns the cached result of running name of the named module on
+        the test input. If there is none, it is computed (by calling
+        compute) and stored.
+
+        """
+        key = self.key(module_name, name, test_input)
+        if key is None:
+            return compute()
+        path = os.path.join(self.directory, key)
+        try:
+            with open(path, 'rb') as entry:
+                value = pickle.load(entry)
+            os.utime(path)
+            self.hits += 1
+            return value
+        except (OSError, EOFError, pickle.UnpicklingError):
+            pass
+        self.misses += 1
+        value = compute()
+        self._store(path, value)
+        return value
+
+    def _store(self, path, value):
+        try:
+            data = pickle.dumps(value)
+        except Exception:
+            # Not every return value can be cached.
+            return
+        # Write to a temporary file first, so that concurrent graders
+        # never see a partially written entry.
+        (fd, temp_path) = tempfile.mkstemp(dir = self.directory,
+                                           suffix = '.tmp')
+        with os.fdopen(fd, 'wb') as entry:
+            entry.write(data)
+        os.replace(temp_path, path)
+        if self._size is None:
+            self._size = self._total_size()
+        else:
+            self._size += len(data)
+        if self._size > self.max_bytes:
+            self.evict()
+
+    def _entries(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            try:
+                stat = os.stat(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, name))
+        return entries
+
+    def _total_size(self):
+        return sum(size for (_, size, _) in self._entries())
+
+    def evict(self):
+        """
+        Deletes the least recently used entries until the cache is
+        comfortably below its maximum size.
+
+        """
+        entries = sorted(self._entries())
+        size = sum(size for (_, size, _) in entries)
+        target = self.max_bytes * 3 // 4
+        for (_, entry_size, name) in entries:
+            if size <= target:
+                break
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
+            size -= entry_size
+        self._size = size
+
+
+
+class MemoryCache(ResultCache):
+    """
+    A MemoryCache is a ResultCache that keeps its entries in the memory of
+    the process, rather than on disk, so that the TA's results are shared
+    by the submissions that one process grades (and by the processes it
+    forks afterwards). Once the entries take more than max_bytes, the
+    least recently used ones are dropped.
+
+    Each entry is kept pickled, so that every test gets a copy of its own.
+
+    """
+
+    def __init__(self, max_bytes = CACHE_SIZE):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._sources = {}
+        self._size = 0
+        # Pickled values, keyed as on disk, least recently used first.
+        self._values = {}
+
+    def get(self, module_name, name, test_input, compute):
+        key = self.key(module_name, name, test_input)
+        if key is None:
+            return compute()
+        data = self._values.pop(key, None)
+        if data is not None:
+            self._values[key] = data
+            self.hits += 1
+            return pickle.loads(data)
+        self.misses += 1
+        value = compute()
+        try:
+            data = pickle.dumps(value)
+        except Exception:
+            # Not every return value can be cached.
+            return value
+        self._values[key] = data
+        self._size += len(data)
+        if self._size > self.max_bytes:
+            self.evict()
+        return value
+
+    def evict(self):
+        while self._values and self._size > self.max_bytes * 3 // 4:
+            oldest = next(iter(self._values))
+            self._size -= len(self._values.pop(oldest))
@@ -0,0 +1,80 @@
+"""
+Submits work to a grading service (see service.py):
+
+    python client.py /tmp/grader.sock alice submissions/alice
+
+The address is the path of the service's Unix socket, or HOST:PORT. The
+record of Autograder.finalize is printed as JSON. This needs nothing but
+the standard library, so it can be copied to wherever submissions arrive.
+
+"""
+import argparse
+import json
+import os
+import socket
+import sys
+
+
+class ServiceError(Exception):
+    """Raised when the service turns a submission away (e.g. it is busy)."""
+    pass
+
+
+def connect(address, timeout = None):
+    """
+    Opens a connection to a service at an address: a Unix socket path, or
+    a (host, port) pair or "HOST:PORT" string.
+
+    """
+    if isinstance(address, str) and ':' in address:
+        (host, port) = address.rsplit(':', 1)
+        address = (host, int(port))
+    if isinstance(address, str):
+        connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    else:
+        connection = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    connection.settimeout(timeout)
+    connection.connect(address)
+    return connection
+
+
+def grade(address, student, path, module_name = None, timeout = None):
+    """
+    Has the service at an address grade a submission, and returns its
+    record. Raises ServiceError if the service turns it away.
+
+    """
+    request = {"student": student, "path": os.path.abspath(path)}
+    if module_name is not None:
+        request["module"] = module_name
+    with connect(address, timeout) as connection:
+        connection.sendall((json.dumps(request) + "\n").encode('utf-8'))
+        with connection.makefile('r', encoding = 'utf-8') as replies:
+            for line in replies:
+                reply = json.loads(line)
+                if "error" in reply and "student" not in reply:
+                    raise ServiceError(reply["error"])
+                if reply.get("event") != "queued":
+                    return reply
+    raise ServiceError("The service closed the connection.")
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(
+            description = "Submits a submission to a grading service.")
+    parser.add_argument("address", help = "Unix socket path, or HOST:PORT")
+    parser.add_argument("student", help = "name of the student")
+    parser.add_argument("path", help = "directory of the submission")
+    parser.add_argument("--module", help = "name of the student's module")
+    args = parser.parse_args(argv)
+    try:
+        record = grade(args.address, args.student, args.path, args.module)
+    except (ServiceError, OSError) as e:
+        sys.stderr.write("{}\n".format(e))
+        return 1
+    print(json.dumps(record))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,164 @@
+"""
+Comparators decide whether a student's return value matches the TA's (see
+FunctionTest). A comparator can be called like the "the_same" predicate of
+util.compare_functions, but it can also say where two values differ:
+
+    >>> Close(abs_tol = 1e-6).difference([1.0, 2.0, 3.5], [1.0, 2.0000001, 3.0])
+    ('value[2]', 3.5, 3.0)
+
+so that a discrepancy in a long list can be reported by its first differing
+element, rather than by printing both lists in full.
+
+Long sequences of numbers are compared in batches: a batch that is exactly
+equal is skipped at C speed, and only a batch that is not is looked at
+element by element. NumPy arrays are compared with NumPy, if it is
+installed.
+
+"""
+import math
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+# How many elements of a sequence are compared at a time.
+BATCH_SIZE = 4096
+
+
+class Comparator:
+    """
+    A Comparator is an abstract class that compares an expected value with
+    a received one.
+
+    """
+    def __call__(self, expected, received):
+        return self.difference(expected, received) is None
+
+    def difference(self, expected, received, location = 'value'):
+        """
+        Returns None if the values match. Otherwise returns (location,
+        expected part, received part) for the first part that differs,
+        where location says where that part is, e.g. 'value[3][0]', or
+        'len(value[3])' if the lengths of the sequences at value[3] differ.
+
+        """
+        if numpy is not None and (isinstance(expected, numpy.ndarray) or
+                                  isinstance(received, numpy.ndarray)):
+            return self._array_difference(expected, received, location)
+        if (isinstance(expected, (list, tuple)) and
+                type(received) is type(expected)):
+            return self._sequence_difference(expected, received, location)
+        if isinstance(expected, dict) and isinstance(received, dict):
+            return self._dict_difference(expected, received, location)
+        if self.same(expected, received):
+            return None
+        return (location, expected, received)
+
+    def same(self, expected, received):
+        """Abstract method. Returns whether two single values match."""
+        raise NotImplementedError("Cannot call .same() on abstract class.")
+
+    def same_array(self, expected, received):
+        """
+        Abstract method. Returns a boolean NumPy array that tells which
+        elements of two (flat) arrays match.
+
+        """
+        raise NotImplementedError("Cannot call .same_array() on abstract class.")
+
+    def _sequence_difference(self, expected, received, location):
+        for start in range(0, min(len(expected), len(received)), BATCH_SIZE):
+            end = start + BATCH_SIZE
+            if expected[start:end] == received[start:end]:
+                continue
+            for i in range(start, min(end, len(expected), len(received))):
+                found = self.difference(expected[i], received[i],
+                                        '{}[{}]'.format(location, i))
+                if found is not None:
+                    return found
+        if len(expected) != len(received):
+            return ('len({})'.format(location), len(expected), len(received))
+        return None
+
+    def _dict_difference(self, expected, received, location):
+        if expected.keys() != received.keys():
+            return ('keys({})'.format(location), sorted(map(repr, expected)),
+                    sorted(map(repr, received)))
+        for key in expected:
+            found = self.difference(expected[key], received[key],
+                                    '{}[{!r}]'.format(location, key))
+            if found is not None:
+                return found
+        return None
+
+    def _array_difference(self, expected, received, location):
+        try:
+            expected = numpy.asarray(expected)
+            received = numpy.asarray(received)
+        except Exception:
+            return (location, expected, received)
+        if expected.shape != received.shape:
+            return ('shape({})'.format(location), expected.shape,
+                    received.shape)
+        flat_expected = expected.reshape(-1)
+        flat_received = received.reshape(-1)
+        for start in range(0, flat_expected.size, BATCH_SIZE):
+            end = start + BATCH_SIZE
+            matches = self.same_array(flat_expected[start:end],
+                                      flat_received[start:end])
+            if not matches.all():
+                i = start + int(numpy.argmin(matches))
+                index = numpy.unravel_index(i, expected.shape)
+                return ('{}[{}]'.format(location, ', '.join(map(str, index))),
+                        flat_expected[i].item(), flat_received[i].item())
+        return None
+
+
+class Exact(Comparator):
+    """Values match if they are equal."""
+    def same(self, expected, received):
+        return expected == received
+
+    def same_array(self, expected, received):
+        return expected == received
+
+
+class Close(Comparator):
+    """
+    Numbers match if they are equal within a relative tolerance (rel_tol)
+    or an absolute one (abs_tol), as for math.isclose. Other values match
+    only if they are equal, as do ints too large for a float.
+
+    """
+    def __init__(self, rel_tol = 1e-9, abs_tol = 0.0):
+        self.rel_tol = rel_tol
+        self.abs_tol = abs_tol
+
+    def same(self, expected, received):
+        if expected == received:
+            return True
+        if (isinstance(expected, (int, float)) and
+                isinstance(received, (int, float)) and
+                not isinstance(expected, bool) and
+                not isinstance(received, bool)):
+            try:
+                return math.isclose(expected, received, rel_tol = self.rel_tol,
+                                    abs_tol = self.abs_tol)
+            except OverflowError:
+                # An int too large for a float: only an exact match counts.
+                return False
+        return False
+
+    def same_array(self, expected, received):
+        if expected.dtype.kind in 'fc' or received.dtype.kind in 'fc':
+            # The same test as math.isclose, which is symmetric.
+            tolerance = numpy.maximum(
+                    self.rel_tol * numpy.maximum(numpy.abs(expected),
+                                                 numpy.abs(received)),
+                    self.abs_tol)
+            with numpy.errstate(invalid = 'ignore'):
+                return (expected == received) | (numpy.abs(expected - received)
+                                                 <= tolerance)
+        return expected == received
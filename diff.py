@@ -0,0 +1,117 @@
+"""
+Computes line diffs of outputs, for compare_outputs in full-diff mode.
+
+The lines are first replaced by small integers (equal lines get equal
+numbers), so that the diff compares numbers rather than strings, and the
+lines that the outputs have in common at the start and at the end are set
+aside. What is left is diffed with Myers' algorithm, which takes time
+proportional to the size of the outputs times the number of edits; since
+the search gives up after MAX_EDITS edits (or at once, if the outputs'
+lengths alone differ by more), outputs that have little in common cannot
+make it slow. Only the band of the search that has been reached is kept
+for tracing the edits back, so its memory grows with the square of the
+number of edits, not with the size of the outputs.
+
+"""
+
+# How many lines may be inserted or deleted before diff() gives up.
+MAX_EDITS = 1000
+
+
+def diff(expected, received, max_edits = MAX_EDITS):
+    """
+    Compares two lists of lines, and returns the hunks in which they
+    differ, as (expected start, expected end, received start, received end)
+    slices (0-based, end excluded), or None if turning one list into the
+    other takes more than max_edits insertions and deletions.
+
+    """
+    numbers = {}
+    a = [numbers.setdefault(line, len(numbers)) for line in expected]
+    b = [numbers.setdefault(line, len(numbers)) for line in received]
+    start = 0
+    while start < len(a) and start < len(b) and a[start] == b[start]:
+        start += 1
+    end = 0
+    while (end < len(a) - start and end < len(b) - start
+           and a[-1 - end] == b[-1 - end]):
+        end += 1
+    hunks = _myers(a[start:len(a) - end], b[start:len(b) - end], max_edits)
+    if hunks is None:
+        return None
+    return [(i + start, j + start, k + start, l + start)
+            for (i, j, k, l) in hunks]
+
+
+def _myers(a, b, max_edits):
+    """Returns the hunks of a shortest edit script from a to b (or None)."""
+    (n, m) = (len(a), len(b))
+    if abs(n - m) > max_edits:
+        # Every line that one has more than the other is an edit.
+        return None
+    if n == 0 or m == 0:
+        return [(0, n, 0, m)] if n + m else []
+    limit = min(n + m, max_edits)
+    offset = limit + 1
+    v = [0] * (2 * limit + 3)
+    trace = []
+    for d in range(limit + 1):
+        # Rounds before d only reached diagonals -d + 1 to d - 1.
+        trace.append(v[offset - d:offset + d + 1])
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and v[offset + k - 1] < v[offset + k + 1]):
+                x = v[offset + k + 1]
+            else:
+                x = v[offset + k - 1] + 1
+            y = x - k
+            while x < n and y < m and a[x] == b[y]:
+                x += 1
+                y += 1
+            v[offset + k] = x
+            if x >= n and y >= m:
+                return _hunks(_edits(trace, n, m, d), n, m)
+    return None
+
+
+def _edits(trace, x, y, edits):
+    """
+    Follows the trace of the search back from (x, y), and returns the sets
+    of deleted and inserted positions. (trace[d] holds diagonals -d to d.)
+
+    """
+    deleted = set()
+    inserted = set()
+    for d in range(edits, 0, -1):
+        v = trace[d]
+        k = x - y
+        if k == -d or (k != d and v[d + k - 1] < v[d + k + 1]):
+            previous_k = k + 1
+        else:
+            previous_k = k - 1
+        x = v[d + previous_k]
+        y = x - previous_k
+        if previous_k == k + 1:
+            inserted.add(y)
+        else:
+            deleted.add(x)
+    return (deleted, inserted)
+
+
+def _hunks(edits, n, m):
+    """Groups deleted and inserted positions into hunks."""
+    (deleted, inserted) = edits
+    hunks = []
+    (i, j) = (0, 0)
+    while i < n or j < m:
+        if i in deleted or j in inserted:
+            (start_i, start_j) = (i, j)
+            while i in deleted or j in inserted:
+                if i in deleted:
+                    i += 1
+                else:
+                    j += 1
+            hunks.append((start_i, i, start_j, j))
+        else:
+            i += 1
+            j += 1
+    return hunks
@@ -0,0 +1,5 @@
+from autograder import PropertyTest, Autograder
+from generate import Integers
+tests = PropertyTest.create_batch("ta_digital_root", "digital_root", "digital_root", [Integers(0, 10**9)])
+autograder = Autograder()
+autograder.run(tests)
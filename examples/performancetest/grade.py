@@ -0,0 +1,5 @@
+from autograder import PerformanceTest, Autograder
+sizes = PerformanceTest.ladder(1000, 64000, 7)
+tests = PerformanceTest.create_batch("ta_two_largest", "two_largest", "two_largest", "make_input", sizes)
+autograder = Autograder()
+autograder.run(tests)
@@ -0,0 +1,14 @@
+import random
+
+def two_largest(values):
+    largest = max(values[0], values[1])
+    second = min(values[0], values[1])
+    for value in values[2:]:
+        if value > largest:
+            (largest, second) = (value, largest)
+        elif value > second:
+            second = value
+    return (largest, second)
+
+def make_input(n):
+    return (random.Random(n).sample(range(10 * n), n),)
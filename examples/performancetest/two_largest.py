@@ -0,0 +1,3 @@
+def two_largest(values):
+    ordered = sorted(values)
+    return (ordered[-1], ordered[-2])
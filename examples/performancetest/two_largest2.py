@@ -0,0 +1,13 @@
+def two_largest(values):
+    largest = None
+    second = None
+    for value in values:
+        larger = 0
+        for other in values:
+            if other > value:
+                larger += 1
+        if larger == 0:
+            largest = value
+        elif larger == 1:
+            second = value
+    return (largest, second)
@@ -1,6 +1,8 @@
 python functiontest/grade.py
 python functiontest/grade2.py
 python functiontest/grade3.py
+python functiontest/grade4.py
+python functiontest/grade5.py
 python functionstdouttest/grade.py
 python functionstdouttest/grade2.py
 python functionstdouttest/grade3.py
@@ -12,4 +14,4 @@ python interfacetest/grade3.py
 python interactivetest/grade.py
 python interactivetest/grade2.py
 python interactivetest/grade3.py
-
+python ../roster.py functiontest/ta_digital_root.py rostertest/spec.json rostertest/submissions
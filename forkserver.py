@@ -0,0 +1,93 @@
+"""
+Runs code in forked child processes. The child starts as a copy-on-write
+copy of the parent, with all of the parent's modules already imported, so
+running something in a child costs about as much as a fork rather than an
+interpreter start plus imports; and nothing the child does (e.g. to the
+globals of a student's module) leaks back into the parent.
+
+"""
+import os
+import pickle
+import select
+import sys
+import time
+
+
+class ChildDied(Exception):
+    """Raised when a forked child exits without sending back a value."""
+    def __init__(self, status):
+        if os.WIFSIGNALED(status):
+            message = "The grading process was killed by signal {}.".format(
+                    os.WTERMSIG(status))
+        else:
+            message = "The grading process exited unexpectedly."
+        Exception.__init__(self, message)
+        self.status = status
+
+
+class ChildTimeout(Exception):
+    """Raised when a forked child was killed for taking too long."""
+    def __init__(self, seconds):
+        Exception.__init__(self, "The child took more than {:.1f}s.".format(seconds))
+        self.seconds = seconds
+
+
+def available():
+    """Returns whether this platform can fork."""
+    return hasattr(os, 'fork')
+
+
+def run_forked(func, timeout = None):
+    """
+    Calls func() in a forked child, and returns what it returned (which must
+    be picklable). An exception raised by func is returned, not raised.
+
+    If the child is still running after timeout seconds, it is killed and
+    a ChildTimeout is raised. If it dies without answering, ChildDied is
+    raised.
+
+    """
+    # Anything still buffered would otherwise be written by both processes.
+    sys.stdout.flush()
+    sys.stderr.flush()
+    (read_fd, write_fd) = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_fd)
+        try:
+            try:
+                value = func()
+            except Exception as e:
+                value = e
+            try:
+                data = pickle.dumps(value)
+            except Exception as e:
+                # The value could not be pickled.
+                data = pickle.dumps(Exception(str(e)))
+            with os.fdopen(write_fd, 'wb') as out:
+                out.write(data)
+        finally:
+            os._exit(0)
+    os.close(write_fd)
+    start = time.time()
+    chunks = []
+    try:
+        while True:
+            wait = None
+            if timeout is not None:
+                wait = max(start + timeout - time.time(), 0)
+            (ready, _, _) = select.select([read_fd], [], [], wait)
+            if not ready:
+                os.kill(pid, 9)
+                os.waitpid(pid, 0)
+                raise ChildTimeout(time.time() - start)
+            chunk = os.read(read_fd, 65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+    finally:
+        os.close(read_fd)
+    (_, status) = os.waitpid(pid, 0)
+    if not chunks:
+        raise ChildDied(status)
+    return pickle.loads(b''.join(chunks))
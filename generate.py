@@ -0,0 +1,171 @@
+"""
+Strategies for generating test inputs (see autograder.PropertyTest). A
+strategy makes random values of some kind, and knows how to shrink a value
+into simpler ones, so that a failing input can be cut down to a minimal
+one:
+
+    >>> strategy = Lists(Integers(0, 100), max_size = 5)
+    >>> strategy.example(random.Random(0))
+    [97, 53, 5]
+    >>> list(strategy.shrink([97, 53, 5]))[:4]
+    [[], [53, 5], [97, 5], [97, 53]]
+
+Strategies are plain objects, so tests that use them can be pickled (e.g.
+to run on a pool of worker processes).
+
+"""
+import random
+
+# Integers this close to their target shrink to every value in between,
+# rather than by halving the distance.
+CLOSE = 32
+
+
+class Strategy:
+    """
+    A Strategy is an abstract class that describes a kind of value.
+
+    """
+    def example(self, rng):
+        """Abstract method. Returns a value made with a random.Random."""
+        raise NotImplementedError("Cannot call .example() on abstract class.")
+
+    def shrink(self, value):
+        """
+        Generates simpler versions of a value, simplest first. Does not
+        generate any by default.
+
+        """
+        return iter(())
+
+
+class Integers(Strategy):
+    """Integers from low to high (inclusive), which shrink towards 0."""
+    def __init__(self, low, high):
+        self.low = low
+        self.high = high
+
+    def example(self, rng):
+        return rng.randint(self.low, self.high)
+
+    def shrink(self, value):
+        target = min(max(0, self.low), self.high)
+        distance = value - target
+        if abs(distance) <= CLOSE:
+            # Close enough to try everything in between.
+            step = 1 if distance > 0 else -1
+            for candidate in range(target, value, step):
+                yield candidate
+            return
+        while distance != 0:
+            yield value - distance
+            distance = int(distance / 2)
+
+
+class SampledFrom(Strategy):
+    """Values from a list, which shrink towards the front of the list."""
+    def __init__(self, values):
+        self.values = list(values)
+
+    def example(self, rng):
+        return rng.choice(self.values)
+
+    def shrink(self, value):
+        for candidate in self.values:
+            if candidate == value:
+                break
+            yield candidate
+
+
+class Lists(Strategy):
+    """
+    Lists of elements of another strategy, which shrink by losing elements
+    and then by shrinking the elements that are left.
+
+    """
+    def __init__(self, elements, min_size = 0, max_size = 10):
+        self.elements = elements
+        self.min_size = min_size
+        self.max_size = max_size
+
+    def example(self, rng):
+        size = rng.randint(self.min_size, self.max_size)
+        return [self.elements.example(rng) for _ in range(size)]
+
+    def shrink(self, value):
+        # Drop chunks of elements, halving the chunk size each time.
+        chunk = len(value) - self.min_size
+        while chunk > 0:
+            for start in range(0, len(value) - chunk + 1, chunk):
+                yield value[:start] + value[start + chunk:]
+            chunk //= 2
+        for (i, element) in enumerate(value):
+            for candidate in self.elements.shrink(element):
+                yield value[:i] + [candidate] + value[i + 1:]
+
+
+class Text(Strategy):
+    """
+    Strings of characters from an alphabet, which shrink like lists of
+    characters.
+
+    """
+    def __init__(self, alphabet = "abcdefghijklmnopqrstuvwxyz",
+                 min_size = 0, max_size = 10):
+        self.characters = Lists(SampledFrom(alphabet), min_size, max_size)
+
+    def example(self, rng):
+        return ''.join(self.characters.example(rng))
+
+    def shrink(self, value):
+        for candidate in self.characters.shrink(list(value)):
+            yield ''.join(candidate)
+
+
+class Tuples(Strategy):
+    """
+    Tuples with one element from each of several strategies, which shrink
+    one element at a time. A Tuples of one strategy per argument describes
+    the argument tuples of a function.
+
+    """
+    def __init__(self, *strategies):
+        self.strategies = strategies
+
+    def example(self, rng):
+        return tuple(strategy.example(rng) for strategy in self.strategies)
+
+    def shrink(self, value):
+        for (i, strategy) in enumerate(self.strategies):
+            for candidate in strategy.shrink(value[i]):
+                yield value[:i] + (candidate,) + value[i + 1:]
+
+
+def generate(strategy, count, seed = 0):
+    """Generates count values of a strategy, reproducibly for each seed."""
+    rng = random.Random(seed)
+    for _ in range(count):
+        yield strategy.example(rng)
+
+
+def shrink(strategy, value, fails, max_steps = 1000):
+    """
+    Shrinks a value for which fails(value) is True into a simpler one for
+    which it is still True, by repeatedly moving to the first simpler
+    candidate that still fails. Stops when no candidate fails, or after
+    max_steps candidates have been tried. Returns (value, steps).
+
+    """
+    steps = 0
+    improved = True
+    while improved and steps < max_steps:
+        improved = False
+        for candidate in strategy.shrink(value):
+            steps += 1
+            if fails(candidate):
+                value = candidate
+                improved = True
+                break
+            if steps >= max_steps:
+                break
+    return (value, steps)
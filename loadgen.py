@@ -0,0 +1,117 @@
+"""
+Measures the throughput and latency of a grading service (see service.py),
+by having it grade a directory of submissions over and over:
+
+    python service.py examples/functiontest/ta_digital_root.py \
+        examples/rostertest/spec.json --socket /tmp/grader.sock -j 4 &
+    python loadgen.py /tmp/grader.sock examples/rostertest/submissions \
+        -n 500 -c 32
+
+SUBMISSIONS is laid out as for roster.py. Requests are sent by CONCURRENCY
+clients at once, as fast as they are answered; submissions that the service
+turns away (because its queue is full) are counted, not retried.
+
+"""
+import argparse
+import concurrent.futures
+import itertools
+import json
+import math
+import os
+import sys
+import time
+from client import grade, ServiceError
+
+
+def percentile(values, fraction):
+    """Returns the value below which a fraction of the (sorted) values lie."""
+    if not values:
+        return None
+    index = max(int(math.ceil(fraction * len(values))) - 1, 0)
+    return values[index]
+
+
+def find_submissions(directory):
+    """
+    Lists the submissions in a directory as (student, path, module name)
+    triples, like roster.find_submissions (with the module name None for
+    subdirectories, so that the service uses its spec's).
+
+    """
+    submissions = []
+    for entry in sorted(os.listdir(directory)):
+        path = os.path.join(directory, entry)
+        if entry.startswith('.') or entry.startswith('__'):
+            continue
+        if os.path.isdir(path):
+            submissions.append((entry, path, None))
+        elif entry.endswith('.py'):
+            submissions.append((entry[:-len('.py')], directory, entry[:-len('.py')]))
+    return submissions
+
+
+def run_load(address, submissions, requests, concurrency):
+    """
+    Sends requests submissions (cycling through the list) from concurrency
+    clients at once, and returns a summary of the latencies (in seconds),
+    the throughput and the number of requests turned away or failed.
+
+    """
+    def send(submission):
+        (student, path, module_name) = submission
+        start = time.perf_counter()
+        try:
+            grade(address, student, path, module_name)
+        except ServiceError:
+            return ("rejected", time.perf_counter() - start)
+        except OSError:
+            return ("failed", time.perf_counter() - start)
+        return ("graded", time.perf_counter() - start)
+    work = list(itertools.islice(itertools.cycle(submissions), requests))
+    start = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(concurrency) as executor:
+        outcomes = list(executor.map(send, work))
+    elapsed = time.perf_counter() - start
+    latencies = sorted(latency for (outcome, latency) in outcomes
+                       if outcome == "graded")
+    return {"graded": len(latencies),
+            "rejected": sum(1 for (o, _) in outcomes if o == "rejected"),
+            "failed": sum(1 for (o, _) in outcomes if o == "failed"),
+            "elapsed": elapsed,
+            "throughput": len(latencies) / elapsed,
+            "p50": percentile(latencies, 0.5),
+            "p99": percentile(latencies, 0.99),
+            "max": latencies[-1] if latencies else None}
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(
+            description = "Measures the throughput of a grading service.")
+    parser.add_argument("address", help = "Unix socket path, or HOST:PORT")
+    parser.add_argument("submissions", help = "directory of submissions")
+    parser.add_argument("-n", "--requests", type = int, default = 100,
+                        help = "how many submissions to send")
+    parser.add_argument("-c", "--concurrency", type = int, default = 8,
+                        help = "how many clients send at once")
+    parser.add_argument("--json", action = "store_true",
+                        help = "print the summary as JSON")
+    args = parser.parse_args(argv)
+    submissions = find_submissions(args.submissions)
+    if not submissions:
+        sys.stderr.write("No submissions in {}.\n".format(args.submissions))
+        return 1
+    summary = run_load(args.address, submissions, args.requests,
+                       args.concurrency)
+    if args.json:
+        print(json.dumps(summary))
+    else:
+        print("{graded} graded, {rejected} turned away, {failed} failed "
+              "in {elapsed:.1f}s ({throughput:.1f} per second)".format(**summary))
+        if summary["graded"]:
+            print("latency: p50 {:.3f}s, p99 {:.3f}s, max {:.3f}s".format(
+                    summary["p50"], summary["p99"], summary["max"]))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
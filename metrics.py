@@ -0,0 +1,58 @@
+"""
+Measures the resources that the code under test uses. A test keeps one
+set of totals for each side ("ta" and "student"), which Measurement adds
+to every time that side's code runs:
+
+    {"calls": 1,           # how many times the code ran
+     "wall": 0.0012,       # wall-clock seconds
+     "cpu": 0.0011,        # CPU seconds
+     "peak_memory": 5120,  # largest peak of traced allocations, in bytes
+     "output": 176}        # characters of output captured
+
+See Autograder(profile = True).
+
+"""
+import time
+import tracemalloc
+
+
+def new_totals():
+    """Returns the totals of a side that has not run yet."""
+    return {"calls": 0, "wall": 0.0, "cpu": 0.0, "peak_memory": 0,
+            "output": 0}
+
+
+class Measurement:
+    """
+    A Measurement is a context manager that adds the wall-clock time, CPU
+    time and peak memory of the code it wraps to a dict of totals. Memory is
+    traced with tracemalloc, which slows the code down, so measurements are
+    only taken when profiling.
+
+    """
+    def __init__(self, totals):
+        self.totals = totals
+        self._started_tracing = False
+
+    def __enter__(self):
+        if tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+        else:
+            tracemalloc.start()
+            self._started_tracing = True
+        self._wall = time.perf_counter()
+        self._cpu = time.process_time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        wall = time.perf_counter() - self._wall
+        cpu = time.process_time() - self._cpu
+        (_, peak) = tracemalloc.get_traced_memory()
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+        self.totals["calls"] += 1
+        self.totals["wall"] += wall
+        self.totals["cpu"] += cpu
+        self.totals["peak_memory"] = max(self.totals["peak_memory"], peak)
+        return False
@@ -0,0 +1,202 @@
+import multiprocessing
+import time
+from multiprocessing.connection import wait
+
+
+class WorkerDied(Exception):
+    """
+    Raised for a task whose worker process exited before answering, with
+    the worker's exit code (negative if it was killed by a signal).
+
+    """
+    def __init__(self, exitcode = None):
+        Exception.__init__(self, "The grading process exited unexpectedly.")
+        self.exitcode = exitcode
+
+
+class WorkerTimeout(Exception):
+    """Raised for a task whose worker was killed for taking too long."""
+    def __init__(self, seconds):
+        Exception.__init__(self, "The task took more than {:.1f}s.".format(seconds))
+        self.seconds = seconds
+
+
+def _serve(conn, func, lifecycle = None):
+    """
+    The main loop of a worker process: receives tasks over its pipe,
+    and sends back either the value of func(task) or the exception that
+    it raised. A task of None tells the worker to exit.
+
+    Each reply goes with a flag that says whether the worker is retiring,
+    which it does after a task if lifecycle.retiring() says so. (The
+    lifecycle, if any, is also told when the worker starts and when it is
+    about to run a task.)
+
+    """
+    if lifecycle is not None:
+        lifecycle.start()
+    while True:
+        try:
+            task = conn.recv()
+        except EOFError:
+            break
+        if task is None:
+            break
+        if lifecycle is not None:
+            lifecycle.before_task()
+        try:
+            reply = func(task)
+        except Exception as e:
+            reply = e
+        retiring = lifecycle is not None and lifecycle.retiring()
+        try:
+            conn.send((reply, retiring))
+        except Exception as e:
+            # The reply could not be pickled.
+            conn.send((Exception(str(e)), retiring))
+        if retiring:
+            break
+    conn.close()
+
+
+class WorkerPool:
+    """
+    A WorkerPool is a fixed number of worker processes that apply the same
+    function to a stream of tasks.
+
+    Unlike multiprocessing.Pool, each worker has its own pipe, so the
+    pool can be torn down at any point (for instance, as soon as a test
+    has failed) without waiting for outstanding tasks and without leaving
+    a shared queue in an inconsistent state.
+
+    """
+
+    def __init__(self, func, size, lifecycle = None):
+        self.func = func
+        self.size = size
+        self.lifecycle = lifecycle
+        self.workers = []
+
+    def _spawn(self):
+        (parent_conn, child_conn) = multiprocessing.Pipe()
+        process = multiprocessing.Process(target=_serve,
+                                          args=(child_conn, self.func,
+                                                self.lifecycle))
+        process.daemon = True
+        process.start()
+        child_conn.close()
+        return (process, parent_conn)
+
+    def start(self):
+        """
+        Spawns all the workers now, rather than when the first tasks arrive.
+        
+        """
+        while len(self.workers) < self.size:
+            self.workers.append(self._spawn())
+
+    def imap(self, tasks, timeouts = None, deadline = None):
+        """
+        Applies the pool's function to each task, and generates the results
+        in the order of the tasks. A task that raised an exception generates
+        that exception as its result (rather than raising it).
+
+        This also acts as a watchdog: a worker that has spent longer than
+        timeouts[i] seconds (if given, and not None) on task i, or that is 
+        still busy at the given deadline (a time.time() value), is killed 
+        and replaced, and the task's result is a WorkerTimeout.
+
+        """
+        tasks = list(tasks)
+        while len(self.workers) < min(self.size, len(tasks)):
+            self.workers.append(self._spawn())
+        idle = list(self.workers)
+        busy = {}
+        try:
+            for value in self._imap(tasks, timeouts, deadline, idle, busy):
+                yield value
+        finally:
+            # If the consumer stopped early, the busy workers' answers 
+            # would be mistaken for those of the next tasks. They are not
+            # replaced here: the pool may be about to be torn down, and the
+            # next imap tops it up.
+            for (worker, _, _, _) in list(busy.values()):
+                worker[0].kill()
+                self._discard(worker)
+
+    def _imap(self, tasks, timeouts, deadline, idle, busy):
+        finished = {}
+        next_task = 0
+        next_result = 0
+        while next_result < len(tasks):
+            while idle and next_task < len(tasks):
+                worker = idle.pop()
+                worker[1].send(tasks[next_task])
+                expiry = deadline
+                if timeouts is not None and timeouts[next_task] is not None:
+                    expiry = min(expiry or float('inf'), 
+                                 time.time() + timeouts[next_task])
+                busy[worker[1]] = (worker, next_task, time.time(), expiry)
+                next_task += 1
+            if next_result in finished:
+                yield finished.pop(next_result)
+                next_result += 1
+                continue
+            expiries = [entry[3] for entry in busy.values() 
+                        if entry[3] is not None]
+            timeout = None
+            if expiries:
+                timeout = max(min(expiries) - time.time(), 0)
+            for conn in wait(list(busy), timeout):
+                (worker, index, _, _) = busy.pop(conn)
+                try:
+                    (value, retiring) = conn.recv()
+                except EOFError:
+                    worker[0].join()
+                    (value, retiring) = (WorkerDied(worker[0].exitcode), True)
+                if retiring:
+                    self._replace(worker)
+                    idle.append(self.workers[-1])
+                else:
+                    idle.append(worker)
+                finished[index] = value
+            now = time.time()
+            for (conn, (worker, index, started, expiry)) in list(busy.items()):
+                if expiry is not None and now >= expiry:
+                    del busy[conn]
+                    worker[0].kill()
+                    self._replace(worker)
+                    idle.append(self.workers[-1])
+                    finished[index] = WorkerTimeout(now - started)
+
+    def _discard(self, worker):
+        """Removes a worker that has died (or been killed) from the pool."""
+        self.workers.remove(worker)
+        worker[1].close()
+        worker[0].join()
+
+    def _replace(self, worker):
+        """Replaces a worker that has died with a fresh one."""
+        self._discard(worker)
+        self.workers.append(self._spawn())
+
+    def terminate(self):
+        """Kills all workers immediately."""
+        for (process, conn) in self.workers:
+            process.terminate()
+        for (process, conn) in self.workers:
+            process.join()
+            conn.close()
+        self.workers = []
+
+    def close(self):
+        """Asks all workers to exit once they are idle."""
+        for (process, conn) in self.workers:
+            try:
+                conn.send(None)
+            except OSError:
+                pass
+        for (process, conn) in self.workers:
+            process.join()
+            conn.close()
+        self.workers = []
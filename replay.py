@@ -0,0 +1,196 @@
+"""
+Replays the results of submissions that have been graded before. Students
+often resubmit a file that is unchanged, or changed only in its comments or
+layout; grading it again would give the same log and score, so a
+ReplayCache remembers the log of each graded submission, and the
+Autograder replays it instead (see Autograder(replay = ...)).
+
+A submission is identified by the normalised syntax trees of its modules
+(and of the modules and packages they import from the same directory), so
+comments and whitespace do not matter. The key also covers the test suite, the TA's
+modules and the settings of the Autograder, so changing any of them
+regrades everything.
+
+"""
+import ast
+import hashlib
+import importlib.util
+import json
+import os
+import pickle
+from cache import ResultCache
+
+
+# Attributes of a TestCase that do not affect its result.
+VOLATILE = ["notes", "metrics", "profile", "cache", "_snapshot"]
+
+
+def ast_hash(path, seen = None, root = None):
+    """
+    Returns a hash of the syntax tree of a Python file (which ignores
+    comments and layout), combined with those of the modules it imports
+    from root (by default, its own directory), which is where its absolute
+    imports are looked for. Returns None if the file cannot be parsed.
+
+    """
+    if seen is None:
+        seen = set()
+    path = os.path.abspath(path)
+    if root is None:
+        root = os.path.dirname(path)
+    if path in seen:
+        return ''
+    seen.add(path)
+    try:
+        with open(path, 'rb') as source:
+            tree = ast.parse(source.read(), path)
+    except (OSError, SyntaxError, ValueError):
+        return None
+    digest = hashlib.sha256(ast.dump(tree).encode('utf-8'))
+    for local_path in _local_imports(tree, os.path.dirname(path), root):
+        local_hash = ast_hash(local_path, seen, root)
+        if local_hash is None:
+            return None
+        digest.update(local_hash.encode('utf-8'))
+    return digest.hexdigest()
+
+
+def _local_imports(tree, directory, root):
+    """
+    Lists the files under root that the syntax tree (of a file in
+    directory) imports: modules, and the __init__.py files and modules of
+    packages, whether they are imported by a dotted name, from their
+    package, or relatively.
+
+    """
+    names = []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names.extend((root, alias.name) for alias in node.names)
+        elif isinstance(node, ast.ImportFrom):
+            base = root
+            if node.level:
+                base = directory
+                for _ in range(node.level - 1):
+                    base = os.path.dirname(base)
+            prefix = ''
+            if node.module:
+                names.append((base, node.module))
+                prefix = node.module + '.'
+            # What is imported from a package may be one of its modules.
+            names.extend((base, prefix + alias.name) for alias in node.names
+                         if alias.name != '*')
+    paths = []
+    for (base, name) in names:
+        for path in _module_files(base, name):
+            if path not in paths:
+                paths.append(path)
+    return sorted(paths)
+
+
+def _module_files(base, name):
+    """
+    Lists the files in base that importing a dotted module name runs (e.g.
+    pkg/__init__.py and pkg/helper.py for pkg.helper).
+
+    """
+    files = []
+    stem = base
+    for part in name.split('.'):
+        stem = os.path.join(stem, part)
+        for path in [stem + '.py', os.path.join(stem, '__init__.py')]:
+            if os.path.isfile(path):
+                files.append(path)
+    return files
+
+
+def module_hash(module_name):
+    """
+    Returns the ast_hash of the named module, or None if it has no source
+    file.
+
+    """
+    try:
+        spec = importlib.util.find_spec(module_name)
+    except (ImportError, ValueError):
+        return None
+    if spec is None or not spec.origin or not os.path.isfile(spec.origin):
+        return None
+    # The directory the module was found in, above its packages.
+    root = os.path.dirname(spec.origin)
+    depth = module_name.count('.')
+    if spec.submodule_search_locations is not None:
+        depth += 1
+    for _ in range(depth):
+        root = os.path.dirname(root)
+    return ast_hash(spec.origin, root = root)
+
+
+def suite_hash(tests):
+    """
+    Returns a hash of a list of TestCases (their types and settings), or
+    None if they cannot be hashed (e.g. because one holds a lambda).
+
+    """
+    digest = hashlib.sha256()
+    for test in tests:
+        fields = {name: value for (name, value) in test.__dict__.items()
+                  if name not in VOLATILE}
+        try:
+            data = pickle.dumps((type(test).__name__, sorted(fields.items())),
+                                protocol = 4)
+        except Exception:
+            return None
+        digest.update(data)
+    return digest.hexdigest()
+
+
+class ReplayCache(ResultCache):
+    """
+    A ReplayCache keeps the logs of graded submissions on disk (in the same
+    way as a ResultCache keeps the TA's results), keyed by the submission,
+    the tests and the grading settings.
+
+    """
+
+    def submission_key(self, tests, settings):
+        """
+        Returns the key under which the result of running tests with the
+        given settings (anything that can be turned into JSON) on the
+        modules that they test is stored, or None if there cannot be one.
+
+        """
+        module_names = set()
+        for test in tests:
+            if not getattr(test, 'replayable', True):
+                return None
+            for attribute in ["student_module_name", "client_module_name"]:
+                if hasattr(test, attribute):
+                    module_names.add(getattr(test, attribute))
+            if (getattr(test, 'golden', None) is None
+                    and hasattr(test, "ta_module_name")):
+                module_names.add(test.ta_module_name)
+        parts = [suite_hash(tests), json.dumps(settings, sort_keys = True)]
+        for name in sorted(module_names):
+            parts.append(name)
+            parts.append(module_hash(name))
+        if None in parts:
+            return None
+        return hashlib.sha256('\0'.join(parts).encode('utf-8')).hexdigest()
+
+    def lookup(self, key):
+        """Returns the record stored under key, or None if there is none."""
+        path = os.path.join(self.directory, key)
+        try:
+            with open(path, 'rb') as entry:
+                record = pickle.load(entry)
+            os.utime(path)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return record
+
+    def store(self, key, record):
+        """Stores a record under key."""
+        self._store(os.path.join(self.directory, key), record)
@@ -4,6 +4,16 @@ class TestResult:
     running an autograder.TestCase.
     
     """
+    # Remarks for the student that do not change the verdict (see warn).
+    warnings = ()
+    # Whether running the same code again is bound to give the same result
+    # (see Autograder.run and replay.py).
+    replayable = True
+
+    def warn(self, message):
+        """Adds a remark for the student that does not change the verdict."""
+        self.warnings = list(self.warnings) + [message]
+
     def passedTest(self):
         """Returns whether the program submission passed the TestCase."""
         return NotImplementedError("Cannot call .passedTest() on abstract class TestResult.")
@@ -27,9 +37,15 @@ class IncorrectResult(TestResult):
 
 
 class ProgramCrash(IncorrectResult):
-    """Indicates that the submission raised an unexpected exception."""     
-    def __init__(self, exception):
+    """
+    Indicates that the submission raised an unexpected exception. (One
+    that is not replayable stands for the loss of the process that ran the
+    test.)
+    
+    """     
+    def __init__(self, exception, replayable = True):
         self.exception = exception
+        self.replayable = replayable
         
     def __str__(self):
         result = "---------------\n"
@@ -37,6 +53,94 @@ class ProgramCrash(IncorrectResult):
         result += "---------------\n"
         return result
 
+class OutputLimitExceeded(IncorrectResult):
+    """Indicates that the submission printed more output than is allowed."""     
+    def __init__(self, limit):
+        self.limit = limit
+        
+    def __str__(self):
+        result = "---------------\n"
+        result += "OUTPUT LIMIT EXCEEDED!\n"
+        result += "Your program printed more than {} characters. ".format(self.limit)
+        result += "Check for a print statement inside a loop that never ends.\n"
+        result += "---------------\n"
+        return result
+
+class TimeLimitExceeded(IncorrectResult):
+    """Indicates that the submission ran for longer than is allowed."""     
+    # It might not run out of time on another try.
+    replayable = False
+
+    def __init__(self, limit, kind = "wall-clock"):
+        self.limit = limit
+        self.kind = kind
+        
+    def __str__(self):
+        result = "---------------\n"
+        result += "TIME LIMIT EXCEEDED!\n"
+        if self.kind == "total":
+            result += "Your program used up the time allowed for the whole submission. "
+        else:
+            result += "Your program used more than {} seconds of {} time. ".format(
+                    self.limit, self.kind)
+        result += "Check for a loop that never ends.\n"
+        result += "---------------\n"
+        return result
+
+class MemoryLimitExceeded(IncorrectResult):
+    """
+    Indicates that the submission ran out of memory (limit, in bytes, is 
+    the memory that it was allowed, or None if that is not known).
+    
+    """
+    # The memory a test gets depends on what else the process holds.
+    replayable = False
+
+    def __init__(self, limit = None):
+        self.limit = limit
+        
+    def __str__(self):
+        result = "---------------\n"
+        result += "MEMORY LIMIT EXCEEDED!\n"
+        if self.limit is None:
+            result += "Your program ran out of memory. "
+        else:
+            result += "Your program used more than {} MB of memory. ".format(
+                    self.limit // (1024 * 1024))
+        result += "Check for a list or string that grows without end.\n"
+        result += "---------------\n"
+        return result
+
+class WorkerCrash(IncorrectResult):
+    """
+    Indicates that the submission brought down the process that ran it, 
+    e.g. by calling sys.exit() or by crashing the interpreter (exitcode is
+    that of the process: negative if it was killed by a signal).
+    
+    """
+    # The process may have been killed from outside (e.g. for memory).
+    replayable = False
+
+    def __init__(self, exitcode = None):
+        self.exitcode = exitcode
+        
+    def __str__(self):
+        result = "---------------\n"
+        result += "PROGRAM EXITED!\n"
+        if self.exitcode is not None and self.exitcode < 0:
+            result += "Your program was killed by signal {} (it may have " \
+                      "crashed Python, or started too many processes).\n" \
+                      .format(-self.exitcode)
+        else:
+            if self.exitcode is not None:
+                result += "Your program exited with status {} before the " \
+                          "test finished. ".format(self.exitcode)
+            else:
+                result += "Your program stopped before the test finished. "
+            result += "Check for calls to sys.exit() or exit().\n"
+        result += "---------------\n"
+        return result
+
 class InterfaceDiscrepancy(IncorrectResult):
     """
     Indicates that the submission did not define all expected functions
@@ -92,3 +196,132 @@ class ReturnValueDiscrepancy(IncorrectResult):
         result += "---------------\n"
         return result
 
+
+class PerformanceDiscrepancy(IncorrectResult):
+    """
+    Indicates that the submission gave the expected results, but took far
+    longer than the TA's code: either its running time grows faster with
+    the size of the input ("scaling"), or it is slower by too large a 
+    constant factor ("constant").
+    
+    """    
+    def __init__(self, kind, size, ratio, ta_exponent = None, 
+                 student_exponent = None):
+        self.kind = kind
+        self.size = size
+        self.ratio = ratio
+        self.ta_exponent = ta_exponent
+        self.student_exponent = student_exponent
+        
+    def __str__(self):
+        result = "---------------\n"
+        result += "TOO SLOW!\n"
+        if self.kind == "scaling":
+            result += "The running time of your program grows like n^{:.1f}, ".format(
+                    self.student_exponent)
+            result += "but ours grows like n^{:.1f}. ".format(self.ta_exponent)
+        result += "On an input of size {}, your program took {:.1f} times as long as ours. ".format(
+                self.size, self.ratio)
+        result += "Look for a more efficient approach.\n"
+        result += "---------------\n"
+        return result
+
+
+class Counterexample(IncorrectResult):
+    """
+    Indicates that the submission gave an unexpected result on a generated
+    input. The input is the smallest failing one that shrinking found.
+    
+    """    
+    def __init__(self, call, expected_retval, student_retval, tried):
+        self.call = call
+        self.expected_retval = expected_retval
+        self.student_retval = student_retval
+        self.tried = tried
+        
+    def __str__(self):
+        result = "---------------\n"
+        result += "ERROR ON A GENERATED INPUT!\n"
+        result += "  FAILING INPUT (FOUND AFTER {} TRIES): {}\n".format(self.tried, self.call)
+        result += "  WE EXPECTED: {}\n".format(self.expected_retval)
+        result += "  WE RECEIVED: {}\n".format(self.student_retval)
+        result += "---------------\n"
+        return result
+
+
+class ElementDiscrepancy(IncorrectResult):
+    """
+    Indicates that part of the return value of a function call differed 
+    from the expected output. Only the first differing part is reported,
+    since the whole values may be very large.
+    
+    """    
+    def __init__(self, location, expected_part, student_part):
+        self.location = location
+        self.expected_part = expected_part
+        self.student_part = student_part
+        
+    def __str__(self):
+        result = "---------------\n"
+        result += "ERROR IN THE RETURN VALUE, AT {}!\n".format(self.location)
+        result += "  WE EXPECTED: {}\n".format(_abbreviate(self.expected_part))
+        result += "  WE RECEIVED: {}\n".format(_abbreviate(self.student_part))
+        result += "---------------\n"
+        return result
+
+
+def _abbreviate(value, limit = 200):
+    """Returns str(value), cut short if it is longer than limit characters."""
+    text = str(value)
+    if len(text) > limit:
+        text = text[:limit] + "... ({} characters in all)".format(len(text))
+    return text
+
+
+class OutputDiff(IncorrectResult):
+    """
+    Indicates that the submission's output differed from the expected 
+    output, listing each place where it differed (as a hunk of a line diff),
+    so that a student can fix them all at once. Each hunk is a tuple
+    (expected line number, expected lines, received line number, received
+    lines). If complete is False, the outputs differed in too many places
+    to list, and only the first is given.
+    
+    """     
+    # How many hunks are shown, and how many lines of each.
+    MAX_HUNKS = 10
+    MAX_LINES = 5
+
+    def __init__(self, hunks, complete = True):
+        self.hunks = hunks
+        self.complete = complete
+        
+    def __str__(self):
+        result = "---------------\n"
+        if not self.complete:
+            result += "THE OUTPUT DIFFERS IN TOO MANY PLACES TO LIST. HERE IS THE FIRST.\n"
+        elif len(self.hunks) == 1:
+            result += "THE OUTPUT DIFFERS IN 1 PLACE.\n"
+        else:
+            result += "THE OUTPUT DIFFERS IN {} PLACES.\n".format(len(self.hunks))
+        for hunk in self.hunks[:OutputDiff.MAX_HUNKS]:
+            (expected_line, expected, student_line, received) = hunk
+            result += "  AT LINE {} WE EXPECTED:\n{}".format(
+                    expected_line, OutputDiff._lines(expected))
+            result += "  AT LINE {} WE RECEIVED:\n{}".format(
+                    student_line, OutputDiff._lines(received))
+        if len(self.hunks) > OutputDiff.MAX_HUNKS:
+            result += "  ...AND {} MORE.\n".format(
+                    len(self.hunks) - OutputDiff.MAX_HUNKS)
+        result += "---------------\n"
+        return result
+
+    @staticmethod
+    def _lines(lines):
+        if not lines:
+            return "(nothing)\n"
+        shown = ''.join(line + "\n" for line in lines[:OutputDiff.MAX_LINES])
+        if len(lines) > OutputDiff.MAX_LINES:
+            shown += "(and {} more lines)\n".format(
+                    len(lines) - OutputDiff.MAX_LINES)
+        return shown
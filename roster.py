@@ -0,0 +1,348 @@
+"""
+Grades a whole directory of student submissions in one process tree.
+
+    python roster.py TA_MODULE SPEC SUBMISSIONS [-o grades.jsonl] [-j 4]
+
+TA_MODULE is the path of the TA's module (for an InterfaceTest, the client
+module), or of a golden bundle compiled from it by bundle.py. SPEC is a JSON file describing the test batch, e.g.:
+
+    {"test": "FunctionTest",
+     "student_module": "digital_root",
+     "function_name": "digital_root",
+     "pub_inputs": [[1729], [356]],
+     "priv_inputs": [[5000], [12345678], [1], [0]],
+     "max_score": 20}
+
+The spec may also set "time_limit" and "cpu_limit" (in seconds, for each
+test) and "submission_time_limit" (for all the tests of a submission),
+"fork": true to run each test in a forked process and "profile": true to
+include the metrics of each test in the records (see Autograder). With
+"sandbox": true (or a dict of sandbox.Limits), the student code runs on
+a pool of sandbox workers under resource limits, and the submissions are
+graded one after another in the parent process; large test inputs reach
+the workers through shared memory (see transport.py). For a
+FunctionTest, "rel_tol" and "abs_tol" let float results match within a
+tolerance (see comparators.Close). For a FunctionStdoutTest or an
+InteractiveTest, "full_diff": true reports every difference in the output.
+
+Each subdirectory of SUBMISSIONS is one student's submission, containing
+the module named by "student_module". Alternatively, each .py file in
+SUBMISSIONS is a submission on its own, named after the file.
+
+One JSON record (the log of Autograder.finalize, plus the student's name)
+is written per submission. The TA module and the autograder are imported
+once in the parent process; submissions are graded on a pool of worker
+processes that inherit them.
+
+With --state DB, the students' attempts are counted in an SQLite database
+(see state.py), rather than read from a data file in each submission's
+directory.
+
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from autograder import Autograder, DATA_FILE
+from autograder import FunctionTest, FunctionStdoutTest
+from autograder import InteractiveTest, InterfaceTest
+from bundle import load_bundle, for_student
+from cache import ResultCache, MemoryCache
+from comparators import Close
+from pool import WorkerPool
+from sanity import fingerprint
+from replay import ReplayCache
+from sandbox import SandboxPool, Limits
+from transport import Transport
+from state import DeferredState, SQLiteState
+
+
+# How many records grade_roster collects before counting their attempts in
+# a state store (in one transaction).
+STATE_BATCH = 64
+
+
+def _as_tuples(inputs):
+    return [tuple(inp) for inp in inputs]
+
+
+def build_tests(spec, ta_module_name, student_module_name, cache = None):
+    """
+    Creates the batch of TestCases described by a spec (a dict loaded from
+    a JSON spec file) for a particular student module. The cache (if any)
+    is a cache.ResultCache for the results of the TA module.
+
+    """
+    kind = spec["test"]
+    pub_inputs = spec.get("pub_inputs", [])
+    priv_inputs = spec.get("priv_inputs", [])
+    limits = {"time_limit": spec.get("time_limit"),
+              "cpu_limit": spec.get("cpu_limit")}
+    if kind == "FunctionTest":
+        comparator = None
+        if "rel_tol" in spec or "abs_tol" in spec:
+            comparator = Close(spec.get("rel_tol", 1e-9), 
+                               spec.get("abs_tol", 0.0))
+        return FunctionTest.create_batch(ta_module_name, student_module_name,
+                                         spec["function_name"],
+                                         _as_tuples(pub_inputs),
+                                         _as_tuples(priv_inputs), cache,
+                                         comparator = comparator, **limits)
+    elif kind == "FunctionStdoutTest":
+        return FunctionStdoutTest.create_batch(ta_module_name,
+                                               student_module_name,
+                                               spec["function_name"],
+                                               _as_tuples(pub_inputs),
+                                               _as_tuples(priv_inputs), cache,
+                                               full_diff = spec.get("full_diff", False),
+                                               **limits)
+    elif kind == "InteractiveTest":
+        return InteractiveTest.create_batch(ta_module_name, student_module_name,
+                                            pub_inputs, priv_inputs, cache,
+                                            full_diff = spec.get("full_diff", False),
+                                            **limits)
+    elif kind == "InterfaceTest":
+        return InterfaceTest.create_batch(ta_module_name,
+                                          spec["function_name"],
+                                          _as_tuples(pub_inputs),
+                                          spec.get("pub_outputs", []),
+                                          _as_tuples(priv_inputs),
+                                          spec.get("priv_outputs", []),
+                                          **limits)
+    else:
+        raise ValueError("Unknown test type in spec: {}".format(kind))
+
+
+def find_submissions(directory, student_module_name):
+    """
+    Lists the submissions in a directory, as (student, path, module name)
+    triples, where path is the directory the module is imported from.
+
+    """
+    submissions = []
+    for entry in sorted(os.listdir(directory)):
+        path = os.path.join(directory, entry)
+        if entry.startswith('.') or entry.startswith('__'):
+            continue
+        if os.path.isdir(path):
+            submissions.append((entry, path, student_module_name))
+        elif entry.endswith('.py'):
+            module_name = entry[:-len('.py')]
+            submissions.append((module_name, directory, module_name))
+    return submissions
+
+
+def _forget_modules(directory):
+    """
+    Removes every module that was imported from the given directory from
+    sys.modules, so that the next submission gets its own copies.
+
+    """
+    directory = os.path.abspath(directory)
+    for (name, module) in list(sys.modules.items()):
+        filename = getattr(module, '__file__', None)
+        if filename and os.path.dirname(os.path.abspath(filename)) == directory:
+            del sys.modules[name]
+
+
+def grade_submission(task):
+    """
+    Grades one submission, and returns its record. The task is a tuple
+    (setup, student, path, student module name), where setup is the dict
+    made by make_setup.
+
+    """
+    (setup, student, path, module_name) = task
+    spec = setup["spec"]
+    _forget_modules(path)
+    # A module of the same name may have been imported from elsewhere.
+    sys.modules.pop(module_name, None)
+    sys.path.insert(0, path)
+    try:
+        if setup["bundle"] is not None:
+            tests = for_student(setup["bundle"], module_name)
+        else:
+            tests = build_tests(spec, setup["ta_module_name"], module_name, 
+                                setup["cache"])
+        state = None
+        if setup["state"] is not None:
+            # The parent counts the attempts, in batches (see grade_roster).
+            state = DeferredState(setup["state"])
+        autograder = Autograder(spec.get("max_score", 20), echo = False,
+                                data_file = os.path.join(path, DATA_FILE),
+                                state = state, student = student,
+                                assignment = setup["assignment"],
+                                time_limit = spec.get("submission_time_limit"),
+                                fork = spec.get("fork", False),
+                                profile = spec.get("profile", False),
+                                replay = setup["replay"],
+                                sandbox = setup["sandbox"],
+                                transport = setup["transport"])
+        autograder.run(tests)
+    finally:
+        sys.path.remove(path)
+        _forget_modules(path)
+    record = {"student": student}
+    record.update(autograder.log)
+    return record
+
+
+def make_setup(ta_path, spec, cache = None, replay = None, state = None,
+               assignment = None):
+    """
+    Returns the setup that grade_submission needs for grading against a 
+    TA module (or bundle) and a spec, with the TA module imported. The
+    other arguments are as for grade_roster; without a cache, the TA's
+    results are kept in a cache.MemoryCache.
+
+    """
+    if cache is None:
+        cache = MemoryCache()
+    setup = {"spec": spec, "cache": cache, "bundle": None, 
+             "ta_module_name": None, "replay": replay, "state": state,
+             "assignment": assignment, "sandbox": None, "transport": None}
+    if ta_path.endswith(".bundle"):
+        setup["bundle"] = load_bundle(ta_path)
+    else:
+        ta_path = os.path.abspath(ta_path)
+        if os.path.dirname(ta_path) not in sys.path:
+            sys.path.insert(0, os.path.dirname(ta_path))
+        setup["ta_module_name"] = os.path.splitext(os.path.basename(ta_path))[0]
+        if spec["test"] != "InteractiveTest":
+            # Imported here, so that forked workers share it. (Interactive
+            # scripts do their work when imported, so they are left alone.)
+            ta_module = __import__(setup["ta_module_name"])
+            if spec["test"] == "FunctionTest":
+                # So is the summary its interface is checked against.
+                fingerprint(ta_module)
+    return setup
+
+
+def grade_roster(ta_path, spec, directory, out, workers = 1, cache = None,
+                 replay = None, state = None, assignment = None):
+    """
+    Grades every submission in a directory, writing one JSON record per
+    line to the file out. Returns the number of submissions graded.
+    
+    The results of the TA module are computed once per worker process
+    and shared by the submissions it grades; if a cache.ResultCache is
+    given, they are shared by all the submissions (and later runs).
+    If ta_path is a bundle (see bundle.py), the TA module is not used at all.
+    If a replay.ReplayCache is given, submissions that were graded before 
+    (and have not changed since) are not graded again.
+    
+    If a state.StateStore is given, each student's attempts at the
+    assignment are loaded from it and counted in it (STATE_BATCH records 
+    at a time), instead of in the data file of each submission's directory.
+
+    """
+    setup = make_setup(ta_path, spec, cache, replay, state, assignment)
+    submissions = find_submissions(directory, spec.get("student_module"))
+    tasks = [(setup, student, path, module_name)
+             for (student, path, module_name) in submissions]
+    if spec.get("sandbox"):
+        # The student code is isolated on the sandbox's workers, so the
+        # submissions themselves need no pool.
+        limits = spec["sandbox"] if isinstance(spec["sandbox"], dict) else {}
+        setup["sandbox"] = SandboxPool(workers, Limits(**limits))
+        setup["transport"] = Transport()
+        records = (grade_submission(task) for task in tasks)
+    elif workers <= 1:
+        records = (grade_submission(task) for task in tasks)
+    else:
+        pool = WorkerPool(grade_submission, workers)
+        records = pool.imap(tasks)
+    pending = []
+    try:
+        for (task, record) in zip(tasks, records):
+            if isinstance(record, Exception):
+                record = {"student": task[1], "error": str(record)}
+            pending.append(record)
+            if state is None or len(pending) >= STATE_BATCH:
+                _write_records(pending, out, state, assignment)
+                pending = []
+    finally:
+        if pending:
+            _write_records(pending, out, state, assignment)
+        if setup["sandbox"] is not None:
+            setup["sandbox"].terminate()
+            setup["transport"].close()
+        elif workers > 1:
+            pool.close()
+    return len(tasks)
+
+
+def count_attempts(records, state, assignment):
+    """
+    Counts the graded attempts among a list of records (made by 
+    grade_submission with a DeferredState) in a state store, in one batch,
+    and updates their attempt numbers.
+
+    """
+    graded = [record for record in records if "error" not in record]
+    counted = state.record_many([(record["student"], assignment, 
+                                  record["score_sum"])
+                                 for record in graded])
+    for (record, data) in zip(graded, counted):
+        record["info"]["attempts"] = data["attempts"]
+
+
+def _write_records(records, out, state, assignment):
+    """
+    Writes records to out, first counting the graded attempts among them
+    in the state store (if any).
+
+    """
+    if state is not None:
+        count_attempts(records, state, assignment)
+    for record in records:
+        out.write(json.dumps(record) + "\n")
+    out.flush()
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(
+            description = "Grades a directory of student submissions.")
+    parser.add_argument("ta_module", help = "path of the TA's module")
+    parser.add_argument("spec", help = "JSON file describing the tests")
+    parser.add_argument("submissions", help = "directory of submissions")
+    parser.add_argument("-o", "--output",
+                        help = "JSON-lines file to write (default: stdout)")
+    parser.add_argument("-j", "--workers", type = int,
+                        default = os.cpu_count() or 1,
+                        help = "number of worker processes")
+    parser.add_argument("--cache", 
+                        help = "directory in which to cache the TA's results")
+    parser.add_argument("--state",
+                        help = "SQLite database of the students' attempts "
+                               "(default: a data file in each submission)")
+    parser.add_argument("--assignment",
+                        help = "name of the assignment in the --state database "
+                               "(default: the name of the spec file)")
+    parser.add_argument("--replay",
+                        help = "directory in which to keep the logs of graded "
+                               "submissions, to replay for unchanged ones")
+    args = parser.parse_args(argv)
+    with open(args.spec) as spec_file:
+        spec = json.load(spec_file)
+    out = open(args.output, 'w') if args.output else sys.stdout
+    start = time.time()
+    try:
+        cache = ResultCache(args.cache) if args.cache else None
+        replay = ReplayCache(args.replay) if args.replay else None
+        state = SQLiteState(args.state) if args.state else None
+        assignment = args.assignment or os.path.splitext(
+                os.path.basename(args.spec))[0]
+        count = grade_roster(args.ta_module, spec, args.submissions, out,
+                             args.workers, cache, replay, state, assignment)
+    finally:
+        if args.output:
+            out.close()
+    elapsed = time.time() - start
+    sys.stderr.write("Graded {} submissions in {:.1f}s ({:.1f} per minute).\n"
+                     .format(count, elapsed, 60 * count / max(elapsed, 1e-9)))
+
+
+if __name__ == "__main__":
+    main()
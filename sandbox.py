@@ -0,0 +1,196 @@
+"""
+Runs student code on a pool of pre-spawned worker processes that live under
+resource limits, so that a fork bomb, a memory hog or a call of sys.exit()
+costs a worker rather than the grader (see Autograder(sandbox = ...)):
+
+    sandbox = SandboxPool(4, Limits(memory = 256 * 1024 * 1024))
+    Autograder(sandbox = sandbox).run(tests)
+
+Each worker limits (with setrlimit) its CPU time per test, its address
+space, its open files and the processes that its user may have. A test
+that runs out of memory gets a MemoryLimitExceeded result, a test that
+uses up its CPU time a TimeLimitExceeded, and one that kills its worker
+(say, by exiting, or by crashing the interpreter) a WorkerCrash; the worker
+is replaced, and grading carries on.
+
+Workers are recycled after max_tests tests, or once they have used
+recycle_memory bytes more than when they started, so that what one submission leaves behind does
+not pile up. The pool can be kept for many submissions (e.g. by a grading
+service); each submission starts from the modules that were imported when
+its worker was spawned.
+
+"""
+import importlib
+import math
+import resource
+import signal
+import sys
+from autograder import _run_test
+from pool import WorkerPool, WorkerDied
+from result import MemoryLimitExceeded, TimeLimitExceeded, WorkerCrash
+
+
+MEGABYTE = 1024 * 1024
+
+# The default limits of a worker: CPU seconds per test, memory (address
+# space beyond what the worker had when it started), open files and
+# processes (of the user running the grader).
+CPU_SECONDS = 10
+MEMORY = 512 * MEGABYTE
+OPEN_FILES = 64
+PROCESSES = 256
+
+# When a worker is replaced with a fresh one.
+MAX_TESTS = 100
+RECYCLE_MEMORY = 256 * MEGABYTE
+
+
+class Limits:
+    """The resource limits of a sandbox worker (None means no limit)."""
+    def __init__(self, cpu_seconds = CPU_SECONDS, memory = MEMORY,
+                 open_files = OPEN_FILES, processes = PROCESSES):
+        self.cpu_seconds = cpu_seconds
+        self.memory = memory
+        self.open_files = open_files
+        self.processes = processes
+
+
+def _address_space():
+    """Returns the size of this process's address space, or 0 if unknown."""
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmSize:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return 0
+
+
+def _set_limit(kind, limit):
+    """Lowers a resource limit (it is left alone if it is already lower)."""
+    (_, hard) = resource.getrlimit(kind)
+    if hard != resource.RLIM_INFINITY:
+        limit = min(limit, hard)
+    try:
+        resource.setrlimit(kind, (limit, limit))
+    except (ValueError, OSError):
+        pass
+
+
+def _peak_memory():
+    # ru_maxrss is in kilobytes (on Linux).
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _cpu_used():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+# In a worker: the modules it started with, and the submission it last ran
+# a test of.
+_base_modules = None
+_submission = None
+
+
+class Sandbox:
+    """
+    The lifecycle of a sandbox worker (see pool._serve): sets its limits
+    when it starts and before each test, and retires it when it has run
+    max_tests tests or its peak memory has grown by more than 
+    recycle_memory bytes.
+
+    """
+    def __init__(self, limits, max_tests = MAX_TESTS,
+                 recycle_memory = RECYCLE_MEMORY):
+        self.limits = limits
+        self.max_tests = max_tests
+        self.recycle_memory = recycle_memory
+        self.tests = 0
+        self.start_memory = 0
+
+    def start(self):
+        global _base_modules
+        _base_modules = set(sys.modules)
+        self.start_memory = _peak_memory()
+        limits = self.limits
+        if limits.memory is not None:
+            _set_limit(resource.RLIMIT_AS, _address_space() + limits.memory)
+        if limits.open_files is not None:
+            _set_limit(resource.RLIMIT_NOFILE, limits.open_files)
+        if limits.processes is not None:
+            _set_limit(resource.RLIMIT_NPROC, limits.processes)
+        if limits.cpu_seconds is not None:
+            # The hard limit covers every test the worker may run; the soft
+            # one is moved on before each test.
+            _set_limit(resource.RLIMIT_CPU,
+                       int(math.ceil(_cpu_used() + 1 +
+                                     limits.cpu_seconds * self.max_tests)))
+
+    def before_task(self):
+        if self.limits.cpu_seconds is not None:
+            (_, hard) = resource.getrlimit(resource.RLIMIT_CPU)
+            soft = int(math.ceil(_cpu_used() + self.limits.cpu_seconds))
+            if hard != resource.RLIM_INFINITY:
+                soft = min(soft, hard)
+            resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+
+    def retiring(self):
+        self.tests += 1
+        return (self.tests >= self.max_tests or 
+                _peak_memory() - self.start_memory > self.recycle_memory)
+
+
+def _run_sandboxed_test(task):
+    """
+    Runs a (TestCase, deadline, sys.path, submission) task for _run_test in
+    a sandbox worker. When the submission changes, the modules imported for
+    the last one are forgotten, and sys.path is set to the grader's.
+
+    """
+    global _submission
+    (test, deadline, path, submission) = task
+    if submission != _submission:
+        for name in set(sys.modules) - _base_modules:
+            del sys.modules[name]
+        sys.path[:] = path
+        importlib.invalidate_caches()
+        _submission = submission
+    return _run_test(test, deadline)
+
+
+class SandboxPool(WorkerPool):
+    """
+    A SandboxPool is a WorkerPool of size sandbox workers (see the module's
+    docstring), which are spawned at once. Its imap generates the replies
+    of _run_test, with the deaths of workers turned into TestResults.
+
+    """
+
+    def __init__(self, size = 1, limits = None, max_tests = MAX_TESTS,
+                 recycle_memory = RECYCLE_MEMORY):
+        self.limits = limits or Limits()
+        WorkerPool.__init__(self, _run_sandboxed_test, size,
+                            Sandbox(self.limits, max_tests, recycle_memory))
+        self.start()
+
+    def imap(self, tasks, timeouts = None, deadline = None):
+        replies = WorkerPool.imap(self, tasks, timeouts, deadline)
+        try:
+            for reply in replies:
+                if isinstance(reply, WorkerDied):
+                    reply = (self.crash_result(reply.exitcode), [], {})
+                elif (not isinstance(reply, Exception) and
+                        isinstance(reply[0], MemoryLimitExceeded)):
+                    reply[0].limit = self.limits.memory
+                yield reply
+        finally:
+            replies.close()
+
+    def crash_result(self, exitcode):
+        """Returns the TestResult of a test whose worker died."""
+        if exitcode == -signal.SIGXCPU and self.limits.cpu_seconds is not None:
+            # What the CPU limit does to a process that runs past it.
+            return TimeLimitExceeded(self.limits.cpu_seconds, "CPU")
+        return WorkerCrash(exitcode)
@@ -1,109 +1,242 @@
+import hashlib
 import inspect
+import os
 from result import InterfaceDiscrepancy, CorrectResult
 
+# How many fingerprints (and source hashes) are kept.
+FINGERPRINT_ENTRIES = 64
+
+# The fingerprints of modules, keyed by (module name, hash of its source),
+# and the hashes of source files, keyed by (path, mtime, size), least
+# recently used first.
+_fingerprints = {}
+_source_hashes = {}
+
 def listfunction_names(obj):
   '''
   listfunction_names takes an object(e.g: module, class) and returns an array of the function names (strings)
-  ''' 
+  '''
   all_functions = inspect.getmembers(obj, inspect.isfunction)
   names = [x[0] for x in all_functions]
   return names
 
 
+def summarize(obj):
+  """
+  summarize() describes the interface of a module (or class) as plain data,
+  so that it can be stored and compared without the module itself:
+
+    {"name": ...,
+     "functions": {function name: number of arguments, ...},
+     "signatures": {function name: signature (see signature()), ...},
+     "classes": {class name: summary of the class, ...}}
+
+  """
+  # Keyed by the names they are bound to, which for aliases (e.g. 
+  # square = lambda x: x * x) are not their __name__.
+  functions = {name: getattr(obj, name) for name in listfunction_names(obj)}
+  summary = {"name": obj.__name__,
+             "functions": {name: f.__code__.co_argcount
+                           for (name, f) in functions.items()},
+             "signatures": {name: signature(f)
+                            for (name, f) in functions.items()}}
+  if inspect.ismodule(obj):
+    all_classes = inspect.getmembers(obj, inspect.isclass)
+    summary["classes"] = {x[0]:summarize(x[1]) for x in all_classes}
+  return summary
+
+
+def signature(f):
+  """
+  Describes the full signature of a function as plain data:
+
+    {"args": [names of the positional arguments],
+     "defaults": how many of them have defaults,
+     "kwonly": [names of the keyword-only arguments],
+     "kwdefaults": [names of those that have defaults],
+     "varargs": whether there is a *args, "varkw": whether there is a **kwargs}
+
+  """
+  code = f.__code__
+  names = code.co_varnames
+  return {"args": list(names[:code.co_argcount]),
+          "defaults": len(f.__defaults__ or ()),
+          "kwonly": list(names[code.co_argcount:
+                               code.co_argcount + code.co_kwonlyargcount]),
+          "kwdefaults": sorted(f.__kwdefaults__ or {}),
+          "varargs": bool(code.co_flags & inspect.CO_VARARGS),
+          "varkw": bool(code.co_flags & inspect.CO_VARKEYWORDS)}
+
+
+def fingerprint(module):
+  """
+  Returns the summary (see summarize()) of a module, computing it only
+  once for each version of the module's source. The summary is shared,
+  so it must not be changed.
+
+  """
+  path = getattr(module, "__file__", None)
+  if not path or not os.path.isfile(path):
+    return summarize(module)
+  stat = os.stat(path)
+  stamp = (path, stat.st_mtime_ns, stat.st_size)
+  source_hash = _remember(_source_hashes, stamp, lambda: _hash_file(path))
+  return _remember(_fingerprints, (module.__name__, source_hash),
+                   lambda: summarize(module))
+
+
+def _hash_file(path):
+  '''used internally: returns the sha256 of a file's contents'''
+  with open(path, 'rb') as source:
+    return hashlib.sha256(source.read()).hexdigest()
+
+
+def _remember(cache, key, compute):
+  '''
+  used internally: returns cache[key], computing it first if it is missing
+  and dropping the least recently used entry if the cache is full
+  '''
+  value = cache.pop(key, None)
+  if value is None:
+    value = compute()
+    if len(cache) >= FINGERPRINT_ENTRIES:
+      del cache[next(iter(cache))]
+  cache[key] = value
+  return value
+
+
 def arg_compare(ta_obj, hw_obj):
-    """
-    Determines whether the arguments of two methods are the same.
+  """
+  Determines whether the arguments of two methods are the same.
 
-    """    
+  """
+  return summary_arg_compare(summarize(ta_obj), summarize(hw_obj))
 
-    def getfunction_argcount(obj, function_name):
-        '''
-        getfunction_argcount returns the number of args in a function
-        '''
-        f = getattr(obj, function_name)
-        arg_count = f.__code__.co_argcount
-        return arg_count
 
+def summary_arg_compare(ta_summary, hw_summary):
+  """
+  Same as arg_compare(), but on the summaries of the two objects.
 
-    log = []
-    ta_funcs = set(listfunction_names(ta_obj))
-    hw_funcs = set(listfunction_names(hw_obj))
-    ta_farg = {f:getfunction_argcount(ta_obj, f) for f in ta_funcs}
-    hw_farg = {f:getfunction_argcount(hw_obj, f) for f in hw_funcs}
-    args_there = True #innocent until proven guilty
+  """
+  log = []
+  ta_farg = ta_summary["functions"]
+  hw_farg = hw_summary["functions"]
+  ta_name = ta_summary["name"]
+  hw_name = hw_summary["name"]
+  args_there = True #innocent until proven guilty
 
-    for func, arg_count in ta_farg.items():
-      hw_arg_count = hw_farg[func]
-      if arg_count == hw_arg_count:
-        log.append("PASSED@{!s}: {!r} args defined in ta-{!s}. {!r} args in submitted-{!s}".format(func, arg_count, ta_obj.__name__ + "." + func, hw_arg_count, hw_obj.__name__ + "." + func))
-      else: 
-        log.append("ERROR@{!s}: {!r} args defined in ta-{!s}. {!r} args in submitted-{!s}".format(func, arg_count, ta_obj.__name__ + "." + func, hw_arg_count, hw_obj.__name__ + "." + func))
-        args_there = False
-    return args_there, '\n'.join(log)
+  for func, arg_count in ta_farg.items():
+    hw_arg_count = hw_farg[func]
+    if arg_count == hw_arg_count:
+      log.append("PASSED@{!s}: {!r} args defined in ta-{!s}. {!r} args in submitted-{!s}".format(func, arg_count, ta_name + "." + func, hw_arg_count, hw_name + "." + func))
+    else:
+      log.append("ERROR@{!s}: {!r} args defined in ta-{!s}. {!r} args in submitted-{!s}".format(func, arg_count, ta_name + "." + func, hw_arg_count, hw_name + "." + func))
+      args_there = False
+    missing = _missing_kwonly(ta_summary, hw_summary, func)
+    if missing:
+      log.append("ERROR@{!s}: keyword-only args {!s} defined in ta-{!s} are missing in submitted-{!s}".format(func, ", ".join(missing), ta_name + "." + func, hw_name + "." + func))
+      args_there = False
+  return args_there, '\n'.join(log)
+
+
+def _missing_kwonly(ta_summary, hw_summary, func):
+  """
+  Lists the keyword-only arguments of the TA's function that the
+  submitted one does not accept. (Summaries from before signatures were
+  recorded have none.)
+
+  """
+  ta_sig = ta_summary.get("signatures", {}).get(func)
+  hw_sig = hw_summary.get("signatures", {}).get(func)
+  if ta_sig is None or hw_sig is None or hw_sig["varkw"]:
+    return []
+  return [arg for arg in ta_sig["kwonly"] if arg not in hw_sig["kwonly"]]
+
+
+def _matches(ta_summary, hw_summary):
+  """
+  A quick check that a submission defines everything the TA's module
+  does, with the same numbers of arguments. If it does, compare_summaries
+  has nothing to report, so no log needs to be built.
+
+  """
+  hw_farg = hw_summary["functions"]
+  for func, arg_count in ta_summary["functions"].items():
+    if hw_farg.get(func) != arg_count or _missing_kwonly(ta_summary, hw_summary, func):
+      return False
+  hw_class_dict = hw_summary.get("classes", {})
+  for cls_name, ta_cls in ta_summary.get("classes", {}).items():
+    if cls_name not in hw_class_dict or not _matches(ta_cls, hw_class_dict[cls_name]):
+      return False
+  return True
 
 
 def compare(ta_module, hw_module):
-    """
-     compare() does a basic comparison of two modules (or objects), checking to make sure that all functions and classes
-     are defined with the appropriate number of arguments. returns true if so, false otherwise.
-    
-    """ 
-    def getclass_dict(module):
-        '''
-        getclass_dict takes a module and returns a dict of {(className:classObject), (...)}
-        ''' 
-        all_classes = inspect.getmembers(module, inspect.isclass)
-        classes = {x[0]:x[1] for x in all_classes}
-        return classes
-
-    all_there = True #innocent until proven guilty
-
-    result_log = ""
-
-    #scrape functions from top level:
-    ta_top_lvl = set(listfunction_names(ta_module))
-    hw_top_lvl = set(listfunction_names(hw_module))
-    if ta_top_lvl <= hw_top_lvl:
-      all_there, log = arg_compare(ta_module, hw_module)
+  """
+   compare() does a basic comparison of two modules (or objects), checking to make sure that all functions and classes
+   are defined with the appropriate number of arguments. returns true if so, false otherwise.
+
+  """
+  return compare_summaries(summarize(ta_module), summarize(hw_module))
+
+
+def compare_summaries(ta_summary, hw_summary):
+  """
+   Same as compare(), but on the summaries of the two modules (see summarize()). This lets
+   a submission be checked against a stored summary of the TA module.
+
+  """
+  if _matches(ta_summary, hw_summary):
+    return CorrectResult()
+
+  all_there = True #innocent until proven guilty
+
+  result_log = ""
+
+  #scrape functions from top level:
+  ta_top_lvl = set(ta_summary["functions"])
+  hw_top_lvl = set(hw_summary["functions"])
+  if ta_top_lvl <= hw_top_lvl:
+    all_there, log = summary_arg_compare(ta_summary, hw_summary)
+  else:
+    #also log the missing ones
+    missing = ta_top_lvl - hw_top_lvl
+    missing_str = ", ".join(str(e) for e in missing)
+    log = "{!s}.py is missing the following functions: {!s}".format(hw_summary["name"], missing_str)
+    all_there = False
+  result_log += log
+
+  #scrape classes from TA_file, hw_file, and compare them
+  hw_class_dict = hw_summary.get("classes", {})
+  ta_class_dict = ta_summary.get("classes", {})
+  ta_class_names = set(ta_class_dict.keys())
+  hw_class_names = set(hw_class_dict.keys())
+  common_class_names = ta_class_names & hw_class_names
+
+  #high level check to make sure all the classes in TA_module are defined in hw_module (no check to see if there's extra stuff defined in hw_module)
+  if ta_class_names > hw_class_names:
+    missing = ta_class_names - hw_class_names
+    missing_str = ", ".join(str(e) for e in missing)
+    result_log += "\n{!s}.py is missing the following classes: {!s}".format(hw_summary["name"], missing_str)
+    all_there = False
+
+  #scrape functions from the common classes:
+  for cls_name in common_class_names:
+    hw_cls = hw_class_dict[cls_name]
+    ta_cls = ta_class_dict[cls_name]
+    ta_cls_funcs = set(ta_cls["functions"])
+    hw_cls_funcs = set(hw_cls["functions"])
+    if ta_cls_funcs <= hw_cls_funcs:
+      cls_args_there, log = summary_arg_compare(ta_cls, hw_cls)
+      if all_there and not cls_args_there:
+        all_there = False
     else:
-      #also log the missing ones
-      missing = ta_top_lvl - hw_top_lvl
-      missing_str = ", ".join(str(e) for e in missing)
-      log = "{!s}.py is missing the following functions: {!s}".format(hw_module.__name__, missing_str)
-      all_there = False
-    result_log += log
-
-    #scrape classes from TA_file, hw_file, and compare them
-    hw_class_dict = getclass_dict(hw_module)
-    ta_class_dict = getclass_dict(ta_module)
-    ta_class_names = set(ta_class_dict.keys())
-    hw_class_names = set(hw_class_dict.keys())
-    common_class_names = ta_class_names & hw_class_names
-
-    #high level check to make sure all the classes in TA_module are defined in hw_module (no check to see if there's extra stuff defined in hw_module)
-    if ta_class_names > hw_class_names:
-      missing = ta_class_names - hw_class_names
+      missing = ta_cls_funcs - hw_cls_funcs
       missing_str = ", ".join(str(e) for e in missing)
-      result_log += "\n{!s}.py is missing the following classes: {!s}".format(hw_module.__name__, missing_str)
+      result_log += "Your class {!s} is missing some functions: {!s}".format(hw_summary["name"] +"." + cls_name, missing_str)
       all_there = False
 
-    #scrape functions from the common classes:
-    for cls_name in common_class_names:
-      hw_cls = hw_class_dict[cls_name]
-      ta_cls = ta_class_dict[cls_name]
-      ta_cls_funcs = set(listfunction_names(ta_cls))
-      hw_cls_funcs = set(listfunction_names(hw_cls))
-      if ta_cls_funcs <= hw_cls_funcs:
-        cls_args_there, log = arg_compare(ta_cls, hw_cls)
-        if all_there and not cls_args_there:
-          all_there = False
-      else:
-        missing = ta_cls_funcs - hw_cls_funcs
-        missing_str = ", ".join(str(e) for e in missing)
-        result_log += "Your class {!s} is missing some functions: {!s}".format(hw_module.__name__ +"." + cls_name, missing_str)
-        all_there = False
-
-    if not all_there:
-        return InterfaceDiscrepancy(result_log)
-    else:
-        return CorrectResult()
\ No newline at end of file
+  if not all_there:
+    return InterfaceDiscrepancy(result_log)
+  else:
+    return CorrectResult()
\ No newline at end of file
@@ -0,0 +1,173 @@
+"""
+Decides which queued submission a grading service (see service.py) grades
+next, so that a deadline rush is shared out fairly:
+
+  - Each student has their own queue, and the students take turns: the
+    next submission comes from the student who has had the fewest graded
+    while waiting, so one student resubmitting thirty times cannot starve
+    the others. (A student whose queue was empty joins no further ahead
+    than the student graded last, and no further behind than they were, so
+    what was graded while nobody else was waiting counts for nothing.)
+  - A new submission from a student supersedes the ones they already have
+    waiting (only the latest attempt would count anyway).
+  - Submissions that can still be on time come first; late ones (past
+    their deadline, or marked late in the student's state, see 
+    Autograder.get_timedelta) come last. Among students who have had as
+    many graded, the nearest deadline goes first. (Deadlines come from the
+    clients, so they only break ties: setting one on every submission does
+    not get a student ahead of their fair share.)
+
+The Scheduler also keeps metrics: the depth of the queue, how many
+submissions were superseded, and how long recent ones waited.
+
+"""
+import asyncio
+import collections
+import math
+import time
+
+
+QUEUE_SIZE = 100
+
+# How many recent waiting times the metrics are computed from.
+WAIT_WINDOW = 1000
+
+
+class QueueFull(Exception):
+    """Raised for a submission that arrives while the queue is full."""
+    def __init__(self, size):
+        Exception.__init__(self, "The grading queue is full ({} submissions); "
+                                 "try again later.".format(size))
+
+
+class Job:
+    """
+    A Job is a queued submission: a student's task, the future for its
+    result, and the deadline (a time.time() value, or None) and lateness
+    that decide its priority.
+
+    """
+    def __init__(self, student, task, future, deadline = None, late = False):
+        self.student = student
+        self.task = task
+        self.future = future
+        self.deadline = deadline
+        self.late = late
+        self.queued = time.monotonic()
+        self.started = None
+
+    def is_late(self, now = None):
+        """Returns whether the job can no longer be graded on time."""
+        if self.late:
+            return True
+        if self.deadline is None:
+            return False
+        return (now or time.time()) > self.deadline
+
+
+class Scheduler:
+    """
+    A Scheduler holds up to capacity Jobs. Jobs are added with put(), and
+    taken (in the order described in the module's docstring) with get().
+    With supersede = False, a student's jobs all wait their turn instead.
+
+    """
+
+    def __init__(self, capacity = QUEUE_SIZE, supersede = True):
+        self.capacity = capacity
+        self.supersede = supersede
+        self.size = 0
+        self.superseded = 0
+        self.dispatched = 0
+        self.waits = collections.deque(maxlen = WAIT_WINDOW)
+        self._queues = collections.OrderedDict()
+        self._served = collections.Counter()
+        # The count of graded jobs that the last student graded had, which
+        # never goes down.
+        self._level = 0
+        self._available = None
+
+    def put(self, job):
+        """
+        Queues a job, and returns the list of jobs that it superseded
+        (which are no longer queued). Raises QueueFull if there is no room.
+
+        """
+        queue = self._queues.get(job.student)
+        if self.supersede and queue:
+            superseded = list(queue)
+            queue.clear()
+            queue.append(job)
+            # The student keeps their place in the queue.
+            job.queued = superseded[0].queued
+            self.superseded += len(superseded)
+            self.size -= len(superseded) - 1
+            return superseded
+        if self.size >= self.capacity:
+            raise QueueFull(self.capacity)
+        if queue is None:
+            # A student who had nothing waiting joins no further ahead
+            # than the student graded last. What they had graded while 
+            # nobody else was waiting raised that level too, so it does not
+            # put them behind.
+            self._served[job.student] = max(self._served[job.student], 
+                                            self._level)
+            queue = self._queues[job.student] = collections.deque()
+        queue.append(job)
+        self.size += 1
+        self._semaphore().release()
+        return []
+
+    async def get(self):
+        """Waits for a job, and returns the one that should run next."""
+        while True:
+            await self._semaphore().acquire()
+            if self.size > 0:
+                break
+        now = time.time()
+        student = min(self._queues, key = lambda s: self._priority(s, now))
+        queue = self._queues[student]
+        job = queue.popleft()
+        if not queue:
+            del self._queues[student]
+        self.size -= 1
+        self._level = max(self._level, self._served[student])
+        self._served[student] += 1
+        self.dispatched += 1
+        job.started = time.monotonic()
+        self.waits.append(job.started - job.queued)
+        return job
+
+    def _priority(self, student, now):
+        '''used internally: the sort key of a student's next job'''
+        job = self._queues[student][0]
+        late = job.is_late(now)
+        deadline = job.deadline if job.deadline is not None and not late \
+                   else float('inf')
+        return (late, self._served[student], deadline, job.queued)
+
+    def _semaphore(self):
+        '''used internally: counts the jobs (made on first use, in a loop)'''
+        if self._available is None:
+            self._available = asyncio.Semaphore(0)
+        return self._available
+
+    def qsize(self):
+        return self.size
+
+    def metrics(self):
+        """
+        Returns the queue depth (in jobs and in students waiting), the
+        numbers of jobs dispatched and superseded, and the median, 99th
+        percentile and longest of the recent waiting times (in seconds).
+
+        """
+        waits = sorted(self.waits)
+        def percentile(fraction):
+            if not waits:
+                return None
+            return waits[max(int(math.ceil(fraction * len(waits))) - 1, 0)]
+        return {"depth": self.size, "students": len(self._queues),
+                "dispatched": self.dispatched, "superseded": self.superseded,
+                "wait_p50": percentile(0.5), "wait_p99": percentile(0.99),
+                "wait_max": waits[-1] if waits else None}
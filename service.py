@@ -0,0 +1,361 @@
+"""
+A long-running grading service, so that a deadline rush does not start a
+Python process (and import everything) per submission:
+
+    python service.py TA_MODULE SPEC --socket /tmp/grader.sock -j 8
+    python service.py TA_MODULE SPEC --port 8421
+
+TA_MODULE and SPEC are as for roster.py. The TA module and the autograder
+are imported once, and submissions are graded on a pool of worker processes
+that are started (warm) before the first one arrives.
+
+Clients connect to the socket (a Unix socket, or TCP on localhost) and send
+one JSON line per connection, naming the student and the directory that
+their submission is imported from (and optionally its module name):
+
+    {"student": "alice", "path": "/submissions/alice"}
+
+and optionally a "deadline" (a Unix time; the default is the spec's
+"deadline", if any).
+
+The service answers with a {"event": "queued", "position": ...} line as
+soon as the submission is queued, and then with the record of
+Autograder.finalize (plus the student's name) once it has been graded; see
+client.py. The same requests can be POSTed to /grade over HTTP, which
+answers with the record alone; GET /status reports the depth of the queue.
+
+The queue holds at most queue_size submissions. When it is full, new ones
+are turned away at once with {"error": ...} (HTTP 503), rather than piling
+up, so that clients can back off and retry. Queued submissions are graded
+in the order chosen by a scheduler.Scheduler: students take turns, the
+nearest deadlines go first, and a student's new submission supersedes the
+one they have waiting (which is answered with {"error": ...}, or HTTP 409).
+GET /status includes the scheduler's metrics.
+
+"""
+import argparse
+import asyncio
+import concurrent.futures
+import json
+import os
+import signal
+import sys
+from autograder import DATA_FILE
+from cache import ResultCache
+from pool import WorkerPool
+from replay import ReplayCache
+from roster import make_setup, grade_submission, count_attempts
+from scheduler import Scheduler, Job, QueueFull, QUEUE_SIZE
+from state import JSONState, SQLiteState
+
+
+PORT = 8421
+
+# How long (in seconds) the worker watchdog waits beyond a spec's
+# submission_time_limit before killing a worker.
+GRACE = 5.0
+
+HTTP_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found",
+                409: "Conflict", 503: "Service Unavailable"}
+
+SUPERSEDED = {"error": "Superseded by a later submission."}
+
+
+class _Grader:
+    """
+    The function that the workers apply: grades a (student, path, module
+    name) task with a setup that the workers inherited when they started.
+
+    """
+    def __init__(self, setup):
+        self.setup = setup
+
+    def __call__(self, task):
+        return grade_submission((self.setup,) + task)
+
+
+class GradingService:
+    """
+    A GradingService queues submissions and grades them on a pool of
+    workers, each of which grades one submission at a time.
+
+    """
+
+    def __init__(self, setup, workers = 1, queue_size = QUEUE_SIZE,
+                 supersede = True):
+        self.setup = setup
+        self.workers = workers
+        self.queue_size = queue_size
+        self.supersede = supersede
+        self.scheduler = None
+        self.graded = 0
+        self.rejected = 0
+        self.timeout = None
+        if setup["spec"].get("submission_time_limit") is not None:
+            self.timeout = setup["spec"]["submission_time_limit"] + GRACE
+        self._pools = []
+        self._dispatchers = []
+        self._executor = None
+        self._state_executor = None
+
+    async def start(self):
+        """Starts the workers and the dispatchers that feed them."""
+        self.scheduler = Scheduler(self.queue_size, self.supersede)
+        self._executor = concurrent.futures.ThreadPoolExecutor(self.workers)
+        # Reads and counts the students' states off the event loop, one at
+        # a time (so that they can share a connection), in order.
+        self._state_executor = concurrent.futures.ThreadPoolExecutor(1)
+        for _ in range(self.workers):
+            pool = WorkerPool(_Grader(self.setup), 1)
+            pool.start()
+            self._pools.append(pool)
+            self._dispatchers.append(asyncio.ensure_future(self._dispatch(pool)))
+
+    async def close(self):
+        """Stops the dispatchers and the workers."""
+        for dispatcher in self._dispatchers:
+            dispatcher.cancel()
+        await asyncio.gather(*self._dispatchers, return_exceptions = True)
+        self._executor.shutdown()
+        self._state_executor.shutdown()
+        for pool in self._pools:
+            pool.terminate()
+        self._pools = []
+        self._dispatchers = []
+
+    async def submit(self, student, path, module_name = None, deadline = None):
+        """
+        Queues a submission, and returns a future for its record. Raises
+        QueueFull if there is no room for it.
+
+        """
+        if module_name is None:
+            module_name = self.setup["spec"].get("student_module")
+        if deadline is None:
+            deadline = self.setup["spec"].get("deadline")
+        loop = asyncio.get_running_loop()
+        timedelta = await loop.run_in_executor(self._state_executor,
+                                               self._timedelta, student, path)
+        future = loop.create_future()
+        job = Job(student, (student, path, module_name), future, deadline,
+                  timedelta < 0)
+        try:
+            superseded = self.scheduler.put(job)
+        except QueueFull:
+            self.rejected += 1
+            raise
+        for old_job in superseded:
+            if not old_job.future.done():
+                old_job.future.set_result(dict(SUPERSEDED))
+        return future
+
+    def _timedelta(self, student, path):
+        '''used internally: the timedelta the Autograder will see (on a thread)'''
+        state = self.setup["state"]
+        if state is None:
+            state = JSONState(os.path.join(path, DATA_FILE))
+        try:
+            return state.load(student, self.setup["assignment"]).get(
+                    "timedelta", 0)
+        except (OSError, ValueError):
+            return 0
+
+    def status(self):
+        return {"queued": self.scheduler.qsize(), "graded": self.graded,
+                "rejected": self.rejected, "workers": self.workers,
+                "scheduler": self.scheduler.metrics()}
+
+    async def _dispatch(self, pool):
+        '''used internally: grades queued submissions on one worker'''
+        loop = asyncio.get_running_loop()
+        while True:
+            job = await self.scheduler.get()
+            (task, future) = (job.task, job.future)
+            try:
+                record = await loop.run_in_executor(self._executor,
+                                                    self._grade, pool, task)
+            except Exception as e:
+                record = {"student": task[0], "error": str(e)}
+            if self.setup["state"] is not None:
+                # On the state executor rather than the grading threads,
+                # which cannot share a connection.
+                await loop.run_in_executor(self._state_executor, 
+                                           count_attempts, [record], 
+                                           self.setup["state"],
+                                           self.setup["assignment"])
+            self.graded += 1
+            if not future.done():
+                future.set_result(record)
+
+    def _grade(self, pool, task):
+        '''used internally: grades a task on a pool (on a thread)'''
+        record = next(pool.imap([task], [self.timeout]))
+        if isinstance(record, Exception):
+            record = {"student": task[0], "error": str(record)}
+        return record
+
+    async def handle(self, reader, writer):
+        """Serves one connection (see the module's docstring)."""
+        try:
+            line = await reader.readline()
+            if line.startswith((b"POST ", b"GET ")):
+                await self._handle_http(line, reader, writer)
+            else:
+                await self._handle_line(line, writer)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _handle_line(self, line, writer):
+        '''used internally: serves a JSON-lines request'''
+        try:
+            future = await self.submit(*_parse_request(line))
+        except (ValueError, QueueFull) as e:
+            await _write_line(writer, {"error": str(e)})
+            return
+        await _write_line(writer, {"event": "queued",
+                                   "position": self.scheduler.qsize()})
+        await _write_line(writer, await future)
+
+    async def _handle_http(self, request_line, reader, writer):
+        '''used internally: serves an HTTP request'''
+        (method, target) = (request_line.decode('latin-1').split() + [None])[:2]
+        length = 0
+        while True:
+            header = await reader.readline()
+            if header in (b"\r\n", b"\n", b""):
+                break
+            (name, _, value) = header.decode('latin-1').partition(":")
+            if name.strip().lower() == "content-length":
+                try:
+                    length = int(value)
+                except ValueError:
+                    length = -1
+        if length < 0:
+            (code, reply) = (400, {"error": "Bad Content-Length."})
+        elif method == "GET" and target == "/status":
+            (code, reply) = (200, self.status())
+        elif method == "POST" and target == "/grade":
+            try:
+                body = await reader.readexactly(length) if length else b""
+                future = await self.submit(*_parse_request(body))
+                reply = await future
+                code = 409 if reply == SUPERSEDED else 200
+            except ValueError as e:
+                (code, reply) = (400, {"error": str(e)})
+            except QueueFull as e:
+                (code, reply) = (503, {"error": str(e)})
+        else:
+            (code, reply) = (404, {"error": "Unknown request."})
+        payload = json.dumps(reply).encode('utf-8')
+        writer.write("HTTP/1.1 {} {}\r\nContent-Type: application/json\r\n"
+                     "Content-Length: {}\r\nConnection: close\r\n\r\n"
+                     .format(code, HTTP_REASONS[code], len(payload))
+                     .encode('latin-1') + payload)
+        await writer.drain()
+
+
+def _parse_request(data):
+    """
+    Returns the (student, path, module name, deadline) of a JSON request,
+    or raises ValueError if it is not one.
+
+    """
+    request = json.loads(data)
+    if (not isinstance(request, dict) or
+            not isinstance(request.get("student"), str) or
+            not isinstance(request.get("path"), str)):
+        raise ValueError('A request needs a "student" and a "path".')
+    deadline = request.get("deadline")
+    if deadline is not None and not isinstance(deadline, (int, float)):
+        raise ValueError('A "deadline" must be a Unix time.')
+    return (request["student"], request["path"], request.get("module"),
+            deadline)
+
+
+async def _write_line(writer, message):
+    writer.write((json.dumps(message) + "\n").encode('utf-8'))
+    await writer.drain()
+
+
+async def serve(service, socket_path = None, port = PORT, ready = None):
+    """
+    Runs a service on a Unix socket (if socket_path is given) or on a TCP
+    port of localhost, until cancelled. Calls ready() (if given) once it
+    is accepting connections. Stops on SIGTERM.
+
+    """
+    await service.start()
+    try:
+        if socket_path is not None:
+            server = await asyncio.start_unix_server(service.handle, socket_path)
+        else:
+            server = await asyncio.start_server(service.handle, '127.0.0.1',
+                                                port)
+        async with server:
+            if ready is not None:
+                ready()
+            serving = asyncio.ensure_future(server.serve_forever())
+            # Stop cleanly (taking the workers along) when terminated.
+            asyncio.get_running_loop().add_signal_handler(signal.SIGTERM,
+                                                          serving.cancel)
+            try:
+                await serving
+            except asyncio.CancelledError:
+                pass
+    finally:
+        await service.close()
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(
+            description = "Serves grading requests for one assignment.")
+    parser.add_argument("ta_module", help = "path of the TA's module")
+    parser.add_argument("spec", help = "JSON file describing the tests")
+    parser.add_argument("--socket", help = "Unix socket to listen on")
+    parser.add_argument("--port", type = int, default = PORT,
+                        help = "TCP port of localhost to listen on "
+                               "(if there is no --socket)")
+    parser.add_argument("-j", "--workers", type = int,
+                        default = os.cpu_count() or 1,
+                        help = "number of worker processes")
+    parser.add_argument("--queue", type = int, default = QUEUE_SIZE,
+                        help = "how many submissions may wait to be graded")
+    parser.add_argument("--keep-all", action = "store_true",
+                        help = "grade every submission, rather than only a "
+                               "student's latest one waiting")
+    parser.add_argument("--cache",
+                        help = "directory in which to cache the TA's results")
+    parser.add_argument("--replay",
+                        help = "directory in which to keep the logs of graded "
+                               "submissions, to replay for unchanged ones")
+    parser.add_argument("--state",
+                        help = "SQLite database of the students' attempts "
+                               "(default: a data file in each submission)")
+    parser.add_argument("--assignment",
+                        help = "name of the assignment in the --state database "
+                               "(default: the name of the spec file)")
+    args = parser.parse_args(argv)
+    with open(args.spec) as spec_file:
+        spec = json.load(spec_file)
+    setup = make_setup(args.ta_module, spec,
+                       ResultCache(args.cache) if args.cache else None,
+                       ReplayCache(args.replay) if args.replay else None,
+                       SQLiteState(args.state) if args.state else None,
+                       args.assignment or
+                       os.path.splitext(os.path.basename(args.spec))[0])
+    service = GradingService(setup, args.workers, args.queue,
+                             not args.keep_all)
+    where = args.socket or "127.0.0.1:{}".format(args.port)
+    def ready():
+        sys.stderr.write("Grading on {} with {} workers.\n"
+                         .format(where, args.workers))
+    try:
+        asyncio.run(serve(service, args.socket, args.port, ready))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
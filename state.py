@@ -0,0 +1,214 @@
+"""
+Keeps track of each student's attempts and best score on each assignment,
+for the Autograder (see Autograder(state = ...)).
+
+A state store hands out the state of a submission as a dict:
+
+    {"attempts": 3, "prevscore": 15, "timedelta": 0}
+
+where attempts counts the attempt being graded, prevscore is the best
+earlier score, and timedelta is 0 (on time) or -1 (late). Once the
+submission has been scored, record() counts the attempt.
+
+JSONState reads the per-directory data file that the Autograder has always
+used. SQLiteState keeps every student and assignment in one database, which
+many graders (on many processes) can update at once.
+
+"""
+import datetime
+import json
+import os
+import sqlite3
+
+
+# How long (in seconds) a writer waits for another one to finish.
+BUSY_TIMEOUT = 30.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS submissions (
+    student TEXT NOT NULL,
+    assignment TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    best INTEGER NOT NULL DEFAULT 0,
+    timedelta INTEGER NOT NULL DEFAULT 0,
+    updated TEXT,
+    PRIMARY KEY (student, assignment)
+);
+CREATE INDEX IF NOT EXISTS submissions_by_assignment
+    ON submissions (assignment, best);
+"""
+
+RECORD = """
+INSERT INTO submissions (student, assignment, attempts, best, updated)
+VALUES (?, ?, 1, ?, ?)
+ON CONFLICT (student, assignment) DO UPDATE SET
+    attempts = attempts + 1,
+    best = max(best, excluded.best),
+    updated = excluded.updated
+"""
+
+
+def new_state():
+    """Returns the state of a first attempt."""
+    return {"attempts": 1, "prevscore": 0, "timedelta": 0}
+
+
+class StateStore:
+    """
+    A StateStore is an abstract class that keeps the state of submissions,
+    keyed by student and assignment.
+
+    """
+    def load(self, student, assignment):
+        """Abstract method. Returns the state of the next attempt."""
+        raise NotImplementedError("Cannot call .load() on abstract class.")
+
+    def record(self, student, assignment, score):
+        """
+        Counts an attempt that scored score, and returns the state it was
+        counted as (whose attempts may be higher than load() said, if other
+        attempts were counted in the meantime). Does nothing and returns
+        None by default.
+
+        """
+        return None
+
+    def record_many(self, records):
+        """
+        Counts a list of (student, assignment, score) attempts, and returns
+        the list of their states (as for record).
+
+        """
+        return [self.record(*record) for record in records]
+
+
+class JSONState(StateStore):
+    """
+    The state of one submission, read from a JSON data file (if it exists).
+    The data file belongs to whatever set up the submission's directory, so
+    the student and assignment are ignored, and nothing is ever recorded.
+
+    """
+    def __init__(self, path):
+        self.path = path
+
+    def load(self, student, assignment):
+        try:
+            with open(self.path) as data_file:
+                return json.load(data_file)
+        except FileNotFoundError:
+            return new_state()
+
+
+class DeferredState(StateStore):
+    """
+    Loads states from another StateStore, but leaves the attempts to be
+    counted later, by whoever made it (e.g. in batches, with record_many).
+
+    """
+    def __init__(self, store):
+        self.store = store
+
+    def load(self, student, assignment):
+        return self.store.load(student, assignment)
+
+
+class SQLiteState(StateStore):
+    """
+    The state of every submission, in an SQLite database (in WAL mode, so
+    that readers do not wait for writers). Each attempt is counted with a
+    single atomic statement, so graders that run at the same time for the
+    same student cannot lose each other's attempts.
+
+    A SQLiteState can be passed to worker processes: each process opens its
+    own connection. Within a process, it may be used from any thread, but
+    only from one at a time.
+
+    """
+    def __init__(self, path, busy_timeout = BUSY_TIMEOUT):
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self._connection = None
+        self._pid = None
+        self._connect()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_connection"] = None
+        state["_pid"] = None
+        return state
+
+    def _connect(self):
+        '''used internally: returns this process's connection'''
+        if self._connection is None or self._pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout = self.busy_timeout,
+                                         isolation_level = None,
+                                         check_same_thread = False)
+            connection.execute("PRAGMA journal_mode = WAL")
+            connection.execute("PRAGMA synchronous = NORMAL")
+            connection.executescript(SCHEMA)
+            (self._connection, self._pid) = (connection, os.getpid())
+        return self._connection
+
+    def close(self):
+        if self._connection is not None and self._pid == os.getpid():
+            self._connection.close()
+        self._connection = None
+
+    def load(self, student, assignment):
+        row = self._connect().execute(
+                "SELECT attempts, best, timedelta FROM submissions "
+                "WHERE student = ? AND assignment = ?",
+                (student, assignment)).fetchone()
+        if row is None:
+            return new_state()
+        return {"attempts": row[0] + 1, "prevscore": row[1], "timedelta": row[2]}
+
+    def record(self, student, assignment, score):
+        return self.record_many([(student, assignment, score)])[0]
+
+    def record_many(self, records):
+        connection = self._connect()
+        now = datetime.datetime.now().isoformat()
+        states = []
+        # One transaction for the lot, so a batch costs one sync.
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            for (student, assignment, score) in records:
+                connection.execute(RECORD, (student, assignment, score or 0, now))
+                row = connection.execute(
+                        "SELECT attempts, best, timedelta FROM submissions "
+                        "WHERE student = ? AND assignment = ?",
+                        (student, assignment)).fetchone()
+                states.append({"attempts": row[0], "prevscore": row[1],
+                               "timedelta": row[2]})
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        return states
+
+    def set_timedelta(self, student, assignment, timedelta):
+        """Marks a student's submissions as on time (0) or late (-1)."""
+        self._connect().execute(
+                "INSERT INTO submissions (student, assignment, timedelta) "
+                "VALUES (?, ?, ?) ON CONFLICT (student, assignment) "
+                "DO UPDATE SET timedelta = excluded.timedelta",
+                (student, assignment, timedelta))
+
+    def scores(self, assignment):
+        """
+        Returns (student, attempts, best score) for every student who has
+        attempted an assignment, best scores first.
+
+        """
+        return self._connect().execute(
+                "SELECT student, attempts, best FROM submissions "
+                "WHERE assignment = ? AND attempts > 0 "
+                "ORDER BY best DESC, student", (assignment,)).fetchall()
+
+    def history(self, student):
+        """Returns (assignment, attempts, best score) for a student."""
+        return self._connect().execute(
+                "SELECT assignment, attempts, best FROM submissions "
+                "WHERE student = ? ORDER BY assignment", (student,)).fetchall()
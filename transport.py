@@ -0,0 +1,190 @@
+"""
+Hands large test inputs (and the TA's results in golden bundles) to worker
+processes through memory-mapped files, rather than pickling them into a
+pipe for every test of every submission.
+
+When Autograder runs tests on a pool (see Autograder(workers = ...) and
+Autograder(sandbox = ...)), each test is pickled and sent to a worker. With
+a Transport, a test whose input pickles to THRESHOLD bytes or more is sent
+as a small reference instead: the pickled input is written once to a file
+named after its digest (on /dev/shm where there is one, so it stays in
+memory), and each worker maps that file read-only, once, for every later
+test with the same input. Each test gets its own copy of the input,
+unpickled straight from the mapped file (as are the copies that the 
+functions under test get, see util.InputSnapshot, which are checked 
+against it for changes), so what one submission does to its input cannot
+reach the next.
+
+"""
+import atexit
+import copy
+import hashlib
+import mmap
+import os
+import pickle
+import shutil
+import tempfile
+from util import InputSnapshot
+
+
+# Inputs that pickle to fewer bytes than this are sent as they are.
+THRESHOLD = 64 * 1024
+
+# The attributes of a TestCase that are sent by reference.
+SHARED_ATTRIBUTES = ["test_input", "golden"]
+
+# How many shared values a worker keeps mapped.
+CACHE_ENTRIES = 64
+
+# How many values a Transport remembers the references of.
+REFERENCE_ENTRIES = 256
+
+
+def _shared_directory():
+    """Returns a directory whose files are kept in memory, if there is one."""
+    if os.path.isdir('/dev/shm') and os.access('/dev/shm', os.W_OK):
+        return '/dev/shm'
+    return None
+
+
+class Transport:
+    """
+    A Transport writes large values to files in a directory of its own
+    (removed by close(), or when the process exits), and replaces them in
+    the tests it is given with references to those files.
+
+    Each value is pickled once: the reference (or its absence, for a small
+    value) is remembered for as long as the value is, by its identity. 
+    Argument tuples are made afresh for each submission (see 
+    roster.build_tests), so they are known by the identities of their 
+    arguments instead. The values are only ever run in the workers, on 
+    copies, so they are not expected to change here; a value whose size
+    has changed is pickled again all the same.
+
+    """
+
+    def __init__(self, threshold = THRESHOLD, directory = None):
+        self.threshold = threshold
+        self.directory = tempfile.mkdtemp(prefix = 'autograder-shared-',
+                                          dir = directory or _shared_directory())
+        self.shared = 0
+        self._written = set()
+        # (value, its sizes, its reference), by identity (see _identity),
+        # least recently used first. Keeping the values keeps their ids.
+        self._references = {}
+        atexit.register(self.close)
+
+    def close(self):
+        shutil.rmtree(self.directory, ignore_errors = True)
+        self._written = set()
+        self._references = {}
+
+    def share(self, test):
+        """
+        Returns the test, or a shallow copy of it in which the large values
+        are replaced by references (which turn back into the values when
+        they are unpickled).
+
+        """
+        replacements = {}
+        for attribute in SHARED_ATTRIBUTES:
+            value = getattr(test, attribute, None)
+            if value is None:
+                continue
+            reference = self._reference(value)
+            if reference is not None:
+                replacements[attribute] = reference
+        if not replacements:
+            return test
+        test = copy.copy(test)
+        for (attribute, reference) in replacements.items():
+            setattr(test, attribute, reference)
+        if "test_input" in replacements:
+            test._snapshot = SharedSnapshot(replacements["test_input"].path)
+        return test
+
+    def _reference(self, value):
+        '''used internally: returns a SharedValue for a large value'''
+        key = _identity(value)
+        entry = self._references.pop(key, None)
+        if entry is None or entry[1] != _sizes(value):
+            entry = (value, _sizes(value), self._write(value))
+            if len(self._references) >= REFERENCE_ENTRIES:
+                del self._references[next(iter(self._references))]
+        self._references[key] = entry
+        return entry[2]
+
+    def _write(self, value):
+        '''used internally: pickles a value, and writes it if it is large'''
+        # The file is named by content, so values that are equal (e.g. the
+        # same value, pickled again) share it.
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        if len(data) < self.threshold:
+            return None
+        digest = hashlib.sha256(data).hexdigest()
+        path = os.path.join(self.directory, digest)
+        if digest not in self._written:
+            with open(path + '.tmp', 'wb') as shared_file:
+                shared_file.write(data)
+            os.replace(path + '.tmp', path)
+            self._written.add(digest)
+            self.shared += 1
+        return SharedValue(path)
+
+
+def _identity(value):
+    '''used internally: the key of a value for Transport._references'''
+    if type(value) is tuple:
+        return (tuple,) + tuple(id(item) for item in value)
+    return id(value)
+
+
+def _sizes(value):
+    '''used internally: the lengths of a value, or of an argument tuple's items'''
+    items = value if type(value) is tuple else (value,)
+    return tuple(len(item) if hasattr(item, '__len__') else None 
+                 for item in items)
+
+
+class SharedValue:
+    """A reference to a value in a file, which unpickles as the value."""
+    def __init__(self, path):
+        self.path = path
+
+    def __reduce__(self):
+        return (_attach_value, (self.path,))
+
+
+class SharedSnapshot(SharedValue):
+    """A reference to a value in a file, which unpickles as its snapshot."""
+    def __reduce__(self):
+        return (_attach_snapshot, (self.path,))
+
+
+# In a worker: the InputSnapshots of the shared values it has mapped, keyed
+# by path, least recently used first.
+_attached = {}
+
+
+def _attach(path):
+    """Returns the InputSnapshot of the value in a file, mapping it once."""
+    snapshot = _attached.pop(path, None)
+    if snapshot is None:
+        with open(path, 'rb') as shared_file:
+            view = memoryview(mmap.mmap(shared_file.fileno(), 0,
+                                        access = mmap.ACCESS_READ))
+        snapshot = InputSnapshot.unpickle(view)
+        if len(_attached) >= CACHE_ENTRIES:
+            del _attached[next(iter(_attached))]
+    _attached[path] = snapshot
+    return snapshot
+
+
+def _attach_value(path):
+    # A copy of its own for each test, since some hand their input to the
+    # student's code as it is (e.g. FunctionStdoutTest).
+    return _attach(path).copy()
+
+
+def _attach_snapshot(path):
+    return _attach(path)
@@ -1,5 +1,43 @@
+import asyncio
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import types
 import unittest
-from util import compare_outputs, CorrectResult, LineDiscrepancy
+from util import compare_outputs, iter_lines, CorrectResult, LineDiscrepancy
+from util import OutputCapture, OutputLimitError, call_function
+from util import TimeLimit, TimeLimitError, growth_exponent
+from util import InputSnapshot, compare_functions
+from autograder import Autograder, FunctionTest, TestCase, InteractiveTest
+from autograder import PerformanceTest, PropertyTest, FunctionStdoutTest
+from generate import Integers, Lists, shrink
+from autograder import _run_test, _scripts
+from result import ProgramCrash, PerformanceDiscrepancy
+from roster import grade_roster
+from cache import ResultCache, MemoryCache
+from bundle import compile_bundle, load_bundle
+from benchmark import compare_to_baseline, BASELINE, BENCHMARKS
+from comparators import Close, Exact
+from sanity import compare, fingerprint, summarize
+from result import ElementDiscrepancy
+from replay import ReplayCache, ast_hash
+from state import SQLiteState
+from service import GradingService, serve
+from scheduler import Scheduler, Job, QueueFull
+from sandbox import SandboxPool, Limits
+from pool import WorkerPool
+from result import MemoryLimitExceeded, WorkerCrash
+from roster import make_setup
+from transport import Transport, SharedValue
+import client
+
+EXAMPLES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'examples')
+sys.path.insert(0, os.path.join(EXAMPLES, 'functiontest'))
+sys.path.insert(0, os.path.join(EXAMPLES, 'interactivetest'))
 
 class SimpleTestCase(unittest.TestCase):
 
@@ -30,6 +68,934 @@ class SimpleTestCase(unittest.TestCase):
         result = compare_outputs(self.log1, self.log4)
         assert str(result) == str(LineDiscrepancy(4, "line4", None))
 
+    def test_file_like(self):
+        result = compare_outputs(io.StringIO(self.log3), io.StringIO(self.log1))
+        assert str(result) == str(LineDiscrepancy(3, "line3", "line4"))
+
+    def test_chunks(self):
+        chunks = ['li', 'ne 1\nli', 'ne2\n', 'line3']
+        result = compare_outputs(iter(chunks), self.log1)
+        assert str(result) == str(CorrectResult())
+
+    def test_stops_at_first_discrepancy(self):
+        def endless():
+            yield 'different\n'
+            while True:
+                yield 'more\n'
+        result = compare_outputs(endless(), self.log1)
+        assert str(result) == str(LineDiscrepancy(1, "line 1", "different"))
+
+    def test_full_diff(self):
+        expected = "\n".join("line {}".format(i) for i in range(1000))
+        received = expected.replace("line 10\n", "").replace("line 500", "oops")
+        result = compare_outputs(received, expected, full_diff = True)
+        assert result.complete
+        assert [(h[0], h[1], h[2], h[3]) for h in result.hunks] == \
+            [(11, ["line 10"], 11, []), (501, ["line 500"], 500, ["oops"])]
+
+    def test_full_diff_gives_up(self):
+        expected = "\n".join(str(i) for i in range(5000))
+        received = "\n".join(str(-i) for i in range(5000))
+        result = compare_outputs(received, expected, full_diff = True)
+        assert str(result) == str(LineDiscrepancy(2, "1", "-1"))
+
+    def test_diff_gives_up_early(self):
+        from diff import diff
+        expected = [str(i) for i in range(100)]
+        assert diff(expected, expected[:5] + expected[50:], 50) is not None
+        assert diff(expected, expected[:5] + expected[60:], 50) is None
+        assert diff(expected, [], 50) is None
+
+    def test_iter_lines(self):
+        for text in ['', '\n', 'a\n\nb', 'a\nb\n']:
+            assert list(iter_lines(text)) == text.split('\n')
+            assert list(iter_lines(io.StringIO(text))) == text.split('\n')
+
+
+def _nap(seconds):
+    time.sleep(seconds)
+    return seconds
+
+
+class _CountedStarts:
+    '''used internally: a lifecycle that leaves a file for each start'''
+    def __init__(self, directory):
+        self.directory = directory
+
+    def start(self):
+        open(os.path.join(self.directory, str(os.getpid())), 'w').close()
+
+    def before_task(self):
+        pass
+
+    def retiring(self):
+        return False
+
+
+class PoolTestCase(unittest.TestCase):
+
+    def test_early_stop(self):
+        pool = WorkerPool(_nap, 2)
+        try:
+            results = pool.imap([0, 5])
+            assert next(results) == 0
+            started = time.time()
+            results.close()
+            assert time.time() - started < 2
+            # The busy worker is killed, but not replaced until needed.
+            assert len(pool.workers) == 1
+            assert list(pool.imap([0, 0, 0])) == [0, 0, 0]
+            assert len(pool.workers) == 2
+        finally:
+            pool.terminate()
+
+    def test_no_start_on_teardown(self):
+        directory = tempfile.mkdtemp()
+        pool = WorkerPool(_nap, 2, _CountedStarts(directory))
+        try:
+            pool.start()
+            results = pool.imap([0, 5, 5])
+            assert next(results) == 0
+            results.close()
+            pool.close()
+            # Only the two workers that were started at first.
+            assert len(os.listdir(directory)) == 2
+        finally:
+            pool.terminate()
+            shutil.rmtree(directory)
+
+
+class ParallelTestCase(unittest.TestCase):
+
+    def results(self, student_module_name, workers, fork = False):
+        tests = FunctionTest.create_batch("ta_digital_root", 
+                                          student_module_name, 
+                                          "digital_root", 
+                                          [(1729,), (356,)], 
+                                          [(5000,), (12345678,), (1,)])
+        autograder = Autograder(workers=workers, fork=fork)
+        pairs = []
+        for (test, result) in autograder._results(tests):
+            pairs.append((str(test), str(result)))
+            if not result.passedTest():
+                break
+        return pairs
+
+    def test_same_as_sequential(self):
+        for name in ["digital_root", "digital_root2", "digital_root3"]:
+            assert self.results(name, 3) == self.results(name, 1)
+
+    def test_forked_same_as_sequential(self):
+        for name in ["digital_root", "digital_root2", "digital_root3"]:
+            assert self.results(name, 1, fork=True) == self.results(name, 1)
+
+
+class InteractiveTestCase(unittest.TestCase):
+
+    def test_compiled_once(self):
+        output = InteractiveTest.run_script("ta_two_largest", ["5", "3", "4", ""])
+        code = _scripts["ta_two_largest"][1]
+        assert "The largest value is 5." in output
+        assert InteractiveTest.run_script("ta_two_largest", 
+                                          ["5", "3", "4", ""]) == output
+        assert _scripts["ta_two_largest"][1] is code
+        assert "ta_two_largest" not in sys.modules
+
+
+class PerformanceTestCase(unittest.TestCase):
+
+    # Its ta_two_largest is not the interactive one.
+    def setUp(self):
+        sys.path.insert(0, os.path.join(EXAMPLES, 'performancetest'))
+
+    def tearDown(self):
+        sys.path.pop(0)
+        for name in ["ta_two_largest", "two_largest", "two_largest2"]:
+            sys.modules.pop(name, None)
+
+    def test_growth_exponent(self):
+        sizes = [100, 200, 400, 800]
+        assert abs(growth_exponent(sizes, [3e-6 * n for n in sizes]) - 1) < 1e-9
+        assert abs(growth_exponent(sizes, [2e-9 * n * n for n in sizes]) - 2) < 1e-9
+
+    def test_ladder(self):
+        assert PerformanceTest.ladder(100, 1600, 5) == [100, 200, 400, 800, 1600]
+
+    def run_test(self, student_module_name, sizes):
+        [test] = PerformanceTest.create_batch(
+                "ta_two_largest", student_module_name, "two_largest", 
+                "make_input", sizes, warmup = 0, repeats = 2)
+        return test.run()
+
+    def test_run(self):
+        sizes = PerformanceTest.ladder(1000, 8000, 4)
+        assert self.run_test("ta_two_largest", sizes).passedTest()
+        # two_largest2 takes quadratic time.
+        result = self.run_test("two_largest2", [100, 800])
+        assert isinstance(result, PerformanceDiscrepancy)
+        assert result.ratio > 10.0
+
+    def test_ta_crash(self):
+        # The TA's function needs at least two values.
+        result = self.run_test("two_largest", [1])
+        assert isinstance(result, ProgramCrash)
+        assert isinstance(result.exception, IndexError)
+
+
+class BenchmarkTestCase(unittest.TestCase):
+
+    def test_regressions(self):
+        baseline = {"a": {"relative": 1.0, "unit": "tests/s"},
+                    "b": {"relative": 1.0, "unit": "tests/s"}}
+        # Rates on a faster machine do not count, only relative ones.
+        results = {"a": {"rate": 850.0, "relative": 0.85, "unit": "tests/s"},
+                   "b": {"rate": 750.0, "relative": 0.75, "unit": "tests/s"},
+                   "c": {"rate": 1.0, "relative": 0.01, "unit": "tests/s"}}
+        assert compare_to_baseline(results, baseline, 0.2) == ["b"]
+
+    def test_baseline(self):
+        with open(BASELINE) as baseline_file:
+            baseline = json.load(baseline_file)
+        assert sorted(baseline) == sorted(name for (name, _) in BENCHMARKS)
+        assert all("rate" not in entry for entry in baseline.values())
+
+
+class PropertyTestCase(unittest.TestCase):
+
+    def test_shrink(self):
+        strategy = Lists(Integers(0, 1000))
+        (smallest, _) = shrink(strategy, [5, 700, 3, 901], 
+                               lambda value: sum(value) > 100)
+        assert smallest == [101]
+
+    def test_counterexample(self):
+        [test] = PropertyTest.create_batch("ta_digital_root", "digital_root2",
+                                           "digital_root", [Integers(1729, 1729)],
+                                           count = 10)
+        result = test.run()
+        assert not result.passedTest()
+        assert result.call == "digital_root(1729)"
+
+    def test_passes(self):
+        [test] = PropertyTest.create_batch("ta_digital_root", "digital_root",
+                                           "digital_root", [Integers(0, 10**6)],
+                                           count = 200)
+        assert test.run().passedTest()
+
+
+class GlobalStateTest(TestCase):
+    """Passes only if no earlier test has run in the same process."""
+    def run(self):
+        module = sys.modules[__name__]
+        module.tests_run = getattr(module, 'tests_run', 0) + 1
+        if module.tests_run > 1:
+            return ProgramCrash("state leaked")
+        return CorrectResult()
+
+
+class ForkTestCase(unittest.TestCase):
+
+    def test_isolated(self):
+        tests = [GlobalStateTest(False) for _ in range(3)]
+        results = [result for (_, result) in 
+                   Autograder(fork=True, echo=False)._results(tests)]
+        assert all(result.passedTest() for result in results)
+        assert not hasattr(sys.modules[__name__], 'tests_run')
+
+    def test_killed_child(self):
+        test = GlobalStateTest(False)
+        test.run = lambda: os._exit(3)
+        [(_, result)] = Autograder(fork=True, echo=False)._results([test])
+        assert isinstance(result, ProgramCrash)
+
+
+class InputSnapshotTestCase(unittest.TestCase):
+
+    def test_immutable_shared(self):
+        inputs = (12, "abc", (1.5, frozenset([2, 3])))
+        snapshot = InputSnapshot(inputs)
+        assert snapshot.copy() is inputs
+        assert not snapshot.mutated(inputs)
+
+    def test_mutable_copied(self):
+        inputs = ([3, 1, 2], {"a": [1]})
+        snapshot = InputSnapshot(inputs)
+        copy = snapshot.copy()
+        assert copy == inputs and copy[0] is not inputs[0]
+        assert not snapshot.mutated(copy)
+        copy[0].sort()
+        assert snapshot.mutated(copy)
+        assert snapshot.copy() == inputs
+
+    def test_mutation_noted(self):
+        class Test:
+            notes = []
+        def sort_in_place(values):
+            values.sort()
+            return values[0]
+        result = compare_functions(Test(), lambda values: min(values), 
+                                   sort_in_place, ([3, 1, 2],))
+        assert result.passedTest()
+        assert len(Test.notes) == 1
+        # The student is told, too.
+        assert result.warnings == ["NOTE: Your function changed the "
+                                   "arguments it was given."]
+        assert compare_functions(Test(), min, min, ([3, 1, 2],)).warnings == ()
+
+
+class ComparatorTestCase(unittest.TestCase):
+
+    def test_tolerance(self):
+        assert Close(abs_tol = 1e-6)([0.1 + 0.2, [1.0]], [0.3, [1.0000001]])
+        assert not Exact()([0.1 + 0.2], [0.3])
+
+    def test_huge_ints(self):
+        # Too large to be converted to floats for math.isclose.
+        assert Close().difference(10 ** 400, 10 ** 400) is None
+        assert Close().difference([10 ** 400], [10 ** 400 + 1]) is not None
+        assert not Close()(10 ** 400, 1.0)
+
+    def test_first_difference(self):
+        expected = list(range(100000))
+        received = list(expected)
+        received[76543] = -1
+        assert Exact().difference(expected, received) == ('value[76543]', 76543, -1)
+        assert Exact().difference([[1], [2, 3]], [[1], [2]]) == \
+            ('len(value[1])', 2, 1)
+
+    def test_element_discrepancy(self):
+        result = compare_functions(None, lambda: [1] * 10000 + [2], 
+                                   lambda: [1] * 10001, (), Exact())
+        assert isinstance(result, ElementDiscrepancy)
+        assert result.location == 'value[10000]'
+
+
+class StreamTestCase(unittest.TestCase):
+
+    def test_events(self):
+        tests = FunctionTest.create_batch("ta_digital_root", "digital_root", 
+                                          "digital_root", [(1729,)], [(5000,)])
+        stream = io.StringIO()
+        autograder = Autograder(echo=False, stream=stream)
+        autograder.run(tests)
+        events = [json.loads(line) for line in stream.getvalue().splitlines()]
+        assert [e["event"] for e in events if e["event"] != "internal"] == \
+            ["start", "test", "external", "external", "test", "external",
+             "external", "external", "summary"]
+        assert events[1]["test"] == "digital_root(1729)"
+        assert events[-1]["score_sum"] == 20
+        assert autograder.log["external_log"] == []
+
+
+class MetricsTestCase(unittest.TestCase):
+
+    def test_profile(self):
+        tests = FunctionTest.create_batch("ta_digital_root", "digital_root", 
+                                          "digital_root", [(1729,)], [(5000,)])
+        (fd, path) = tempfile.mkstemp(suffix = '.jsonl')
+        os.close(fd)
+        try:
+            autograder = Autograder(echo=False, metrics_file=path)
+            autograder.run(tests)
+            with open(path) as metrics_file:
+                exported = [json.loads(line) for line in metrics_file]
+        finally:
+            os.remove(path)
+        records = autograder.log["metrics"]
+        assert exported == records
+        # The inputs of private tests stay hidden, as in the log.
+        assert [r["test"] for r in records] == ["digital_root(1729)", None]
+        assert [r["private"] for r in records] == [False, True]
+        for record in records:
+            assert record["student"]["calls"] == 1
+            assert record["ta"]["calls"] == 1
+            assert record["total"]["wall"] >= record["student"]["wall"]
+
+    def test_off_by_default(self):
+        autograder = Autograder(echo=False)
+        autograder.run(FunctionTest.create_batch(
+                "ta_digital_root", "digital_root", "digital_root", [(13,)], []))
+        assert "metrics" not in autograder.log
+
+
+class RosterTestCase(unittest.TestCase):
+
+    def test_grade_roster(self):
+        with open(os.path.join(EXAMPLES, 'rostertest', 'spec.json')) as f:
+            spec = json.load(f)
+        out = io.StringIO()
+        count = grade_roster(os.path.join(EXAMPLES, 'functiontest', 
+                                          'ta_digital_root.py'), 
+                             spec, 
+                             os.path.join(EXAMPLES, 'rostertest', 'submissions'),
+                             out, workers=2)
+        records = [json.loads(line) for line in out.getvalue().splitlines()]
+        assert count == 3
+        assert [(r["student"], r["score_sum"]) for r in records] == \
+            [("alice", 20), ("bob", 0), ("carol", 0)]
+
+    def test_state(self):
+        with open(os.path.join(EXAMPLES, 'rostertest', 'spec.json')) as f:
+            spec = json.load(f)
+        directory = tempfile.mkdtemp()
+        try:
+            state = SQLiteState(os.path.join(directory, 'state.db'))
+            for attempt in [1, 2]:
+                out = io.StringIO()
+                grade_roster(os.path.join(EXAMPLES, 'functiontest', 
+                                          'ta_digital_root.py'), 
+                             spec, 
+                             os.path.join(EXAMPLES, 'rostertest', 'submissions'),
+                             out, workers=2, state=state, assignment="hw1")
+                records = [json.loads(line) 
+                           for line in out.getvalue().splitlines()]
+                assert [r["info"]["attempts"] for r in records] == [attempt] * 3
+            assert state.scores("hw1") == [("alice", 2, 20), ("bob", 2, 0), 
+                                           ("carol", 2, 0)]
+            state.close()
+        finally:
+            shutil.rmtree(directory)
+
+
+class ServiceTestCase(unittest.TestCase):
+
+    def setUp(self):
+        with open(os.path.join(EXAMPLES, 'rostertest', 'spec.json')) as f:
+            spec = json.load(f)
+        self.setup = make_setup(os.path.join(EXAMPLES, 'functiontest', 
+                                             'ta_digital_root.py'), spec)
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_client(self):
+        socket_path = os.path.join(self.directory, 'grader.sock')
+        submissions = os.path.join(EXAMPLES, 'rostertest', 'submissions')
+        async def session():
+            ready = asyncio.Event()
+            server = asyncio.ensure_future(
+                    serve(GradingService(self.setup, 2), socket_path,
+                          ready = ready.set))
+            await ready.wait()
+            loop = asyncio.get_running_loop()
+            records = await asyncio.gather(*[
+                    loop.run_in_executor(None, client.grade, socket_path, 
+                                         student, 
+                                         os.path.join(submissions, student))
+                    for student in ["alice", "bob", "carol"]])
+            server.cancel()
+            await asyncio.gather(server, return_exceptions = True)
+            return records
+        records = asyncio.run(session())
+        assert [(r["student"], r["score_sum"]) for r in records] == \
+            [("alice", 20), ("bob", 0), ("carol", 0)]
+
+    def test_bad_http(self):
+        socket_path = os.path.join(self.directory, 'grader.sock')
+        async def session():
+            ready = asyncio.Event()
+            server = asyncio.ensure_future(
+                    serve(GradingService(self.setup, 1), socket_path,
+                          ready = ready.set))
+            await ready.wait()
+            (reader, writer) = await asyncio.open_unix_connection(socket_path)
+            writer.write(b"POST /grade HTTP/1.1\r\n"
+                         b"Content-Length: many\r\n\r\n")
+            reply = await reader.read()
+            writer.close()
+            server.cancel()
+            await asyncio.gather(server, return_exceptions = True)
+            return reply
+        assert asyncio.run(session()).startswith(b"HTTP/1.1 400 ")
+
+
+class SchedulerTestCase(unittest.TestCase):
+
+    def schedule(self, scheduler, jobs):
+        async def session():
+            for (student, deadline) in jobs:
+                scheduler.put(Job(student, None, None, deadline))
+            order = []
+            while scheduler.qsize():
+                order.append((await scheduler.get()).student)
+            return order
+        return asyncio.run(session())
+
+    def test_fair(self):
+        scheduler = Scheduler(supersede = False)
+        order = self.schedule(scheduler, [("alice", None)] * 3 + 
+                                         [("bob", None), ("carol", None)])
+        assert order == ["alice", "bob", "carol", "alice", "alice"]
+        assert scheduler.metrics()["dispatched"] == 5
+
+    def test_supersede_and_deadlines(self):
+        scheduler = Scheduler()
+        soon = time.time() + 60
+        order = self.schedule(scheduler, [("alice", None), ("bob", None), 
+                                          ("alice", None), ("carol", soon),
+                                          ("dave", time.time() - 60)])
+        assert order == ["carol", "alice", "bob", "dave"]
+        assert scheduler.metrics()["superseded"] == 1
+
+    def test_deadlines_within_fair_share(self):
+        # Alice sets a deadline on every submission; bob sets none. Both
+        # resubmit as soon as theirs are graded.
+        scheduler = Scheduler()
+        soon = time.time() + 60
+        async def session():
+            scheduler.put(Job("alice", None, None, deadline = soon))
+            scheduler.put(Job("bob", None, None))
+            order = []
+            for _ in range(6):
+                student = (await scheduler.get()).student
+                order.append(student)
+                deadline = soon if student == "alice" else None
+                scheduler.put(Job(student, None, None, deadline = deadline))
+            return order
+        order = asyncio.run(session())
+        assert order == ["alice", "bob"] * 3
+
+    def test_full(self):
+        scheduler = Scheduler(capacity = 1)
+        scheduler.put(Job("alice", None, None))
+        scheduler.put(Job("alice", None, None))
+        self.assertRaises(QueueFull, scheduler.put, Job("bob", None, None))
+
+    def test_history(self):
+        # Alice had 20 submissions graded earlier in the day; then bob and
+        # carol keep resubmitting as soon as theirs are graded.
+        scheduler = Scheduler()
+        async def session():
+            for _ in range(20):
+                scheduler.put(Job("alice", None, None))
+                await scheduler.get()
+            for student in ["bob", "carol", "alice"]:
+                scheduler.put(Job(student, None, None))
+            order = []
+            for _ in range(10):
+                student = (await scheduler.get()).student
+                order.append(student)
+                if student != "alice":
+                    scheduler.put(Job(student, None, None))
+            return order
+        order = asyncio.run(session())
+        assert "alice" in order[:3]
+
+
+class _CountedList(list):
+    '''used internally: a list that counts how often it is pickled'''
+    pickles = 0
+
+    def __reduce_ex__(self, protocol):
+        _CountedList.pickles += 1
+        return (list, (list(self),))
+
+
+class SandboxTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        for (name, source) in [("ta_sandboxed", "def f(n):\n    return n\n"),
+                               ("ta_show", "def show(values):\n"
+                                           "    print(len(values))\n"),
+                               ("clearing", "def show(values):\n"
+                                            "    print(len(values))\n"
+                                            "    values.clear()\n"),
+                               ("sandboxed", "import sys\n"
+                                             "def f(n):\n"
+                                             "    if n == 1:\n"
+                                             "        sys.exit(3)\n"
+                                             "    return [0] * 10 ** n\n")]:
+            with open(os.path.join(self.directory, name + '.py'), 'w') as f:
+                f.write(source)
+        sys.path.insert(0, self.directory)
+        self.pool = SandboxPool(1, Limits(memory = 64 * 1024 * 1024))
+
+    def tearDown(self):
+        self.pool.terminate()
+        sys.path.remove(self.directory)
+        shutil.rmtree(self.directory)
+        # Forked tests import the student's module in this process.
+        sys.modules.pop("sandboxed", None)
+
+    def grade(self, n):
+        tests = FunctionTest.create_batch("ta_sandboxed", "sandboxed", "f",
+                                          [(n,)], [])
+        return list(Autograder(echo=False, sandbox=self.pool)._results(tests))
+
+    def test_outcomes(self):
+        [(_, result)] = self.grade(1)
+        assert isinstance(result, WorkerCrash) and result.exitcode == 3
+        [(_, result)] = self.grade(9)
+        assert isinstance(result, MemoryLimitExceeded)
+        assert result.limit == 64 * 1024 * 1024
+        # The pool carries on after both.
+        [(_, result)] = self.grade(0)
+        assert not result.passedTest()
+        assert "sandboxed" not in sys.modules
+
+    def test_not_replayed(self):
+        cache = ReplayCache(os.path.join(self.directory, 'replay'))
+        for settings in [{"sandbox": self.pool}, {"fork": True}]:
+            for _ in range(2):
+                tests = FunctionTest.create_batch("ta_sandboxed", "sandboxed",
+                                                  "f", [(1,)], [])
+                autograder = Autograder(echo=False, replay=cache, **settings)
+                autograder.run(tests)
+                assert autograder.log["score_sum"] == 0
+        # The process that ran the test died, which may not happen again.
+        assert cache.hits == 0
+
+    def test_transport(self):
+        transport = Transport()
+        inputs = [(list(range(100000)),), ([1, 2],)]
+        try:
+            for _ in range(2):
+                tests = FunctionTest.create_batch("ta_sandboxed", "ta_sandboxed",
+                                                  "f", inputs, [])
+                assert isinstance(transport.share(tests[0]).test_input,
+                                  SharedValue)
+                assert transport.share(tests[1]) is tests[1]
+                pairs = list(Autograder(echo=False, sandbox=self.pool,
+                                        transport=transport)._results(tests))
+                assert all(result.passedTest() for (_, result) in pairs)
+            # Written once, for both submissions.
+            assert transport.shared == 1
+            assert len(os.listdir(transport.directory)) == 1
+            # What one submission does to its input does not reach the next
+            # (FunctionStdoutTest hands the input over as it is, and with
+            # the TA's output compiled in, it is not run again).
+            for student in ["clearing", "ta_show"]:
+                tests = FunctionStdoutTest.create_batch(
+                        "ta_show", student, "show", inputs[:1], [])
+                tests[0].compile()
+                [(_, result)] = Autograder(echo=False, sandbox=self.pool, 
+                                           transport=transport)._results(tests)
+                assert result.passedTest()
+        finally:
+            transport.close()
+        assert not os.path.exists(transport.directory)
+
+    def test_transport_pickles_once(self):
+        transport = Transport()
+        values = _CountedList(range(100000))
+        _CountedList.pickles = 0
+        try:
+            for _ in range(3):
+                # Fresh tests and argument tuples, as for each submission.
+                tests = FunctionTest.create_batch("ta_sandboxed", "ta_sandboxed",
+                                                  "f", [(values,)], [])
+                assert isinstance(transport.share(tests[0]).test_input,
+                                  SharedValue)
+            assert _CountedList.pickles == 1
+            values.append(1)
+            transport.share(tests[0])
+            assert _CountedList.pickles == 2 and transport.shared == 2
+        finally:
+            transport.close()
+
+
+class StateTestCase(unittest.TestCase):
+
+    def test_attempts(self):
+        directory = tempfile.mkdtemp()
+        try:
+            state = SQLiteState(os.path.join(directory, 'state.db'))
+            assert state.load("alice", "hw1")["attempts"] == 1
+            state.record("alice", "hw1", 15)
+            state.record_many([("alice", "hw1", 10), ("alice", "hw2", 20)])
+            assert state.load("alice", "hw1") == {"attempts": 3, 
+                                                  "prevscore": 15, 
+                                                  "timedelta": 0}
+            assert state.history("alice") == [("hw1", 2, 15), ("hw2", 1, 20)]
+            state.close()
+        finally:
+            shutil.rmtree(directory)
+
+
+class ResultCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.module_path = os.path.join(self.directory, 'ta_cached.py')
+        self.write_module('def f(n):\n    return n + 1\n')
+        sys.path.insert(0, self.directory)
+        self.cache = ResultCache(os.path.join(self.directory, 'cache'))
+
+    def tearDown(self):
+        sys.path.remove(self.directory)
+        shutil.rmtree(self.directory)
+
+    def write_module(self, source):
+        with open(self.module_path, 'w') as f:
+            f.write(source)
+
+    def test_hit(self):
+        calls = []
+        compute = lambda: calls.append(1) or 42
+        assert self.cache.get('ta_cached', 'f', (1,), compute) == 42
+        assert self.cache.get('ta_cached', 'f', (1,), compute) == 42
+        assert self.cache.get('ta_cached', 'f', (2,), compute) == 42
+        assert len(calls) == 2
+
+    def test_invalidated_by_edit(self):
+        key = self.cache.key('ta_cached', 'f', (1,))
+        self.write_module('def f(n):\n    return n + 2\n')
+        assert self.cache.key('ta_cached', 'f', (1,)) != key
+
+    def test_eviction(self):
+        cache = ResultCache(os.path.join(self.directory, 'small'), 
+                            max_bytes = 2000)
+        for i in range(20):
+            cache.get('ta_cached', 'f', (i,), lambda: 'x' * 200)
+        assert cache._total_size() <= 2000
+
+    def test_memory(self):
+        cache = MemoryCache(max_bytes = 2000)
+        calls = []
+        compute = lambda: calls.append(1) or ['x']
+        first = cache.get('ta_cached', 'f', (1,), compute)
+        second = cache.get('ta_cached', 'f', (1,), compute)
+        assert first == second == ['x'] and first is not second
+        assert len(calls) == 1 and cache.hits == 1
+        for i in range(20):
+            cache.get('ta_cached', 'f', (i,), lambda: 'x' * 200)
+        assert cache._size <= 2000
+
+    def test_memory_by_default(self):
+        setup = make_setup(self.module_path, {"test": "FunctionTest"})
+        assert isinstance(setup["cache"], MemoryCache)
+
+
+class ReplayCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = ReplayCache(self.directory)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_ast_hash_ignores_layout(self):
+        paths = [os.path.join(self.directory, name) for name in 'ab']
+        for (path, source) in zip(paths, ['def f(n):\n    return n+1\n',
+                                          '# f\ndef f(n):  return (n + 1)\n']):
+            with open(path, 'w') as f:
+                f.write(source)
+        assert ast_hash(paths[0]) == ast_hash(paths[1])
+
+    def test_ast_hash_follows_packages(self):
+        files = {"main.py": "from pkg import helper\nimport pkg.sub.deep\n",
+                 "pkg/__init__.py": "",
+                 "pkg/helper.py": "from . import util\n",
+                 "pkg/util.py": "",
+                 "pkg/sub/deep.py": ""}
+        for (name, source) in files.items():
+            path = os.path.join(self.directory, name)
+            os.makedirs(os.path.dirname(path), exist_ok = True)
+            with open(path, 'w') as f:
+                f.write(source)
+        main = os.path.join(self.directory, "main.py")
+        hashes = [ast_hash(main)]
+        for name in ["pkg/__init__.py", "pkg/helper.py", "pkg/util.py", 
+                     "pkg/sub/deep.py"]:
+            with open(os.path.join(self.directory, name), 'a') as f:
+                f.write("x = 1\n")
+            hashes.append(ast_hash(main))
+        assert len(set(hashes)) == len(hashes)
+
+    def test_replay(self):
+        tests = FunctionTest.create_batch("ta_digital_root", "digital_root", 
+                                          "digital_root", [(1729,)], [(5000,)])
+        first = Autograder(echo=False, replay=self.cache)
+        first.run(tests)
+        second = Autograder(echo=False, replay=self.cache)
+        second.run(tests)
+        assert (self.cache.hits, self.cache.misses) == (1, 1)
+        assert second.log["external_log"] == first.log["external_log"]
+        assert second.log["score_sum"] == first.log["score_sum"] == 20
+
+
+class BundleTestCase(unittest.TestCase):
+
+    def test_round_trip(self):
+        tests = FunctionTest.create_batch("ta_digital_root", "digital_root", 
+                                          "digital_root", [(1729,)], [(356,)])
+        (fd, path) = tempfile.mkstemp(suffix = '.bundle')
+        os.close(fd)
+        try:
+            compile_bundle(tests, path)
+            loaded = load_bundle(path, "digital_root2")
+        finally:
+            os.remove(path)
+        assert [t.golden["result"] for t in loaded] == [1, 5]
+        assert [t.student_module_name for t in loaded] == ["digital_root2"] * 2
+        # The TA module is never imported by a loaded test.
+        for test in loaded:
+            test.ta_module_name = "no_such_module"
+        assert not loaded[0].run().passedTest()
+        assert loaded[1].run().passedTest()
+
+
+class InterfaceCheckTestCase(unittest.TestCase):
+
+    def test_shared_by_batch(self):
+        tests = FunctionTest.create_batch("ta_digital_root", "digital_root", 
+                                          "digital_root", [(1729,), (356,)], 
+                                          [(5000,)])
+        notes = [_run_test(test)[1] for test in tests]
+        checks = [test._check_interface() for test in tests]
+        assert all(check is checks[0] for check in checks)
+        assert all(n[-1].endswith("(warm).") for n in notes[1:])
+
+
+class FingerprintTestCase(unittest.TestCase):
+
+    def module(self, name, source):
+        module = types.ModuleType(name)
+        exec(source, module.__dict__)
+        return module
+
+    def test_cached_by_source(self):
+        import ta_digital_root
+        assert fingerprint(ta_digital_root) is fingerprint(ta_digital_root)
+
+    def test_keyword_only(self):
+        ta = self.module("ta", "def f(a, *, key, reverse=False): pass")
+        hw = self.module("hw", "def f(a, *, key): pass")
+        assert summarize(ta)["signatures"]["f"] == \
+            {"args": ["a"], "defaults": 0, "kwonly": ["key", "reverse"],
+             "kwdefaults": ["reverse"], "varargs": False, "varkw": False}
+        assert not compare(ta, hw).passedTest()
+        assert compare(hw, ta).passedTest()
+
+    def test_aliases(self):
+        ta = self.module("ta", "def square(x): return x * x")
+        for source in ["square = lambda x: x * x",
+                       "def _impl(x): return x * x\nsquare = _impl"]:
+            hw = self.module("hw", source)
+            assert "square" in summarize(hw)["functions"]
+            assert compare(ta, hw).passedTest()
+
+    def test_bounded(self):
+        import sanity
+        import ta_digital_root
+        directory = tempfile.mkdtemp()
+        try:
+            fingerprint(ta_digital_root)
+            for i in range(sanity.FINGERPRINT_ENTRIES + 10):
+                module = self.module("hw", "def f(x): return {}".format(i))
+                module.__file__ = os.path.join(directory, "hw{}.py".format(i))
+                with open(module.__file__, 'w') as source:
+                    source.write("def f(x): return {}\n".format(i))
+                fingerprint(module)
+                # The TA's fingerprint is used for every submission.
+                fingerprint(ta_digital_root)
+            assert len(sanity._fingerprints) <= sanity.FINGERPRINT_ENTRIES
+            assert len(sanity._source_hashes) <= sanity.FINGERPRINT_ENTRIES
+            assert "ta_digital_root" in [name for (name, _) in sanity._fingerprints]
+        finally:
+            shutil.rmtree(directory)
+
+    def test_warmed_by_setup(self):
+        import sanity
+        sanity._fingerprints.clear()
+        make_setup(os.path.join(EXAMPLES, 'functiontest', 'ta_digital_root.py'),
+                   {"test": "FunctionTest"})
+        assert "ta_digital_root" in [name for (name, _) in sanity._fingerprints]
+
+
+class OutputCaptureTestCase(unittest.TestCase):
+
+    def test_spill(self):
+        capture = OutputCapture(memory_limit = 10, spill = True, limit = 100)
+        capture.write('a' * 8)
+        assert not capture.spilled
+        capture.write('b' * 8)
+        assert capture.spilled
+        assert capture.getvalue() == 'a' * 8 + 'b' * 8
+        capture.close()
+
+    def test_limit(self):
+        capture = OutputCapture(memory_limit = 10, spill = False)
+        capture.write('a' * 10)
+        self.assertRaises(OutputLimitError, capture.write, 'b')
+        assert capture.exceeded
+
+    def test_endless_printing(self):
+        def endless():
+            while True:
+                print('spam')
+        import util
+        limit = util.OUTPUT_LIMIT
+        util.OUTPUT_LIMIT = 1000
+        try:
+            self.assertRaises(OutputLimitError, call_function, endless, ())
+        finally:
+            util.OUTPUT_LIMIT = limit
+
+    def test_endless_printing_caught(self):
+        prints = []
+        def endless():
+            # Bounded, so that the test ends even if the error is swallowed.
+            while len(prints) < 10000:
+                prints.append(1)
+                try:
+                    print('spam')
+                except Exception:
+                    pass
+        import util
+        limit = util.OUTPUT_LIMIT
+        util.OUTPUT_LIMIT = 1000
+        try:
+            self.assertRaises(OutputLimitError, call_function, endless, ())
+            assert len(prints) < 10000
+        finally:
+            util.OUTPUT_LIMIT = limit
+
+
+class TimeLimitTestCase(unittest.TestCase):
+
+    def endless(self):
+        while True:
+            pass
+
+    def test_wall_clock(self):
+        limit = TimeLimit(seconds = 0.1)
+        with limit:
+            self.assertRaises(TimeLimitError, self.endless)
+        assert limit.expired == ("wall-clock", 0.1)
+
+    def test_cpu(self):
+        limit = TimeLimit(cpu_seconds = 0.1)
+        with limit:
+            self.assertRaises(TimeLimitError, self.endless)
+        assert limit.expired == ("CPU", 0.1)
+
+    def test_caught(self):
+        # Compiled as if from a student's module, which catches everything.
+        namespace = {}
+        exec(compile("def stubborn():\n"
+                     "    while True:\n"
+                     "        try:\n"
+                     "            while True:\n"
+                     "                pass\n"
+                     "        except:\n"
+                     "            pass\n", "<student>", "exec"), namespace)
+        limit = TimeLimit(seconds = 0.1)
+        start = time.time()
+        with limit:
+            self.assertRaises(TimeLimitError, namespace["stubborn"])
+        assert limit.expired == ("wall-clock", 0.1)
+        assert time.time() - start < 5
+        assert sys.gettrace() is None and sys.getprofile() is None
+
+    def test_not_expired(self):
+        with TimeLimit(seconds = 5, cpu_seconds = 5) as limit:
+            pass
+        assert limit.expired is None
+
  
 if __name__ == "__main__":
     unittest.main() # run all tests
\ No newline at end of file
@@ -1,73 +1,531 @@
 import io
+import math
+import os
+import pickle
+import signal
 import sys
+import sysconfig
+import tempfile
+import threading
 from copy import deepcopy
+from itertools import zip_longest
 from result import LineDiscrepancy, CorrectResult, ReturnValueDiscrepancy
-from result import ProgramCrash
+from result import ProgramCrash, ElementDiscrepancy, OutputDiff
+from diff import diff
 
-def compare_outputs(student_output, ta_output, line_eq = lambda x, y: x==y):
+# How much of a file-like output compare_outputs reads at a time.
+CHUNK_SIZE = 64 * 1024
+
+# How many characters of captured output are kept in memory, whether more
+# output spills to a temporary file, and how many characters are allowed
+# in all (None for no limit). See OutputCapture.
+OUTPUT_MEMORY_LIMIT = 1024 * 1024
+OUTPUT_SPILL = True
+OUTPUT_LIMIT = 64 * 1024 * 1024
+
+def compare_outputs(student_output, ta_output, line_eq = lambda x, y: x==y,
+                    full_diff = False, line_key = None):
     """
     Compares two multiline outputs until a discrepancy is found. The
     function line_eq tells compare_outputs when two lines are equivalent.
     
+    Each output can be a string, a file-like object or an iterable of
+    strings (chunks of the output, not necessarily whole lines). Both are
+    read line by line, and reading stops at the first discrepancy, so
+    large outputs never need to be held in memory.
+    
     If no discrepancy is found, then a CorrectResult object is returned.
     
+    With full_diff, the outputs are read to the end after the first
+    discrepancy, and every place where they differ is reported in an 
+    OutputDiff (see diff.py). The diff compares lines by line_key(line),
+    which should agree with line_eq (by default, lines must be equal).
+    If they differ in too many places to list, only the first discrepancy
+    is reported, as without full_diff.
+    
     """    
-    student_lines = [line.strip() for line in student_output.split('\n')]
-    ta_lines = [line.strip() for line in ta_output.split('\n')]
-    for (i, (student_line, ta_line)) in enumerate(zip(student_lines, ta_lines)):
-        if not line_eq(student_line, ta_line):
-            return LineDiscrepancy(i+1, ta_line, student_line)    
-    if len(student_lines) > len(ta_lines):
-        return LineDiscrepancy(len(ta_lines) + 1,
-                               None,
-                               student_lines[len(ta_lines)])
-    elif len(student_lines) < len(ta_lines):
-        return LineDiscrepancy(len(student_lines) + 1, 
-                               ta_lines[len(student_lines)],
-                               None)
+    student_lines = iter_lines(student_output)
+    ta_lines = iter_lines(ta_output)
+    for (i, (student_line, ta_line)) in enumerate(
+            zip_longest(student_lines, ta_lines)):
+        if student_line is not None:
+            student_line = student_line.strip()
+        if ta_line is not None:
+            ta_line = ta_line.strip()
+        if (ta_line is not None and student_line is not None 
+                and line_eq(student_line, ta_line)):
+            continue
+        if full_diff:
+            return _output_diff(i, student_line, ta_line, student_lines, 
+                                ta_lines, line_key)
+        return LineDiscrepancy(i+1, ta_line, student_line)
     return CorrectResult()
 
 
+def _output_diff(i, student_line, ta_line, student_lines, ta_lines, 
+                 line_key = None):
+    """
+    Diffs what is left of two outputs, from line i (the first discrepancy,
+    between student_line and ta_line) on, and returns an OutputDiff (or a
+    LineDiscrepancy, if the diff gave up).
+    
+    """
+    student_rest = [] if student_line is None else [student_line]
+    student_rest += [line.strip() for line in student_lines]
+    ta_rest = [] if ta_line is None else [ta_line]
+    ta_rest += [line.strip() for line in ta_lines]
+    if line_key is None:
+        hunks = diff(ta_rest, student_rest)
+    else:
+        hunks = diff([line_key(line) for line in ta_rest], 
+                     [line_key(line) for line in student_rest])
+    if hunks is None:
+        # Too many differences to list.
+        return LineDiscrepancy(i+1, ta_line, student_line)
+    if not hunks:
+        # line_key disagrees with line_eq.
+        return OutputDiff([(i+1, ta_rest[:1], i+1, student_rest[:1])])
+    return OutputDiff([(i + start + 1, ta_rest[start:end], 
+                        i + student_start + 1, 
+                        student_rest[student_start:student_end])
+                       for (start, end, student_start, student_end) in hunks])
+
 
-def call_function(func, args):
+def iter_lines(output):
     """
-    Calls a function on a list of arguments and captures any output to
-    stdout.
+    Generates the lines of an output (a string, a file-like object or an
+    iterable of strings), exactly as output.split('\\n') would list them.
     
-    """   
-    new_stdout = io.StringIO()    
+    """
+    parts = []
+    for chunk in _iter_chunks(output):
+        start = 0
+        end = chunk.find('\n')
+        while end >= 0:
+            parts.append(chunk[start:end])
+            yield ''.join(parts)
+            parts = []
+            start = end + 1
+            end = chunk.find('\n', start)
+        parts.append(chunk[start:])
+    yield ''.join(parts)
+
+
+def _iter_chunks(output):
+    if isinstance(output, str):
+        yield output
+    elif hasattr(output, 'read'):
+        chunk = output.read(CHUNK_SIZE)
+        while chunk:
+            yield chunk
+            chunk = output.read(CHUNK_SIZE)
+    else:
+        for chunk in output:
+            yield chunk
+
+
+
+class OutputLimitError(BaseException):
+    """
+    Raised when code printed more output than an OutputCapture allows. Like
+    TimeLimitError, it derives from BaseException so that an "except
+    Exception" around a print in a student's loop does not swallow it.
+
+    """
+    def __init__(self, limit):
+        BaseException.__init__(self, 
+                           "Output exceeded {} characters.".format(limit))
+        self.limit = limit
+
+
+class OutputCapture(io.TextIOBase):
+    """
+    An OutputCapture stands in for stdout while a program submission runs.
+    
+    Up to memory_limit characters of output are kept in memory. Past that,
+    the output spills to a temporary file if spill is True; otherwise,
+    the memory limit is also the overall limit. Output beyond the overall
+    limit (if there is one) is discarded, the capture is marked as
+    exceeded, and the write raises an OutputLimitError to stop the code
+    that is printing. The defaults come from OUTPUT_MEMORY_LIMIT, 
+    OUTPUT_SPILL and OUTPUT_LIMIT.
+    
+    """
+    def __init__(self, memory_limit = None, spill = None, limit = None):
+        io.TextIOBase.__init__(self)
+        self.memory_limit = (OUTPUT_MEMORY_LIMIT if memory_limit is None 
+                             else memory_limit)
+        self.spill = OUTPUT_SPILL if spill is None else spill
+        if not self.spill:
+            self.limit = self.memory_limit
+        else:
+            self.limit = OUTPUT_LIMIT if limit is None else limit
+        self.size = 0
+        self.exceeded = False
+        self._buffer = io.StringIO()
+        self.spilled = False
+
+    def writable(self):
+        return True
+
+    def write(self, text):
+        if self.exceeded or (self.limit is not None 
+                             and self.size + len(text) > self.limit):
+            self.exceeded = True
+            raise OutputLimitError(self.limit)
+        if not self.spilled and self.size + len(text) > self.memory_limit:
+            spill_file = tempfile.TemporaryFile('w+', encoding = 'utf-8')
+            spill_file.write(self._buffer.getvalue())
+            self._buffer = spill_file
+            self.spilled = True
+        self._buffer.write(text)
+        self.size += len(text)
+        return len(text)
+
+    def getvalue(self):
+        """Returns everything captured so far, as a string."""
+        return self.reader().read()
+
+    def reader(self):
+        """
+        Returns a file-like object from which the captured output can be
+        read (e.g. by compare_outputs) without copying it first.
+        
+        """
+        self._buffer.flush()
+        self._buffer.seek(0)
+        return self._buffer
+
+    def close(self):
+        if not self.closed:
+            self._buffer.close()
+        io.TextIOBase.close(self)
+
+
+def capture_call(func, args, capture):
+    """
+    Calls a function on a list of arguments, with stdout redirected to an 
+    OutputCapture. Returns (result, finished), where finished is False if
+    the call raised an exception. Raises an OutputLimitError if the call
+    printed more than the capture allows (and lets a MemoryError through).
+    
+    """
     try:
-        sys.stdout = new_stdout
+        sys.stdout = capture
         result = func(*args)
-        output = new_stdout.getvalue()
+        finished = True
+    except MemoryError:
+        # Reported as a MemoryLimitExceeded (see autograder._run_test).
+        raise
     except:
         result = None
-        output = None
+        finished = False
     finally:
         # Restore stdout.
         sys.stdout = sys.__stdout__  
+    if capture.exceeded:
+        raise OutputLimitError(capture.limit)
+    return (result, finished)
+
+
+def call_function(func, args):
+    """
+    Calls a function on a list of arguments and captures any output to
+    stdout. Raises an OutputLimitError if there is too much output.
+    
+    """   
+    capture = OutputCapture()
+    try:
+        (result, finished) = capture_call(func, args, capture)
+        output = capture.getvalue() if finished else None
+    finally:
+        capture.close()
     return (result, output)
 
-def compare_functions(self, ta_func, hw_func, inputs, the_same = lambda x,y: x == y):
+class TimeLimitError(BaseException):
+    """
+    Raised inside code that has run past its TimeLimit. It derives from
+    BaseException so that an "except Exception" in a student's loop does 
+    not swallow it.
+    
+    """
+    def __init__(self, kind, limit):
+        BaseException.__init__(self, 
+                               "Exceeded the {} time limit of {}s.".format(
+                                       kind, limit))
+        self.kind = kind
+        self.limit = limit
+
+
+# How often (in seconds) an expired TimeLimit raises its error again.
+TIME_LIMIT_REPEAT = 0.1
+
+# The directory of the grader's own modules, and those of Python's library:
+# a TimeLimit never interrupts their code line by line (see TimeLimit._trap),
+# so that their cleanups (e.g. restoring sys.stdout) still run.
+GRADER_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+LIBRARY_DIRECTORIES = tuple(sorted({sysconfig.get_paths()[name] 
+                                    for name in ('stdlib', 'platstdlib')}))
+
+def _is_trusted(filename):
+    '''used internally: whether code is the grader's, or Python's'''
+    return (os.path.dirname(filename) == GRADER_DIRECTORY or 
+            filename.startswith(LIBRARY_DIRECTORIES))
+
+
+class TimeLimit:
+    """
+    A TimeLimit is a context manager that interrupts the code it wraps
+    (by raising a TimeLimitError) once it has used up seconds of wall-clock
+    time or cpu_seconds of CPU time. Either limit can be None.
+    
+    The limits are enforced with interval timers and signals, so they only
+    apply in the main thread (elsewhere, the code runs unlimited). Since 
+    the code could still catch the TimeLimitError, whether a limit was hit
+    should be checked with expired (a (kind, limit) pair, or None) rather
+    than by catching the exception.
+    
+    Code that catches the error and carries on (say, a bare except in an
+    endless loop) gets it again every TIME_LIMIT_REPEAT seconds, and from
+    then on at every line it runs outside the grader's own modules (and
+    Python's library), until it has let go.
+    
+    """
+    def __init__(self, seconds = None, cpu_seconds = None):
+        self.seconds = seconds
+        self.cpu_seconds = cpu_seconds
+        self.expired = None
+        self._active = False
+        self._handlers = []
+        self._previous_hooks = None
+
+    def _timers(self):
+        if threading.current_thread() is not threading.main_thread():
+            return []
+        timers = []
+        if self.seconds is not None:
+            timers.append((signal.ITIMER_REAL, signal.SIGALRM, 
+                           "wall-clock", self.seconds))
+        if self.cpu_seconds is not None:
+            timers.append((signal.ITIMER_PROF, signal.SIGPROF, 
+                           "CPU", self.cpu_seconds))
+        return timers
+
+    def __enter__(self):
+        self.expired = None
+        self._active = True
+        for (timer, signum, kind, limit) in self._timers():
+            handler = self._handler(kind, limit)
+            self._handlers.append((timer, signum, 
+                                   signal.signal(signum, handler)))
+            signal.setitimer(timer, max(limit, 0.001), TIME_LIMIT_REPEAT)
+        return self
+
+    def _handler(self, kind, limit):
+        def expire(signum, frame):
+            if not self._active:
+                return
+            if self.expired is None:
+                self.expired = (kind, limit)
+            else:
+                # The code caught the last one.
+                self._trap(frame)
+            raise TimeLimitError(*self.expired)
+        return expire
+
+    def _trap(self, frame):
+        '''used internally: raises the error at every line of the code'''
+        # Raising from a trace function turns tracing off, so the profile
+        # function (which never raises) sets it again as the error leaves
+        # each frame, and the trap is set again each time the timer fires.
+        if self._previous_hooks is None:
+            self._previous_hooks = (sys.gettrace(), sys.getprofile())
+        while frame is not None:
+            frame.f_trace = self._trace
+            frame = frame.f_back
+        sys.settrace(self._trace)
+        sys.setprofile(self._profile)
+
+    def _trace(self, frame, event, arg):
+        '''used internally: the trace function of _trap'''
+        if not self._active or frame.f_code is TimeLimit.__exit__.__code__:
+            return None
+        if event == 'line' and not _is_trusted(frame.f_code.co_filename):
+            raise TimeLimitError(*self.expired)
+        return self._trace
+
+    def _profile(self, frame, event, arg):
+        '''used internally: the profile function of _trap'''
+        if self._active and event == 'return' and frame.f_back is not None:
+            frame.f_back.f_trace = self._trace
+            if sys.gettrace() != self._trace:
+                sys.settrace(self._trace)
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._active = False
+        for (timer, signum, previous) in self._handlers:
+            signal.setitimer(timer, 0)
+            signal.signal(signum, previous)
+        self._handlers = []
+        if self._previous_hooks is not None:
+            (trace, profile) = self._previous_hooks
+            sys.settrace(trace)
+            sys.setprofile(profile)
+            self._previous_hooks = None
+        return False
+
+
+# Values of these types cannot be changed, so they need not be copied.
+IMMUTABLE_TYPES = (int, float, complex, bool, str, bytes, type(None), range)
+
+def is_immutable(value):
+    """
+    Returns whether a value can safely be shared instead of copied: an
+    instance of one of the IMMUTABLE_TYPES, or a tuple or frozenset of
+    such values.
+    
+    """
+    if type(value) in IMMUTABLE_TYPES:
+        return True
+    if type(value) in (tuple, frozenset):
+        return all(is_immutable(item) for item in value)
+    return False
+
+
+def copy_inputs(inputs):
+    """Returns a copy of the inputs, unless they are immutable."""
+    if is_immutable(inputs):
+        return inputs
+    return deepcopy(inputs)
+
+
+class InputSnapshot:
+    """
+    An InputSnapshot hands out copies of the inputs of a test, so that the
+    functions under test cannot change them for each other. Immutable 
+    inputs are handed out as they are. Other inputs are pickled once, when
+    the snapshot is taken, and each copy is unpickled from that, which is
+    much cheaper than a deepcopy of a large nested structure. (Inputs that
+    cannot be pickled are deep-copied instead.)
+    
+    """
+    def __init__(self, inputs):
+        self.inputs = inputs
+        self.immutable = is_immutable(inputs)
+        self._pickled = None
+        if not self.immutable:
+            try:
+                self._pickled = pickle.dumps(inputs, pickle.HIGHEST_PROTOCOL)
+            except Exception:
+                self.inputs = deepcopy(inputs)
+
+    @staticmethod
+    def unpickle(data):
+        """
+        Returns the InputSnapshot of the inputs pickled in data, which it
+        keeps (rather than pickling them again), so data may be any buffer,
+        such as a view of a memory-mapped file (see transport.py).
+        
+        """
+        snapshot = InputSnapshot.__new__(InputSnapshot)
+        snapshot.inputs = pickle.loads(data)
+        snapshot.immutable = is_immutable(snapshot.inputs)
+        snapshot._pickled = None if snapshot.immutable else data
+        return snapshot
+
+    def copy(self):
+        """Returns a copy of the inputs (or the inputs, if immutable)."""
+        if self.immutable:
+            return self.inputs
+        if self._pickled is not None:
+            return pickle.loads(self._pickled)
+        return deepcopy(self.inputs)
+
+    def mutated(self, inputs):
+        """
+        Returns whether a copy that was handed out differs from the 
+        snapshot, i.e. whether the code it was handed to changed it.
+        
+        """
+        if self.immutable:
+            return False
+        if self._pickled is not None:
+            try:
+                if pickle.dumps(inputs, pickle.HIGHEST_PROTOCOL) == self._pickled:
+                    return False
+            except Exception:
+                pass
+        try:
+            return bool(inputs != self.copy())
+        except Exception:
+            return True
+
+
+def compare_functions(self, ta_func, hw_func, inputs, the_same = lambda x,y: x == y,
+                      snapshot = None, copy_ta_inputs = True):
     """
     Compares the return values of two functions on the same input arguments.
     
     If they are the same (according to a provided "the_same" predicate),
     then a CorrectResult object is returned. Otherwise, a ReturnValueDiscrepancy
-    is returned.
+    is returned. If the_same is a comparators.Comparator, a difference in 
+    part of the return values is reported as an ElementDiscrepancy instead.
+    
+    Each function gets its own copy of the inputs, from an InputSnapshot 
+    (which is taken here, unless one is given). If ta_func makes its own 
+    copy when it needs one, copy_ta_inputs can be False. If hw_func changes
+    its copy of the inputs, the result carries a warning saying so (see
+    TestResult.warn), and a note is added to self.notes (if self has notes).
     
     """
+    mutated = False
     try:
-        i_copy1 = deepcopy(inputs)
-        i_copy2 = deepcopy(inputs)
+        if snapshot is None:
+            snapshot = InputSnapshot(inputs)
+        i_copy1 = snapshot.copy()
         hw_func_result = hw_func(*i_copy1)
+        mutated = snapshot.mutated(i_copy1)
+        i_copy2 = snapshot.copy() if copy_ta_inputs else inputs
         ta_func_result = ta_func(*i_copy2)
-        if the_same(hw_func_result, ta_func_result):
-            return CorrectResult()
+        if hasattr(the_same, 'difference'):
+            found = the_same.difference(ta_func_result, hw_func_result)
+            if found is None:
+                result = CorrectResult()
+            else:
+                (location, expected_part, student_part) = found
+                if location != 'value':
+                    result = ElementDiscrepancy(location, expected_part, 
+                                                student_part)
+                else:
+                    result = ReturnValueDiscrepancy(ta_func_result, 
+                                                    hw_func_result)
+        elif the_same(hw_func_result, ta_func_result):
+            result = CorrectResult()
         else:
-            return ReturnValueDiscrepancy(ta_func_result, hw_func_result)                           
+            result = ReturnValueDiscrepancy(ta_func_result, hw_func_result)
     except Exception as e:        
-        return ProgramCrash(e)
+        result = ProgramCrash(e)
+    if mutated:
+        result.warn("NOTE: Your function changed the arguments it was given.")
+        if hasattr(self, 'notes'):
+            self.notes.append("{} changed its arguments.".format(str(self)))
+    return result
+
+
+def growth_exponent(sizes, times):
+    """
+    Fits a growth curve time = c * size^k to measurements (by least squares
+    on a log-log scale), and returns the exponent k.
+    
+    """
+    xs = [math.log(size) for size in sizes]
+    ys = [math.log(max(time, 1e-12)) for time in times]
+    x_mean = sum(xs) / len(xs)
+    y_mean = sum(ys) / len(ys)
+    spread = sum((x - x_mean) ** 2 for x in xs)
+    if spread == 0:
+        return 0.0
+    return sum((x - x_mean) * (y - y_mean) for (x, y) in zip(xs, ys)) / spread
 
 
 def argument_signature(arglist):